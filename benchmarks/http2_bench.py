@@ -0,0 +1,114 @@
+import argparse
+import json
+import platform
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "thsr_ticket"))
+sys.path.insert(0, str(ROOT / "benchmarks"))
+
+from controller.form_data import read_form  # noqa: E402
+from html_parser import ParsedPage  # noqa: E402
+from irs_standin import StandInIRS, booking_site  # noqa: E402
+from parser_bench import percentile  # noqa: E402
+from remote.http2_adapter import http2_available  # noqa: E402
+from remote.http_request import TRANSPORTS, HTTPRequest  # noqa: E402
+
+SCHEMA_VERSION = 1
+
+
+def run_attempt(client: HTTPRequest) -> float:
+    # The HTTP exchanges of one booking attempt, without OCR or train choice.
+    start = time.perf_counter()
+    client.reset_session()
+    book_page = ParsedPage.from_response(client.request_booking_page())
+    client.request_security_code_img(book_page)
+
+    data, action = read_form(book_page, "BookingS1Form")
+    data["homeCaptcha:securityCode"] = "K7P2"
+    train_page = ParsedPage.from_response(client.submit_booking_form(data, action_url=action))
+    data, action = read_form(train_page, "BookingS2Form")
+    ticket_page = ParsedPage.from_response(client.submit_train(data, action_url=action))
+    data, action = read_form(ticket_page, "BookingS3Form")
+    client.submit_ticket(data, action_url=action)
+    return time.perf_counter() - start
+
+
+def bench_transport(
+    transport: str, attempts: int, concurrency: int, delay: float
+) -> Dict[str, Any]:
+    with StandInIRS(delay=delay) as server, booking_site(server.base_url):
+        # One client per worker, as main.py keeps one client per booking loop.
+        context = server.client_ssl_context()
+        clients = [
+            HTTPRequest(transport=transport, ssl_context=context)
+            for _ in range(concurrency)
+        ]
+        for client in clients:
+            run_attempt(client)  # warm-up: connection, TLS and imports
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            batches = pool.map(
+                lambda client: [run_attempt(client) for _ in range(attempts)], clients
+            )
+            samples = [sample for batch in batches for sample in batch]
+        wall = time.perf_counter() - start
+
+        protocols = sorted({protocol for _, _, protocol in server.requests})
+        return {
+            "transport": transport,
+            "negotiated": protocols,
+            "attempts": len(samples),
+            "concurrency": concurrency,
+            "mean_ms": round(statistics.fmean(samples) * 1000, 3),
+            "p50_ms": round(percentile(samples, 50) * 1000, 3),
+            "p95_ms": round(percentile(samples, 95) * 1000, 3),
+            "wall_s": round(wall, 3),
+            "connections": server.connections,
+        }
+
+
+def run(
+    attempts: int = 20, concurrency: int = 1, delay_ms: float = 20.0
+) -> Dict[str, Any]:
+    transports: List[str] = [t for t in TRANSPORTS if t != "http2" or http2_available()]
+    return {
+        "schema_version": SCHEMA_VERSION,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "server_delay_ms": delay_ms,
+        "results": [
+            bench_transport(transport, attempts, concurrency, delay_ms / 1000)
+            for transport in transports
+        ],
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Compare per-attempt latency of the HTTP/1.1 and HTTP/2 transports."
+    )
+    parser.add_argument("-n", "--attempts", type=int, default=20)
+    parser.add_argument("-c", "--concurrency", type=int, default=1)
+    parser.add_argument(
+        "--delay-ms", type=float, default=20.0, help="Server delay added to every response"
+    )
+    parser.add_argument("-o", "--output", help="Write the JSON report to this file")
+    args = parser.parse_args()
+
+    report = run(args.attempts, args.concurrency, args.delay_ms)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(text + "\n", encoding="utf-8")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,498 @@
+import argparse
+import gzip
+import io
+import random
+import re
+import socket
+import ssl
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from http.cookies import SimpleCookie
+from http.server import BaseHTTPRequestHandler
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+from urllib.parse import parse_qs
+
+from PIL import Image, ImageDraw
+from PIL.PngImagePlugin import PngInfo
+
+try:
+    import h2.config
+    import h2.connection
+    import h2.events
+except ImportError:  # pragma: no cover - exercised only without the extra
+    h2 = None
+
+ROOT = Path(__file__).resolve().parents[1]
+PAGES = ROOT / "tests" / "fixtures" / "pages"
+TLS = ROOT / "tests" / "fixtures" / "tls"
+sys.path.insert(0, str(ROOT / "thsr_ticket"))
+
+from configs.web.http_config import set_base_url  # noqa: E402
+
+Reply = Tuple[int, List[Tuple[str, str]], bytes]
+
+# The recorded pages carry this placeholder wherever the session id goes.
+RECORDED_SESSION = b"0000ANONYMISEDSESSION0000"
+# The recorded page's reCodeLink only has href="#". The stand-in serves it
+# as Wicket 1.4 renders an AjaxLink, taken from the captcha panel fixture.
+RECODE_LINK = re.compile(rb'<a id="BookingS1Form_homeCaptcha_reCodeLink"[^>]*>')
+AJAX_RECODE_LINK = RECODE_LINK.search(
+    (PAGES / "s1_captcha_panel.html").read_bytes()
+).group(0)
+HTML = [("Content-Type", "text/html;charset=UTF-8")]
+
+# Form submitted -> (form expected next, page rendered after the redirect).
+STEPS = {
+    "BookingS1Form": "BookingS2Form",
+    "BookingS2Form": "BookingS3Form",
+    "BookingS3Form": None,
+    "BookingS3FormSP": None,
+}
+FORM_ACTION = re.compile(r"wicket:interface=:(\d+):(\w+)::IFormSubmitListener")
+RENDER_PATH = re.compile(r"wicket:interface=:(\d+)::::")
+
+
+CAPTCHA_ALPHABET = "ACDEFGHKLMNPQRTWXYZ2345679"
+
+
+def _captcha_png(text: str = "K7P2", hint: bool = False) -> bytes:
+    # With hint, the code is also stored in a PNG text chunk, so a simulated
+    # OCR can read it back without a model.
+    image = Image.new("RGB", (140, 48), "white")
+    ImageDraw.Draw(image).text((40, 16), text, fill="black")
+    info = PngInfo()
+    if hint:
+        info.add_text("code", text)
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG", pnginfo=info)
+    return buffer.getvalue()
+
+
+class _Session:
+    def __init__(self, session_id: str) -> None:
+        self.id = session_id
+        self.expect = "BookingS1Form"
+        self.page_id = 0
+        self.pending: Optional[bytes] = None
+        self.captcha: Optional[str] = None
+
+
+class StandInIRS:
+    # A local stand-in for irs.thsrc.com.tw that walks a booking through the
+    # recorded pages: S1 with a captcha and JSESSIONID, S2 train lists, S3
+    # (optionally the early-bird variant) and the result, with Wicket-style
+    # form actions and redirect-after-post. It speaks h2 or HTTP/1.1 over
+    # TLS, whichever ALPN selects, or plain HTTP with tls=False.
+    #
+    # delay and jitter (seconds) are added to every response. availability
+    # is the share of requests answered normally; the rest get a 503.
+    # captcha_error_rate is the share of S1 submits rejected as a wrong code.
+    # With captcha_check, each session gets a random code that S1 checks.
+    # Like Wicket, the image keeps showing the same code until the page's
+    # reCodeLink behavior draws a new one.
+    # With compress, HTML is gzipped for clients that accept it.
+
+    def __init__(
+        self,
+        delay: float = 0.0,
+        alpn: Sequence[str] = ("h2", "http/1.1"),
+        host: str = "127.0.0.1",
+        port: int = 0,
+        tls: bool = True,
+        jitter: float = 0.0,
+        availability: float = 1.0,
+        captcha_error_rate: float = 0.0,
+        early_bird: bool = False,
+        seed: Optional[int] = None,
+        compress: bool = False,
+        captcha_check: bool = False,
+    ) -> None:
+        self.delay = delay
+        self.jitter = jitter
+        self.availability = availability
+        self.captcha_error_rate = captcha_error_rate
+        self.early_bird = early_bird
+        self.compress = compress
+        self.captcha_check = captcha_check
+        self.captcha_requests = 0
+        self.recode_requests = 0
+        self.alpn = list(alpn)
+        self.host = host
+        self.port = port
+        self.tls = tls
+        self.requests: List[Tuple[str, str, str]] = []
+        self.connections = 0
+        self.bookings = 0
+        self.captcha = _captcha_png()
+        self._sessions: Dict[str, _Session] = {}
+        self._session_count = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._sock: Optional[socket.socket] = None
+        self._thread: Optional[threading.Thread] = None
+        self._closing = False
+
+    @property
+    def base_url(self) -> str:
+        if self.tls:
+            return f"https://localhost:{self.port}"
+        return f"http://{self.host}:{self.port}"
+
+    def client_ssl_context(self) -> ssl.SSLContext:
+        return ssl.create_default_context(cafile=str(TLS / "localhost.pem"))
+
+    def start(self) -> "StandInIRS":
+        if self.tls:
+            context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            context.load_cert_chain(TLS / "localhost.pem", TLS / "localhost.key")
+            context.set_alpn_protocols(self.alpn)
+            self._context = context
+
+        self._sock = socket.create_server((self.host, self.port))
+        self.port = self._sock.getsockname()[1]
+        self._thread = threading.Thread(target=self._accept_loop, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._closing = True
+        if self._sock is not None:
+            self._sock.close()
+
+    def __enter__(self) -> "StandInIRS":
+        return self.start()
+
+    def __exit__(self, *exc: object) -> None:
+        self.stop()
+
+    @property
+    def sessions(self) -> int:
+        return self._session_count
+
+    def route(
+        self,
+        method: str,
+        path: str,
+        protocol: str,
+        headers: Optional[Dict[str, str]] = None,
+        body: bytes = b"",
+    ) -> Reply:
+        status, reply_headers, reply = self._route(method, path, protocol, headers or {}, body)
+        accepted = (headers or {}).get("accept-encoding", "")
+        if self.compress and "gzip" in accepted and ("Content-Type", HTML[0][1]) in reply_headers:
+            reply = gzip.compress(reply, compresslevel=6)
+            reply_headers = reply_headers + [("Content-Encoding", "gzip")]
+        return status, reply_headers, reply
+
+    def _route(
+        self, method: str, path: str, protocol: str, headers: Dict[str, str], body: bytes
+    ) -> Reply:
+        with self._lock:
+            self.requests.append((method, path, protocol))
+            wait = self.delay + (self._random.uniform(0, self.jitter) if self.jitter else 0.0)
+            available = self._random.random() < self.availability
+            captcha_ok = self._random.random() >= self.captcha_error_rate
+        if wait:
+            time.sleep(wait)
+        if not available:
+            return 503, HTML + [("Retry-After", "1")], self._page("server_error.html")
+
+        session = self._session(headers)
+        if method == "GET" and path.startswith("/IMINT/?locale="):
+            return self._booking_page(session)
+        if method == "GET" and "passCode" in path:
+            if session is None:
+                return 403, HTML, b"<html><body>Forbidden</body></html>"
+            return 200, [("Content-Type", "image/png")], self._captcha(session)
+        if method == "GET" and "reCodeLink::IBehaviorListener" in path:
+            if session is None:
+                return 403, HTML, b"<html><body>Forbidden</body></html>"
+            return 200, [("Content-Type", "text/xml; charset=UTF-8")], self._recode(session)
+
+        render = RENDER_PATH.search(path)
+        if method == "GET" and render and session is not None and session.pending:
+            page, session.pending = session.pending, None
+            return 200, HTML, page
+
+        action = FORM_ACTION.search(path)
+        if method == "POST" and action:
+            return self._submit(session, action.group(2), parse_qs(body.decode("utf-8")), captcha_ok)
+        return 404, HTML, b"<html><body>Not Found</body></html>"
+
+    def _booking_page(self, session: Optional[_Session]) -> Reply:
+        headers = list(HTML)
+        if session is None:
+            with self._lock:
+                self._session_count += 1
+                session = _Session(f"STANDIN{self._session_count:08d}")
+                self._sessions[session.id] = session
+            headers.append(("Set-Cookie", f"JSESSIONID={session.id}; Path=/IMINT; HttpOnly"))
+        session.expect = "BookingS1Form"
+        session.page_id = 0
+        # A freshly rendered booking page carries a new captcha.
+        session.captcha = None
+        page = self._page("s1_booking.html", session)
+        return 200, headers, RECODE_LINK.sub(lambda _: AJAX_RECODE_LINK, page)
+
+    def _submit(
+        self,
+        session: Optional[_Session],
+        form: str,
+        fields: Dict[str, List[str]],
+        captcha_ok: bool,
+    ) -> Reply:
+        if session is None or form not in STEPS:
+            return 200, HTML, self._page("server_error.html")
+        expected = session.expect
+        if form != expected and not (expected == "BookingS3Form" and form.startswith(expected)):
+            # Wicket answers a stale or out-of-order form with an error page.
+            return 200, HTML, self._page("server_error.html")
+
+        if form == "BookingS1Form":
+            code = fields.get("homeCaptcha:securityCode", [""])[0]
+            if self.captcha_check and code.upper() != (session.captcha or "").upper():
+                captcha_ok = False
+            if not code or not captcha_ok:
+                return 200, HTML, self._page("s1_captcha_error.html", session)
+            round_trip = fields.get("tripCon:typesoftrip", ["0"])[0] == "1"
+            page = "s2_round_trip.html" if round_trip else "s2_one_way.html"
+        elif form == "BookingS2Form":
+            page = "s3_ticket_early_bird.html" if self.early_bird else "s3_ticket.html"
+        else:
+            page = "booking_result.html"
+            with self._lock:
+                self.bookings += 1
+
+        session.expect = STEPS[form] or "BookingS1Form"
+        session.page_id += 1
+        session.pending = self._page(page, session)
+        location = f"/IMINT/?wicket:interface=:{session.page_id}::::"
+        return 302, HTML + [("Location", location)], b""
+
+    def _captcha(self, session: _Session) -> bytes:
+        with self._lock:
+            self.captcha_requests += 1
+            if not self.captcha_check:
+                return self.captcha
+            if session.captcha is None:
+                session.captcha = self._new_code()
+        return _captcha_png(session.captcha, hint=True)
+
+    def _recode(self, session: _Session) -> bytes:
+        # The Ajax response re-renders the captcha image with a new antiCache.
+        with self._lock:
+            self.recode_requests += 1
+            if self.captcha_check:
+                session.captcha = self._new_code()
+            anti_cache = int(time.time() * 1000) + self.recode_requests
+        src = (
+            "?wicket:interface=:0:BookingS1Form:homeCaptcha:passCode::IResourceListener"
+            f"&amp;wicket:antiCache={anti_cache}"
+        )
+        return (
+            '<?xml version="1.0" encoding="UTF-8"?><ajax-response>'
+            '<component id="BookingS1Form_homeCaptcha_passCode"><![CDATA['
+            f'<img id="BookingS1Form_homeCaptcha_passCode" class="captcha-img" src="{src}">'
+            "]]></component></ajax-response>"
+        ).encode("utf-8")
+
+    def _new_code(self) -> str:
+        return "".join(self._random.choice(CAPTCHA_ALPHABET) for _ in range(4))
+
+    def _session(self, headers: Dict[str, str]) -> Optional[_Session]:
+        cookie = SimpleCookie()
+        try:
+            cookie.load(headers.get("cookie", ""))
+        except Exception:
+            return None
+        morsel = cookie.get("JSESSIONID")
+        if morsel is None:
+            return None
+        with self._lock:
+            return self._sessions.get(morsel.value)
+
+    def _page(self, name: str, session: Optional[_Session] = None) -> bytes:
+        html = (PAGES / name).read_bytes()
+        if session is not None:
+            html = html.replace(RECORDED_SESSION, session.id.encode())
+        return html
+
+    def _accept_loop(self) -> None:
+        while not self._closing:
+            try:
+                conn, addr = self._sock.accept()
+            except OSError:
+                return
+            with self._lock:
+                self.connections += 1
+            threading.Thread(target=self._serve, args=(conn, addr), daemon=True).start()
+
+    def _serve(self, conn: socket.socket, addr: Tuple[str, int]) -> None:
+        # Headers and body go out in separate writes on HTTP/1.1; without
+        # TCP_NODELAY, delayed ACKs would add ~40 ms to every response.
+        conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        if not self.tls:
+            try:
+                _HTTP11Handler(conn, addr, self)
+            except OSError:
+                pass
+            finally:
+                conn.close()
+            return
+        try:
+            tls = self._context.wrap_socket(conn, server_side=True)
+        except (OSError, ssl.SSLError):
+            conn.close()
+            return
+        try:
+            if tls.selected_alpn_protocol() == "h2":
+                self._serve_h2(tls)
+            else:
+                _HTTP11Handler(tls, addr, self)
+        except (OSError, ssl.SSLError):
+            pass
+        finally:
+            tls.close()
+
+    def _serve_h2(self, tls: ssl.SSLSocket) -> None:
+        config = h2.config.H2Configuration(client_side=False, header_encoding="utf-8")
+        conn = h2.connection.H2Connection(config=config)
+        send_lock = threading.Lock()
+        conn.initiate_connection()
+        tls.sendall(conn.data_to_send())
+
+        requests: Dict[int, Tuple[Dict[str, str], bytearray]] = {}
+        while True:
+            data = tls.recv(65535)
+            if not data:
+                return
+            with send_lock:
+                events = conn.receive_data(data)
+                for event in events:
+                    if isinstance(event, h2.events.RequestReceived):
+                        requests[event.stream_id] = (dict(event.headers), bytearray())
+                    elif isinstance(event, h2.events.DataReceived):
+                        requests[event.stream_id][1].extend(event.data)
+                        conn.acknowledge_received_data(
+                            event.flow_controlled_length, event.stream_id
+                        )
+                    elif isinstance(event, h2.events.StreamEnded):
+                        headers, body = requests.pop(event.stream_id, ({}, bytearray()))
+                        # Each stream is answered on its own thread so a slow
+                        # response never holds up the others on the connection.
+                        threading.Thread(
+                            target=self._reply_h2,
+                            args=(tls, conn, send_lock, event.stream_id, headers, bytes(body)),
+                            daemon=True,
+                        ).start()
+                    elif isinstance(event, h2.events.ConnectionTerminated):
+                        return
+                tls.sendall(conn.data_to_send())
+
+    def _reply_h2(
+        self,
+        tls: ssl.SSLSocket,
+        conn: "h2.connection.H2Connection",
+        send_lock: threading.Lock,
+        stream_id: int,
+        headers: Dict[str, str],
+        body: bytes,
+    ) -> None:
+        status, reply_headers, reply = self.route(
+            headers.get(":method", "GET"), headers.get(":path", "/"), "HTTP/2", headers, body
+        )
+        with send_lock:
+            conn.send_headers(
+                stream_id,
+                [(":status", str(status)), ("content-length", str(len(reply)))]
+                + [(k.lower(), v) for k, v in reply_headers],
+            )
+            frame_size = conn.max_outbound_frame_size
+            for start in range(0, len(reply), frame_size):
+                conn.send_data(stream_id, reply[start:start + frame_size])
+            conn.end_stream(stream_id)
+            try:
+                tls.sendall(conn.data_to_send())
+            except OSError:
+                pass
+
+
+class _HTTP11Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self) -> None:
+        self._reply("GET", b"")
+
+    def do_POST(self) -> None:
+        length = int(self.headers.get("Content-Length") or 0)
+        self._reply("POST", self.rfile.read(length))
+
+    def _reply(self, method: str, body: bytes) -> None:
+        headers = {key.lower(): value for key, value in self.headers.items()}
+        status, reply_headers, reply = self.server.route(
+            method, self.path, "HTTP/1.1", headers, body
+        )
+        self.send_response(status)
+        for key, value in reply_headers:
+            self.send_header(key, value)
+        self.send_header("Content-Length", str(len(reply)))
+        self.end_headers()
+        self.wfile.write(reply)
+
+    def log_message(self, *args: object) -> None:
+        pass
+
+
+@contextmanager
+def booking_site(base_url: str) -> Iterator[None]:
+    # Points HTTPConfig at base_url for the duration of the block.
+    previous = set_base_url(base_url)
+    try:
+        yield
+    finally:
+        set_base_url(previous)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Serve a local stand-in of the THSR booking site."
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--plain", action="store_true", help="Serve HTTP instead of HTTPS")
+    parser.add_argument("--delay-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--availability", type=float, default=1.0)
+    parser.add_argument("--captcha-error-rate", type=float, default=0.0)
+    parser.add_argument("--early-bird", action="store_true")
+    parser.add_argument("--compress", action="store_true", help="Gzip HTML replies")
+    parser.add_argument("--captcha-check", action="store_true",
+                        help="Check S1 codes; a code changes only via reCodeLink")
+    args = parser.parse_args()
+
+    server = StandInIRS(
+        delay=args.delay_ms / 1000,
+        jitter=args.jitter_ms / 1000,
+        host=args.host,
+        port=args.port,
+        tls=not args.plain,
+        availability=args.availability,
+        captcha_error_rate=args.captcha_error_rate,
+        early_bird=args.early_bird,
+        compress=args.compress,
+        captcha_check=args.captcha_check,
+    ).start()
+    print(f"I: Serving the IRS stand-in at {server.base_url}")
+    print(f"I: Point the client at it with THSR_BASE_URL={server.base_url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,249 @@
+import argparse
+import asyncio
+import json
+import platform
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, redirect_stdout
+from datetime import date, timedelta
+from io import StringIO
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from unittest.mock import patch
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "thsr_ticket"))
+sys.path.insert(0, str(ROOT / "benchmarks"))
+
+from configs.common import CAPTCHA_MAX_REFRESHES, CAPTCHA_MIN_CONFIDENCE  # noqa: E402
+from controller.booking_flow import AsyncBookingFlow, BookingFlow  # noqa: E402
+from controller.first_page_flow import CaptchaGate  # noqa: E402
+from extra.image_process import Recognition  # noqa: E402
+from irs_standin import StandInIRS, booking_site  # noqa: E402
+from parser_bench import percentile  # noqa: E402
+from remote.async_http_request import AsyncHTTPRequest  # noqa: E402
+from remote.http_request import HTTPRequest  # noqa: E402
+
+SCHEMA_VERSION = 1
+
+
+def load_profile() -> Dict[str, Any]:
+    profile = json.loads((ROOT / "profile.example.json").read_text(encoding="utf-8"))
+    # The stand-in serves trains around 08:00 on any date that is still valid.
+    profile["route"] = {"start": "taipei", "destination": "zuoying"}
+    profile["trip"] = {
+        "type": "one_way",
+        "outbound": {
+            "date": (date.today() + timedelta(days=7)).strftime("%Y/%m/%d"),
+            "time": "08:00",
+        },
+    }
+    profile["search"] = {"method": "time", "train_type": "all"}
+    return profile
+
+
+def simulated_ocr(error_rate: float, seed: Optional[int] = None) -> Callable[[Any], Recognition]:
+    # Stands in for image_process.read_code on the stand-in's hinted captchas.
+    # A share of reads come out wrong; wrong reads score 0.2-0.8 confidence
+    # and right ones 0.6-1.0. The ranges are assumed to overlap, not measured
+    # from the model, so results only show how the gate behaves.
+    rng = random.Random(seed)
+    lock = threading.Lock()
+
+    def read_code(image: Any) -> Recognition:
+        code = image.info.get("code", "")
+        with lock:
+            wrong = rng.random() < error_rate
+            confidence = rng.uniform(0.2, 0.8) if wrong else rng.uniform(0.6, 1.0)
+        if wrong and code:
+            code = code[:-1] + ("X" if code[-1] != "X" else "Y")
+        return Recognition(code, confidence)
+
+    return read_code
+
+
+def book(
+    server: StandInIRS,
+    profile: Dict[str, Any],
+    max_attempts: int,
+    captcha_gate: Optional[CaptchaGate] = None,
+) -> Tuple[bool, int, float]:
+    # One booking loop as main.py runs it; returns (booked, attempts, seconds).
+    start = time.perf_counter()
+    client = HTTPRequest(ssl_context=server.client_ssl_context() if server.tls else None)
+    for attempt in range(1, max_attempts + 1):
+        client.reset_session()
+        _, retry = BookingFlow(profile, client=client, captcha_gate=captcha_gate).run()
+        if not retry:
+            return True, attempt, time.perf_counter() - start
+    return False, max_attempts, time.perf_counter() - start
+
+
+async def book_async(
+    client: AsyncHTTPRequest,
+    profile: Dict[str, Any],
+    max_attempts: int,
+    captcha_gate: Optional[CaptchaGate] = None,
+) -> Tuple[bool, int, float]:
+    start = time.perf_counter()
+    session = client.new_session()
+    for attempt in range(1, max_attempts + 1):
+        session.reset_session()
+        flow = AsyncBookingFlow(profile, client=session, captcha_gate=captcha_gate)
+        _, retry = await flow.run()
+        if not retry:
+            return True, attempt, time.perf_counter() - start
+    return False, max_attempts, time.perf_counter() - start
+
+
+async def run_async(
+    server: StandInIRS,
+    profile: Dict[str, Any],
+    bookings: int,
+    max_attempts: int,
+    captcha_gate: Optional[CaptchaGate] = None,
+) -> List[Tuple[bool, int, float]]:
+    context = server.client_ssl_context() if server.tls else None
+    async with AsyncHTTPRequest(ssl_context=context) as client:
+        return await asyncio.gather(
+            *(book_async(client, profile, max_attempts, captcha_gate) for _ in range(bookings))
+        )
+
+
+def run(
+    bookings: int = 20,
+    concurrency: int = 10,
+    max_attempts: int = 5,
+    delay_ms: float = 50.0,
+    jitter_ms: float = 0.0,
+    availability: float = 1.0,
+    captcha_error_rate: float = 0.0,
+    use_async: bool = False,
+    skip_ocr: bool = False,
+    ocr_error_rate: Optional[float] = None,
+    captcha_threshold: float = CAPTCHA_MIN_CONFIDENCE,
+    captcha_refreshes: int = CAPTCHA_MAX_REFRESHES,
+    seed: Optional[int] = None,
+) -> Dict[str, Any]:
+    # With ocr_error_rate, captchas carry real codes that S1 checks and are
+    # read by simulated_ocr(), so captcha_threshold shows up in attempts.
+    profile = load_profile()
+    simulate = ocr_error_rate is not None
+    gate = CaptchaGate(captcha_threshold, captcha_refreshes)
+    server = StandInIRS(
+        delay=delay_ms / 1000,
+        jitter=jitter_ms / 1000,
+        alpn=("http/1.1",),
+        availability=availability,
+        captcha_error_rate=captcha_error_rate,
+        seed=seed,
+        captcha_check=simulate,
+    )
+    with ExitStack() as stack:
+        stack.enter_context(server)
+        stack.enter_context(booking_site(server.base_url))
+        # Booking output from many flows at once is noise here.
+        stack.enter_context(redirect_stdout(StringIO()))
+        if simulate:
+            read_code = simulated_ocr(ocr_error_rate or 0.0, seed)
+            stack.enter_context(patch("extra.image_process.read_code", read_code))
+        elif skip_ocr:
+            stack.enter_context(
+                patch("extra.image_process.read_code", return_value=Recognition("K7P2", None))
+            )
+
+        start = time.perf_counter()
+        if use_async:
+            results = asyncio.run(run_async(server, profile, bookings, max_attempts, gate))
+        else:
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                results = list(pool.map(
+                    lambda _: book(server, profile, max_attempts, gate), range(bookings)
+                ))
+        wall = time.perf_counter() - start
+
+    seconds = [elapsed for _, _, elapsed in results]
+    booked = sum(1 for done, _, _ in results if done)
+    attempts = sum(attempts for _, attempts, _ in results)
+    return {
+        "schema_version": SCHEMA_VERSION,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "mode": "asyncio" if use_async else f"threads x{concurrency}",
+        "server": {
+            "delay_ms": delay_ms,
+            "jitter_ms": jitter_ms,
+            "availability": availability,
+            "captcha_error_rate": captcha_error_rate,
+            "requests": len(server.requests),
+            "connections": server.connections,
+        },
+        "captcha": {
+            "threshold": captcha_threshold,
+            "max_refreshes": captcha_refreshes,
+            "ocr_error_rate": ocr_error_rate,
+            "images": server.captcha_requests,
+        },
+        "bookings": bookings,
+        "booked": booked,
+        "attempts": attempts,
+        "attempts_per_success": round(attempts / booked, 3) if booked else None,
+        "p50_ms": round(percentile(seconds, 50) * 1000, 3),
+        "p95_ms": round(percentile(seconds, 95) * 1000, 3),
+        "wall_s": round(wall, 3),
+        "bookings_per_sec": round(bookings / wall, 2) if wall else None,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Load-test the booking client end to end against the local IRS stand-in."
+    )
+    parser.add_argument("-n", "--bookings", type=int, default=20)
+    parser.add_argument("-c", "--concurrency", type=int, default=10)
+    parser.add_argument("--max-attempts", type=int, default=5)
+    parser.add_argument("--delay-ms", type=float, default=50.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--availability", type=float, default=1.0)
+    parser.add_argument("--captcha-error-rate", type=float, default=0.0)
+    parser.add_argument("--async", dest="use_async", action="store_true",
+                        help="Run every booking on one asyncio event loop")
+    parser.add_argument("--skip-ocr", action="store_true",
+                        help="Answer the captcha without running OCR")
+    parser.add_argument("--ocr-error-rate", type=float,
+                        help="Check captcha codes and read them with a simulated OCR "
+                             "that gets this share wrong")
+    parser.add_argument("--captcha-threshold", type=float, default=CAPTCHA_MIN_CONFIDENCE,
+                        help="Refresh captchas read below this confidence; 0 never refreshes")
+    parser.add_argument("--captcha-refreshes", type=int, default=CAPTCHA_MAX_REFRESHES)
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("-o", "--output", help="Write the JSON report to this file")
+    args = parser.parse_args()
+
+    report = run(
+        args.bookings,
+        args.concurrency,
+        args.max_attempts,
+        args.delay_ms,
+        args.jitter_ms,
+        args.availability,
+        args.captcha_error_rate,
+        args.use_async,
+        args.skip_ocr,
+        args.ocr_error_rate,
+        args.captcha_threshold,
+        args.captcha_refreshes,
+        args.seed,
+    )
+    text = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(text + "\n", encoding="utf-8")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
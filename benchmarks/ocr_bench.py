@@ -0,0 +1,407 @@
+import argparse
+import difflib
+import io
+import json
+import platform
+import random
+import statistics
+import sys
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+from unittest.mock import patch
+
+from PIL import Image, ImageFilter, ImageOps
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "thsr_ticket"))
+sys.path.insert(0, str(ROOT / "benchmarks"))
+
+from extra import image_process  # noqa: E402
+from irs_standin import CAPTCHA_ALPHABET, _captcha_png  # noqa: E402
+from parser_bench import percentile  # noqa: E402
+
+SCHEMA_VERSION = 1
+IMAGE_SUFFIXES = {".png", ".jpg", ".jpeg", ".gif", ".bmp"}
+# Mismatches listed per variant in the report.
+MAX_ERRORS_LISTED = 20
+# Stands for a missing or extra character in the confusion counts.
+GAP = ""
+# read_code() is what FirstPageFlow calls, through the OCR service; it adds
+# per-step probabilities for the confidence gate. verify_code() is the
+# plain read.
+CALLS = ("read_code", "verify_code")
+# Confidence thresholds evaluated by default. The client ships with the gate
+# off (CAPTCHA_MIN_CONFIDENCE = 0) until one is measured on real captchas.
+THRESHOLDS = (0.5,)
+
+
+class Sample(NamedTuple):
+    name: str
+    label: str
+    data: bytes
+
+
+def _binarize(image: Image.Image) -> Image.Image:
+    return image.convert("L").point(lambda p: 255 if p > 128 else 0)
+
+
+def _upscale(image: Image.Image) -> Image.Image:
+    return image.resize((image.width * 2, image.height * 2), Image.LANCZOS)
+
+
+# Preprocessing steps; a variant chains them with "+", e.g. "gray+median".
+PREPROCESS: Dict[str, Callable[[Image.Image], Image.Image]] = {
+    "none": lambda image: image,
+    "gray": lambda image: image.convert("L"),
+    "autocontrast": lambda image: ImageOps.autocontrast(image.convert("L")),
+    "binarize": _binarize,
+    "median": lambda image: image.filter(ImageFilter.MedianFilter(3)),
+    "sharpen": lambda image: image.filter(ImageFilter.SHARPEN),
+    "upscale": _upscale,
+}
+
+
+def preprocessor(spec: str) -> Callable[[Image.Image], Image.Image]:
+    steps = []
+    for name in spec.split("+"):
+        if name not in PREPROCESS:
+            raise ValueError(f"Unknown preprocessing '{name}'. Choose from: {sorted(PREPROCESS)}")
+        steps.append(PREPROCESS[name])
+
+    def apply(image: Image.Image) -> Image.Image:
+        for step in steps:
+            image = step(image)
+        return image
+
+    return apply
+
+
+def model_options(spec: str) -> Tuple[Dict[str, Any], Optional[Any]]:
+    # "default", or comma-separated ddddocr options: "beta", "old", "gpu" and
+    # "ranges=N" (a DdddOcr.set_ranges() value). Returns (constructor
+    # options, ranges).
+    options: Dict[str, Any] = {}
+    ranges: Optional[Any] = None
+    for token in filter(None, (t.strip() for t in spec.split(","))):
+        if token == "default":
+            continue
+        if token in ("beta", "old"):
+            options[token] = True
+        elif token == "gpu":
+            options["use_gpu"] = True
+        elif token.startswith("ranges="):
+            value = token.split("=", 1)[1]
+            ranges = int(value) if value.isdigit() else value
+        else:
+            raise ValueError(f"Unknown model option '{token}'. Use beta, old, gpu or ranges=N")
+    return options, ranges
+
+
+def build_model(spec: str) -> Any:
+    # The same constructor image_process.load_model() uses, plus the options.
+    import ddddocr
+
+    options, ranges = model_options(spec)
+    model = ddddocr.DdddOcr(show_ad=False, **options)
+    if ranges is not None:
+        model.set_ranges(ranges)
+    return model
+
+
+def load_samples(directory: Path) -> List[Sample]:
+    # Labels come from labels.json ({"file name": "code"}) when present,
+    # else from a "code" PNG text chunk, else from the file name up to the
+    # first "_" ("K7P2.png", "K7P2_013.png").
+    labels_file = directory / "labels.json"
+    labels = json.loads(labels_file.read_text(encoding="utf-8")) if labels_file.exists() else {}
+    samples = []
+    for path in sorted(directory.iterdir()):
+        if path.suffix.lower() not in IMAGE_SUFFIXES:
+            continue
+        data = path.read_bytes()
+        label = labels.get(path.name)
+        if label is None:
+            label = Image.open(io.BytesIO(data)).info.get("code")
+        if label is None:
+            label = path.stem.split("_", 1)[0]
+        samples.append(Sample(path.name, str(label), data))
+    if not samples:
+        raise ValueError(f"No captcha images found in {directory}")
+    return samples
+
+
+def synthetic_samples(count: int, seed: Optional[int] = None) -> List[Sample]:
+    # Captchas as the local stand-in draws them; only good for checking the
+    # harness, since they look nothing like the site's.
+    rng = random.Random(seed)
+    samples = []
+    for i in range(count):
+        code = "".join(rng.choice(CAPTCHA_ALPHABET) for _ in range(4))
+        samples.append(Sample(f"synthetic_{i:04d}.png", code, _captcha_png(code, hint=True)))
+    return samples
+
+
+def align(label: str, read: str) -> List[Tuple[str, str]]:
+    # (expected, read) character pairs; GAP marks a missed or extra character.
+    pairs: List[Tuple[str, str]] = []
+    matcher = difflib.SequenceMatcher(None, label, read, autojunk=False)
+    for op, i1, i2, j1, j2 in matcher.get_opcodes():
+        expected = label[i1:i2]
+        got = read[j1:j2]
+        if op == "equal":
+            pairs.extend(zip(expected, got))
+            continue
+        for k in range(max(len(expected), len(got))):
+            pairs.append((
+                expected[k] if k < len(expected) else GAP,
+                got[k] if k < len(got) else GAP,
+            ))
+    return pairs
+
+
+def confidence_report(
+    correct: Sequence[bool],
+    confidences: Sequence[Optional[float]],
+    thresholds: Sequence[float],
+) -> Dict[str, Any]:
+    # How well read_code()'s confidence separates right reads from wrong
+    # ones: per threshold, the share of reads the gate would submit and the
+    # accuracy of those above and below it.
+    scored = [(ok, c) for ok, c in zip(correct, confidences) if c is not None]
+
+    def accuracy(oks: List[bool]) -> Optional[float]:
+        return round(sum(oks) / len(oks), 4) if oks else None
+
+    def mean(values: List[float]) -> Optional[float]:
+        return round(statistics.fmean(values), 4) if values else None
+
+    report: Dict[str, Any] = {
+        "scored": len(scored),
+        "mean_right": mean([c for ok, c in scored if ok]),
+        "mean_wrong": mean([c for ok, c in scored if not ok]),
+        "thresholds": [],
+    }
+    for threshold in thresholds:
+        above = [ok for ok, c in scored if c >= threshold]
+        below = [ok for ok, c in scored if c < threshold]
+        report["thresholds"].append({
+            "threshold": threshold,
+            "submitted": round(len(above) / len(scored), 4) if scored else None,
+            "accuracy_above": accuracy(above),
+            "accuracy_below": accuracy(below),
+        })
+    return report
+
+
+def run_variant(
+    samples: Sequence[Sample],
+    preprocess: str,
+    model: str,
+    repeat: int = 1,
+    warmup: int = 3,
+    case_sensitive: bool = False,
+    call: str = "read_code",
+    thresholds: Sequence[float] = THRESHOLDS,
+) -> Dict[str, Any]:
+    if call not in CALLS:
+        raise ValueError(f"Unknown call '{call}'. Choose from: {list(CALLS)}")
+    prepare = preprocessor(preprocess)
+    load_start = time.perf_counter()
+    ocr = build_model(model)
+    load_ms = (time.perf_counter() - load_start) * 1000
+
+    def read(sample: Sample) -> Tuple[str, Optional[float], float, float]:
+        start = time.perf_counter()
+        image = prepare(Image.open(io.BytesIO(sample.data)))
+        prepared = time.perf_counter()
+        if call == "read_code":
+            text, confidence = image_process.read_code(image)
+        else:
+            text, confidence = image_process.verify_code(image), None
+        return text, confidence, prepared - start, time.perf_counter() - start
+
+    samples_s: List[float] = []
+    preprocess_s: List[float] = []
+    reads: List[Tuple[str, Optional[float]]] = []
+    with patch.object(image_process, "_ocr", ocr):
+        for sample in samples[:warmup]:
+            read(sample)
+        wall_start = time.perf_counter()
+        for _ in range(repeat):
+            reads = []
+            for sample in samples:
+                text, confidence, prep, total = read(sample)
+                reads.append((text, confidence))
+                preprocess_s.append(prep)
+                samples_s.append(total)
+        wall = time.perf_counter() - wall_start
+
+    fold = (lambda s: s) if case_sensitive else (lambda s: s.upper())
+    confusion: Dict[str, Counter] = defaultdict(Counter)
+    errors = []
+    right: List[bool] = []
+    chars = 0
+    chars_correct = 0
+    for sample, (text, confidence) in zip(samples, reads):
+        label, got = fold(sample.label), fold(text)
+        right.append(label == got)
+        if label != got and len(errors) < MAX_ERRORS_LISTED:
+            errors.append({
+                "image": sample.name, "label": sample.label, "read": text,
+                "confidence": confidence,
+            })
+        for expected, seen in align(label, got):
+            confusion[expected][seen] += 1
+            if expected != GAP:
+                chars += 1
+                chars_correct += expected == seen
+
+    mistakes = Counter(
+        {(e, s): n for e, row in confusion.items() for s, n in row.items() if e != s}
+    )
+    result = {
+        "preprocess": preprocess,
+        "model": model,
+        "call": call,
+        "images": len(samples),
+        "repeat": repeat,
+        "model_load_ms": round(load_ms, 1),
+        "p50_ms": round(percentile(samples_s, 50) * 1000, 3),
+        "p95_ms": round(percentile(samples_s, 95) * 1000, 3),
+        "mean_ms": round(statistics.fmean(samples_s) * 1000, 3),
+        "preprocess_mean_ms": round(statistics.fmean(preprocess_s) * 1000, 3),
+        "images_per_sec": round(len(samples_s) / wall, 2) if wall else None,
+        "accuracy": round(sum(right) / len(samples), 4),
+        "char_accuracy": round(chars_correct / chars, 4) if chars else None,
+        "top_confusions": [
+            {"expected": e, "read": s, "count": n} for (e, s), n in mistakes.most_common(10)
+        ],
+        "confusion": {e: dict(row) for e, row in sorted(confusion.items())},
+        "errors": errors,
+    }
+    if call == "read_code":
+        result["confidence"] = confidence_report(right, [c for _, c in reads], thresholds)
+    return result
+
+
+def run(
+    samples: Sequence[Sample],
+    preprocess: Sequence[str] = ("none",),
+    models: Sequence[str] = ("default",),
+    repeat: int = 1,
+    warmup: int = 3,
+    case_sensitive: bool = False,
+    dataset: str = "",
+    call: str = "read_code",
+    thresholds: Sequence[float] = THRESHOLDS,
+) -> Dict[str, Any]:
+    # Every preprocessing variant on every model, over the same images.
+    import ddddocr
+
+    results = [
+        run_variant(samples, prep, model, repeat, warmup, case_sensitive, call, thresholds)
+        for model in models
+        for prep in preprocess
+    ]
+    return {
+        "schema_version": SCHEMA_VERSION,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "ddddocr": getattr(ddddocr, "__version__", None),
+        "dataset": dataset,
+        "case_sensitive": case_sensitive,
+        "results": results,
+    }
+
+
+def format_table(report: Dict[str, Any]) -> List[str]:
+    # The gate columns use the first threshold: the share submitted and the
+    # accuracy of those reads.
+    lines = [
+        f"{'model':<16} {'preprocess':<20} {'accuracy':>8} {'chars':>7} "
+        f"{'p50 ms':>8} {'p95 ms':>8} {'img/s':>8} {'submit':>7} {'acc>=t':>7}"
+    ]
+
+    def percent(value: Optional[float]) -> str:
+        return f"{value:.1%}" if value is not None else "-"
+
+    for r in report["results"]:
+        gate = r["confidence"]["thresholds"][0] if r.get("confidence") else {}
+        lines.append(
+            f"{r['model']:<16} {r['preprocess']:<20} {r['accuracy']:>8.1%} "
+            f"{percent(r['char_accuracy']):>7} "
+            f"{r['p50_ms']:>8.2f} {r['p95_ms']:>8.2f} {r['images_per_sec'] or 0:>8.1f} "
+            f"{percent(gate.get('submitted')):>7} {percent(gate.get('accuracy_above')):>7}"
+        )
+    return lines
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Measure captcha OCR accuracy and latency on labelled images."
+    )
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("directory", nargs="?", type=Path,
+                        help="Captcha images, labelled by labels.json or file name")
+    source.add_argument("--synthetic", type=int, metavar="N",
+                        help="Use N stand-in captchas instead, to check the harness")
+    parser.add_argument("-p", "--preprocess", action="append",
+                        help=f"Preprocessing variant, steps joined by '+' from: "
+                             f"{', '.join(PREPROCESS)} (repeatable; default: none)")
+    parser.add_argument("-m", "--model", action="append",
+                        help="Model options: default, or beta/old/gpu/ranges=N joined "
+                             "by ',' (repeatable; default: default)")
+    parser.add_argument("--call", choices=CALLS, default="read_code",
+                        help="OCR call to measure; read_code also reports confidence")
+    parser.add_argument("-t", "--threshold", type=float, action="append",
+                        help=f"Confidence threshold to evaluate (repeatable; "
+                             f"default: {', '.join(map(str, THRESHOLDS))})")
+    parser.add_argument("-r", "--repeat", type=int, default=1,
+                        help="Passes over the images for the latency figures")
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--case-sensitive", action="store_true")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--table", action="store_true",
+                        help="Print a comparison table instead of JSON")
+    parser.add_argument("-o", "--output", help="Write the JSON report to this file")
+    args = parser.parse_args()
+
+    try:
+        if args.synthetic:
+            samples = synthetic_samples(args.synthetic, args.seed)
+            dataset = f"synthetic:{args.synthetic}"
+        else:
+            samples = load_samples(args.directory)
+            dataset = str(args.directory)
+        for spec in args.preprocess or ():
+            preprocessor(spec)
+        for spec in args.model or ():
+            model_options(spec)
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+
+    report = run(
+        samples,
+        args.preprocess or ("none",),
+        args.model or ("default",),
+        args.repeat,
+        args.warmup,
+        args.case_sensitive,
+        dataset,
+        args.call,
+        args.threshold or THRESHOLDS,
+    )
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        Path(args.output).write_text(text + "\n", encoding="utf-8")
+    if args.table:
+        print("\n".join(format_table(report)))
+    elif not args.output:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
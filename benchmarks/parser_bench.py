@@ -0,0 +1,177 @@
+import argparse
+import json
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "thsr_ticket"))
+
+import bs4  # noqa: E402
+
+from controller.form_data import compose_form_defaults, read_form  # noqa: E402
+from html_parser import get_parser_backend, parse_html, set_parser_backend  # noqa: E402
+from view_model.avail_trains import OUTBOUND_GROUP, RETURN_GROUP, AvailTrains  # noqa: E402
+from view_model.booking_result import BookingResult  # noqa: E402
+from view_model.error_feedback import ErrorFeedback  # noqa: E402
+
+FIXTURES = ROOT / "tests" / "fixtures" / "pages"
+SCHEMA_VERSION = 1
+
+FORM_PAGES = {
+    "s1_booking.html": "BookingS1Form",
+    "s2_one_way.html": "BookingS2Form",
+    "s3_ticket.html": "BookingS3Form",
+    "s3_ticket_early_bird.html": "BookingS3FormSP",
+}
+ERROR_PAGES = ("s1_captcha_error.html", "server_error.html", "s2_one_way.html")
+
+
+class Case(NamedTuple):
+    name: str
+    page: str
+    func: Callable[[], Any]
+
+
+def load_page(name: str) -> bytes:
+    return (FIXTURES / name).read_bytes()
+
+
+def build_cases() -> List[Case]:
+    cases: List[Case] = []
+
+    for path in sorted(FIXTURES.glob("*.html")):
+        html = path.read_bytes()
+        cases.append(Case("parse_html", path.name, lambda html=html: parse_html(html)))
+
+    for name, form_id in FORM_PAGES.items():
+        html = load_page(name)
+        page = parse_html(html)
+        cases.append(Case(
+            "compose_form_defaults",
+            name,
+            lambda page=page, form_id=form_id: compose_form_defaults(page, form_id),
+        ))
+        cases.append(Case(
+            "read_form",
+            name,
+            lambda html=html, form_id=form_id: read_form(html, form_id),
+        ))
+
+    for name, groups in (
+        ("s2_one_way.html", (OUTBOUND_GROUP,)),
+        ("s2_round_trip.html", (OUTBOUND_GROUP, RETURN_GROUP)),
+    ):
+        html = load_page(name)
+        cases.append(Case(
+            "AvailTrains.parse",
+            name,
+            lambda html=html, groups=groups: AvailTrains().parse_groups(html, groups),
+        ))
+        cases.append(Case(
+            "AvailTrains.parse[tree]",
+            name,
+            lambda html=html, groups=groups: AvailTrains(streaming=False).parse_groups(
+                html, groups
+            ),
+        ))
+
+    for name in ERROR_PAGES:
+        html = load_page(name)
+        cases.append(Case(
+            "ErrorFeedback.parse", name, lambda html=html: ErrorFeedback().parse(html)
+        ))
+
+    html = load_page("booking_result.html")
+    cases.append(Case(
+        "BookingResult.parse", "booking_result.html", lambda: BookingResult().parse(html)
+    ))
+
+    return cases
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def run_case(case: Case, iterations: int, warmup: int) -> Dict[str, Any]:
+    for _ in range(warmup):
+        case.func()
+
+    samples: List[float] = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        case.func()
+        samples.append(time.perf_counter() - start)
+
+    # Measured separately because tracing allocations slows every call down.
+    tracemalloc.start()
+    try:
+        case.func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    mean = statistics.fmean(samples)
+    return {
+        "name": case.name,
+        "page": case.page,
+        "iterations": iterations,
+        "ops_per_sec": round(1 / mean, 2) if mean else None,
+        "mean_ms": round(mean * 1000, 4),
+        "p50_ms": round(percentile(samples, 50) * 1000, 4),
+        "p95_ms": round(percentile(samples, 95) * 1000, 4),
+        "peak_memory_bytes": peak,
+    }
+
+
+def run(
+    iterations: int = 200,
+    warmup: int = 10,
+    backend: Optional[str] = None,
+    only: Optional[str] = None,
+) -> Dict[str, Any]:
+    set_parser_backend(backend)
+    try:
+        cases = [case for case in build_cases() if not only or only in case.name]
+        results = [run_case(case, iterations, warmup) for case in cases]
+        return {
+            "schema_version": SCHEMA_VERSION,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "beautifulsoup4": bs4.__version__,
+            "parser_backend": get_parser_backend(),
+            "results": results,
+        }
+    finally:
+        set_parser_backend(None)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Benchmark the HTML parsing paths on recorded THSR pages."
+    )
+    parser.add_argument("-n", "--iterations", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--backend", help="HTML parser backend, e.g. lxml or html.parser")
+    parser.add_argument("--only", help="Run only cases whose name contains this text")
+    parser.add_argument("-o", "--output", help="Write the JSON report to this file")
+    args = parser.parse_args()
+
+    report = run(args.iterations, args.warmup, args.backend, args.only)
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        Path(args.output).write_text(text + "\n", encoding="utf-8")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
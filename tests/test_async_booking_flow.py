@@ -0,0 +1,110 @@
+import asyncio
+import sys
+from datetime import date, timedelta
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "thsr_ticket"))
+sys.path.insert(0, str(ROOT / "benchmarks"))
+
+from controller.booking_flow import AsyncBookingFlow  # noqa: E402
+from controller.first_page_flow import CaptchaGate  # noqa: E402
+from extra.image_process import Recognition  # noqa: E402
+from irs_standin import StandInIRS, booking_site  # noqa: E402
+from remote.async_http_request import AsyncHTTPRequest, async_available, form_fields  # noqa: E402
+
+TRAVEL_DATE = (date.today() + timedelta(days=7)).strftime("%Y/%m/%d")
+PROFILE = {
+    "route": {"start": "taipei", "destination": "zuoying"},
+    "trip": {"type": "one_way", "outbound": {"date": TRAVEL_DATE, "time": "08:00"}},
+    "search": {"method": "time", "train_type": "all"},
+    "seat": {"car": "standard", "preference": "window"},
+    "tickets": {"adult": 1},
+    "passenger": {"id": "A123456789", "phone": "0912345678", "email": "user@example.com"},
+}
+
+
+class FormFieldsTest(unittest.TestCase):
+    def test_encodes_values_like_requests(self) -> None:
+        fields = form_fields({"a": None, "b": 0, "c": True, "d": "x", "e": [1, None]})
+        self.assertEqual({"b": "0", "c": "True", "d": "x", "e": ["1"]}, fields)
+
+
+@unittest.skipUnless(async_available(), "httpx is not installed")
+class AsyncBookingFlowTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.server = StandInIRS(delay=0.05).start()
+        self.addCleanup(self.server.stop)
+        site = booking_site(self.server.base_url)
+        site.__enter__()
+        self.addCleanup(site.__exit__, None, None, None)
+        ocr = patch("extra.image_process.read_code", return_value=Recognition("ABCD", None))
+        ocr.start()
+        self.addCleanup(ocr.stop)
+
+    async def book(self, count: int):
+        client = AsyncHTTPRequest(ssl_context=self.server.client_ssl_context())
+        async with client:
+            flows = [
+                AsyncBookingFlow(PROFILE, client=client.new_session()) for _ in range(count)
+            ]
+            with patch("builtins.print"):
+                return await asyncio.gather(*(flow.run() for flow in flows))
+
+    def test_concurrent_bookings_share_one_loop(self) -> None:
+        results = asyncio.run(self.book(3))
+
+        for resp, retry in results:
+            self.assertFalse(retry)
+            self.assertEqual(200, resp.status_code)
+        posts = [path for method, path, _ in self.server.requests if method == "POST"]
+        self.assertEqual(9, len(posts))
+        # Each booking got its own session from the stand-in.
+        self.assertEqual(3, self.server.sessions)
+
+    def test_bookings_overlap_on_the_event_loop(self) -> None:
+        loop_time = asyncio.run(self._timed(1))
+        batch_time = asyncio.run(self._timed(4))
+        # Five requests of 50 ms each; four bookings run side by side.
+        self.assertLess(batch_time, loop_time * 2.5)
+
+    async def _timed(self, count: int) -> float:
+        start = asyncio.get_running_loop().time()
+        await self.book(count)
+        return asyncio.get_running_loop().time() - start
+
+
+@unittest.skipUnless(async_available(), "httpx is not installed")
+class AsyncCaptchaRefreshTest(unittest.TestCase):
+    def test_low_confidence_read_asks_for_a_new_code(self) -> None:
+        server = StandInIRS(captcha_check=True).start()
+        self.addCleanup(server.stop)
+        site = booking_site(server.base_url)
+        site.__enter__()
+        self.addCleanup(site.__exit__, None, None, None)
+        reads = iter([0.2, 0.9])
+
+        def read_code(image):
+            return Recognition(image.info["code"], next(reads))
+
+        async def book():
+            client = AsyncHTTPRequest(ssl_context=server.client_ssl_context())
+            async with client:
+                flow = AsyncBookingFlow(
+                    PROFILE, client=client.new_session(), captcha_gate=CaptchaGate(0.5, 2)
+                )
+                with patch("builtins.print"):
+                    return await flow.run()
+
+        with patch("extra.image_process.read_code", read_code):
+            _, retry = asyncio.run(book())
+
+        self.assertFalse(retry)
+        self.assertEqual(1, server.recode_requests)
+        self.assertEqual(1, server.bookings)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,11 +1,16 @@
 import sys
 import unittest
 from pathlib import Path
+from unittest.mock import patch
 
 ROOT = Path(__file__).resolve().parents[1]
 sys.path.insert(0, str(ROOT / "thsr_ticket"))
 
-from view_model.avail_trains import AvailTrains
+import view_model.avail_trains as avail_trains
+from html_parser import ParsedPage
+from view_model.avail_trains import OUTBOUND_GROUP, RETURN_GROUP, AvailTrains
+
+FIXTURES = ROOT / "tests" / "fixtures" / "pages"
 
 
 class AvailTrainsTest(unittest.TestCase):
@@ -107,5 +112,113 @@ class AvailTrainsTest(unittest.TestCase):
         self.assertEqual([200], [train.id for train in inbound])
 
 
+class StreamingAvailTrainsTest(unittest.TestCase):
+    def assert_same_as_tree(self, html) -> None:
+        streamed = AvailTrains().parse_groups(html)
+        reference = AvailTrains(streaming=False).parse_groups(html)
+        self.assertEqual(reference, streamed)
+
+    def test_fixture_pages_match_tree_parser(self) -> None:
+        for name in ("s2_one_way.html", "s2_round_trip.html", "s1_booking.html"):
+            with self.subTest(page=name):
+                self.assert_same_as_tree((FIXTURES / name).read_bytes())
+
+    def test_irregular_markup_matches_tree_parser(self) -> None:
+        cases = {
+            "unclosed label": b"""
+                <label><input name="TrainQueryDataViewPanel:TrainGroup" type="radio"
+                  value="a" QueryCode="1" QueryDeparture="08:00" QueryArrival="09:00">
+                <div class="discount"><p class="type">Student<span> 12%</span></p>
+            """,
+            "nested labels": b"""
+                <label><label><input name="TrainQueryDataViewPanel:TrainGroup"
+                  type="radio" value="a" QueryCode="1" QueryDeparture="08:00"
+                  QueryArrival="09:00"></label>
+                  <p class="early-bird">Early</p></label>
+            """,
+            "discount outside label": b"""
+                <div class="discount"><label>
+                  <input name="TrainQueryDataViewPanel:TrainGroup" type="radio"
+                    value="a" QueryCode="1" QueryDeparture="08:00" QueryArrival="09:00">
+                  <p class="type">Early &amp; <!-- note --> Bird</p>
+                </label></div>
+            """,
+            "script and style in a discount": b"""
+                <label><input name="TrainQueryDataViewPanel:TrainGroup" type="radio"
+                  value="a" QueryCode="1" QueryDeparture="08:00" QueryArrival="09:00">
+                <div class="discount"><p class="type">A<script>var x = "</p>";</script>
+                  <style>.type { color: red }</style><template>T<b>t</b></template>
+                  <ruby>B<rp>(</rp><rt>b</rt><rp>)</rp></ruby></p></div></label>
+            """,
+            "invalid and unlabelled": b"""
+                <input name="TrainQueryDataViewPanel:TrainGroup" type="radio"
+                  value="a" QueryCode="x" QueryDeparture="08:00" QueryArrival="09:00">
+                <label><input name="TrainQueryDataViewPanel:TrainGroup" type="radio"
+                  value="b" QueryCode="2" QueryArrival="09:00"></label>
+                <input name="TrainQueryDataViewPanel:TrainGroup" type="radio"
+                  value="c" QueryCode="3" QueryDeparture="10:00" QueryArrival="11:00">
+            """,
+        }
+        for name, html in cases.items():
+            with self.subTest(case=name):
+                self.assert_same_as_tree(html)
+
+    def test_round_trip_groups_are_collected_in_one_pass(self) -> None:
+        html = (FIXTURES / "s2_round_trip.html").read_bytes()
+
+        with patch.object(
+            avail_trains._TrainRadioScanner,
+            "feed",
+            autospec=True,
+            side_effect=avail_trains._TrainRadioScanner.feed,
+        ) as feed:
+            found = AvailTrains().parse_groups(html, (OUTBOUND_GROUP, RETURN_GROUP))
+
+        scanners = {call.args[0] for call in feed.call_args_list}
+        self.assertEqual(1, len(scanners))
+        self.assertEqual(10, len(found[OUTBOUND_GROUP]))
+        self.assertEqual(5, len(found[RETURN_GROUP]))
+
+    def test_streaming_does_not_build_a_tree(self) -> None:
+        page = ParsedPage((FIXTURES / "s2_one_way.html").read_bytes())
+
+        with patch.object(avail_trains.AvailTrains, "_parser") as parser:
+            trains = AvailTrains().parse(page)
+
+        parser.assert_not_called()
+        self.assertFalse(page.is_parsed)
+        self.assertEqual(10, len(trains))
+
+    def test_falls_back_to_tree_when_streaming_fails(self) -> None:
+        html = (FIXTURES / "s2_one_way.html").read_bytes()
+
+        with patch.object(
+            avail_trains.AvailTrains,
+            "_parse_stream",
+            side_effect=AssertionError("unexpected '[' char in declaration"),
+        ), patch("builtins.print") as log:
+            trains = AvailTrains().parse(html)
+
+        self.assertEqual(AvailTrains(streaming=False).parse(html), trains)
+        self.assertIn("W: Streaming train scan failed (AssertionError", log.call_args[0][0])
+
+    def test_unknown_declared_charset_falls_back(self) -> None:
+        html = (FIXTURES / "s2_one_way.html").read_bytes()
+        page = ParsedPage(html, encoding="x-no-such-charset")
+
+        with patch("builtins.print") as log:
+            trains = AvailTrains().parse(page)
+
+        self.assertEqual(10, len(trains))
+        self.assertIn("W: Unknown page charset 'x-no-such-charset'", log.call_args[0][0])
+
+    def test_scanner_bugs_are_not_hidden(self) -> None:
+        html = (FIXTURES / "s2_one_way.html").read_bytes()
+
+        with patch.object(avail_trains.AvailTrains, "_parse_stream", side_effect=KeyError("x")):
+            with self.assertRaises(KeyError):
+                AvailTrains().parse(html)
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -6,6 +6,7 @@ from unittest.mock import Mock, patch
 ROOT = Path(__file__).resolve().parents[1]
 sys.path.insert(0, str(ROOT / "thsr_ticket"))
 
+import html_parser  # noqa: E402
 from controller.booking_flow import BookingFlow  # noqa: E402
 
 
@@ -40,6 +41,39 @@ class BookingFlowTest(unittest.TestCase):
         self.assertIs(train_resp, result)
         confirm_train.assert_called_once()
 
+    def test_each_response_is_parsed_once_across_stages(self) -> None:
+        s2_resp = Mock()
+        s2_resp.content = b"""
+        <form id="BookingS2Form" action="/s2">
+          <label>
+            <input name="TrainQueryDataViewPanel:TrainGroup" type="radio" value="out"
+                   QueryCode="100" QueryDeparture="08:00" QueryArrival="08:10"/>
+          </label>
+        </form>
+        """
+        train_resp = Mock()
+        train_resp.content = b"<form id='BookingS3FormSP'></form>"
+        client = Mock()
+        client.submit_train.return_value = train_resp
+        flow = BookingFlow(
+            user_profile={
+                "route": {"start": "taipei", "destination": "taichung"},
+                "trip": {"outbound": {"date": "2026/05/09", "time": "08:00"}},
+            },
+            verbose=False,
+        )
+        flow.client = client
+
+        with patch.object(html_parser, "_parse", wraps=html_parser._parse) as parse:
+            flow.show_error(flow.parsed_page(s2_resp))
+            result = flow.handle_train_confirmation(s2_resp)
+
+        self.assertIs(train_resp, result)
+        parsed = [call.args[0] for call in parse.call_args_list]
+        self.assertEqual(1, parsed.count(s2_resp.content))
+        # Error-free pages are screened without building a tree at all.
+        self.assertEqual(0, parsed.count(train_resp.content))
+
 
 if __name__ == "__main__":
     unittest.main()
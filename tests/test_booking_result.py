@@ -0,0 +1,60 @@
+import sys
+import unittest
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "thsr_ticket"))
+
+from configs.web.parse_html_element import BOOKING_RESULT  # noqa: E402
+from html_parser import parse_html  # noqa: E402
+from view_model.booking_result import TICKET_FIELDS, BookingResult  # noqa: E402
+
+FIXTURES = ROOT / "tests" / "fixtures" / "pages"
+
+
+class BookingResultTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.html = (FIXTURES / "booking_result.html").read_text(encoding="utf-8")
+
+    def test_parse_recorded_result_page(self) -> None:
+        ticket = BookingResult().parse(self.html.encode("utf-8"))[0]
+
+        self.assertEqual("09876543", ticket.id)
+        self.assertEqual("TWD 1,490", ticket.price)
+        self.assertEqual("台北", ticket.start_station)
+        self.assertEqual("左營", ticket.dest_station)
+        self.assertEqual("0803", ticket.train_id)
+        self.assertEqual("2026/05/09", ticket.date)
+        self.assertEqual("7車12A", ticket.seat)
+        self.assertEqual("標準車廂", ticket.seat_class)
+        self.assertEqual("2026/05/01", ticket.payment_deadline)
+        self.assertEqual("全票 1張", ticket.ticket_num_info)
+
+    def test_anchors_match_find_lookups(self) -> None:
+        page = parse_html(self.html)
+        anchors = BookingResult().find_anchors(page)
+
+        for anchor, _ in TICKET_FIELDS.values():
+            with self.subTest(anchor=anchor):
+                spec = dict(BOOKING_RESULT[anchor])
+                if "text" in spec:
+                    spec["string"] = spec.pop("text")
+                self.assertIs(page.find(**spec), anchors[anchor])
+
+    def test_reports_every_missing_field(self) -> None:
+        html = (
+            self.html.replace('id="setTrainCode0"', 'id="renamed"')
+            .replace('class="seat-label"', 'class="renamed"')
+            .replace("（付款期限：", "(deadline:")
+        )
+        result = BookingResult()
+
+        with self.assertRaises(ValueError) as ctx:
+            result.parse(html)
+
+        self.assertEqual(["train_id", "seat", "payment_deadline"], result.missing)
+        self.assertIn("train_id, seat, payment_deadline", str(ctx.exception))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,218 @@
+import io
+import sys
+import unittest
+from datetime import date, timedelta
+from pathlib import Path
+from unittest.mock import patch
+
+from PIL import Image
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "thsr_ticket"))
+sys.path.insert(0, str(ROOT / "benchmarks"))
+
+from controller.first_page_flow import CaptchaGate, FirstPageFlow  # noqa: E402
+from extra import image_process  # noqa: E402
+from extra.image_process import Recognition, _decode, _score, read_code  # noqa: E402
+from irs_standin import StandInIRS, booking_site  # noqa: E402
+from load_test import run  # noqa: E402
+from remote.http_request import (  # noqa: E402
+    HTTPRequest,
+    SecurityImgScanner,
+    find_recode_link,
+    parse_security_img_url,
+    recode_url,
+    recoded_img_url,
+    refresh_security_img_url,
+)
+
+PAGES = ROOT / "tests" / "fixtures" / "pages"
+
+PROFILE = {
+    "route": {"start": "taipei", "destination": "zuoying"},
+    "trip": {
+        "type": "one_way",
+        "outbound": {
+            "date": (date.today() + timedelta(days=7)).strftime("%Y/%m/%d"),
+            "time": "08:00",
+        },
+    },
+    "tickets": {"adult": 1},
+}
+
+
+class DecodeTest(unittest.TestCase):
+    def test_weakest_character_sets_the_confidence(self) -> None:
+        charset = ["", "A", "B", "7"]
+        steps = [
+            [0.9, 0.1, 0.0, 0.0],
+            [0.1, 0.8, 0.1, 0.0],
+            [0.2, 0.7, 0.1, 0.0],
+            [0.9, 0.0, 0.1, 0.0],
+            [0.3, 0.0, 0.0, 0.7],
+            [0.4, 0.0, 0.0, 0.6],
+            [0.6, 0.1, 0.3, 0.0],
+        ]
+        # Repeats collapse and blanks drop out.
+        text, confidence = _decode([[step] for step in steps], charset)
+        self.assertEqual("A7", text)
+        self.assertAlmostEqual(0.7, confidence, places=5)
+
+    def test_blank_only_read_scores_zero(self) -> None:
+        self.assertEqual(("", 0.0), _decode([[1.0, 0.0]], ["", "A"]))
+
+    def test_only_characters_of_the_text_are_scored(self) -> None:
+        charset = ["", "A", "7"]
+        steps = [[[0.1, 0.6, 0.3]], [[0.9, 0.0, 0.1]], [[0.1, 0.0, 0.9]]]
+        # set_ranges() dropped the weak "A" from ddddocr's text.
+        text, confidence = _score("7", steps, charset)
+        self.assertEqual("7", text)
+        self.assertAlmostEqual(0.9, confidence, places=5)
+        self.assertAlmostEqual(0.6, _score("A7", steps, charset).confidence, places=5)
+
+    def test_read_code_keeps_the_model_text(self) -> None:
+        class Model:
+            def classification(self, image, probability=False):
+                return {
+                    "text": "7",
+                    "probabilities": [[[0.1, 0.6, 0.3]], [[0.1, 0.0, 0.9]]],
+                    "charset": ["", "A", "7"],
+                }
+
+        with patch.object(image_process, "_ocr", Model()):
+            recognition = read_code(Image.new("RGB", (140, 48)))
+        self.assertEqual("7", recognition.text)
+        self.assertAlmostEqual(0.9, recognition.confidence, places=5)
+
+
+class RefreshUrlTest(unittest.TestCase):
+    def test_anti_cache_is_replaced(self) -> None:
+        url = (
+            "https://irs.thsrc.com.tw/IMINT/?wicket:interface=:0:BookingS1Form:homeCaptcha:"
+            "passCode::IResourceListener&wicket:antiCache=1"
+        )
+        with patch("time.time", return_value=1778300000.5):
+            refreshed = refresh_security_img_url(url)
+        self.assertTrue(refreshed.startswith(url[: url.index("&")] + "&"))
+        self.assertTrue(refreshed.endswith("&wicket:antiCache=1778300000500"))
+        self.assertEqual(1, refreshed.count("antiCache"))
+
+
+class RecodeUrlTest(unittest.TestCase):
+    IMG_URL = (
+        "https://irs.thsrc.com.tw/IMINT/?wicket:interface=:0:BookingS1Form:homeCaptcha:"
+        "passCode::IResourceListener&wicket:antiCache=1"
+    )
+
+    def test_behavior_of_the_recode_link_on_the_same_page(self) -> None:
+        self.assertEqual(
+            "https://irs.thsrc.com.tw/IMINT/?wicket:interface=:0:BookingS1Form:homeCaptcha:"
+            "reCodeLink::IBehaviorListener&wicket:behaviorId=0",
+            recode_url(self.IMG_URL),
+        )
+
+    def test_link_url_is_read_from_the_page(self) -> None:
+        page_url = "https://irs.thsrc.com.tw/IMINT/?locale=tw"
+        panel = (PAGES / "s1_captcha_panel.html").read_text(encoding="utf-8")
+        # Not the URL recode_url() would derive, so the page's own is used.
+        panel = panel.replace("behaviorId=0", "behaviorId=1")
+        expected = (
+            "https://irs.thsrc.com.tw/IMINT/?wicket:interface=:0:BookingS1Form:homeCaptcha:"
+            "reCodeLink::IBehaviorListener&wicket:behaviorId=1"
+        )
+
+        self.assertEqual(expected, find_recode_link(panel, page_url))
+        scanner = SecurityImgScanner(page_url=page_url)
+        scanner.feed_bytes(panel.encode("utf-8"))
+        self.assertEqual(self.IMG_URL[:-1] + "1778300000000", scanner.url)
+        self.assertEqual(expected, scanner.recode_link)
+
+    def test_link_without_ajax_url_is_not_guessed_from_the_page(self) -> None:
+        page = (PAGES / "s1_booking.html").read_text(encoding="utf-8")
+        self.assertIsNone(find_recode_link(page, "https://irs.thsrc.com.tw/IMINT/"))
+
+    def test_image_url_is_read_from_the_ajax_response(self) -> None:
+        response = (
+            '<ajax-response><component id="BookingS1Form_homeCaptcha_passCode"><![CDATA['
+            '<img id="BookingS1Form_homeCaptcha_passCode" src="?wicket:interface=:0:'
+            'BookingS1Form:homeCaptcha:passCode::IResourceListener&amp;wicket:antiCache=7">'
+            "]]></component></ajax-response>"
+        )
+        self.assertEqual(self.IMG_URL[:-1] + "7", recoded_img_url(response, self.IMG_URL))
+
+    def test_response_without_image_falls_back_to_a_new_anti_cache(self) -> None:
+        url = recoded_img_url("<ajax-response></ajax-response>", self.IMG_URL)
+        self.assertNotEqual(self.IMG_URL, url)
+        self.assertTrue(url.startswith(self.IMG_URL[: self.IMG_URL.index("&")]))
+
+
+class CaptchaGateTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.server = StandInIRS(alpn=("http/1.1",), captcha_check=True).start()
+        self.addCleanup(self.server.stop)
+        site = booking_site(self.server.base_url)
+        site.__enter__()
+        self.addCleanup(site.__exit__, None, None, None)
+        self.client = HTTPRequest(ssl_context=self.server.client_ssl_context())
+
+    def first_page(self, confidences, gate=CaptchaGate(0.5, 2)):
+        reads = iter(confidences)
+
+        def read_code(image):
+            return Recognition(image.info["code"], next(reads))
+
+        flow = FirstPageFlow(self.client, PROFILE, verbose=False, captcha_gate=gate)
+        with patch("extra.image_process.read_code", read_code):
+            resp, _ = flow.run()
+        return flow, resp
+
+    def test_low_confidence_read_fetches_another_captcha(self) -> None:
+        flow, resp = self.first_page([0.3, 0.9])
+
+        self.assertEqual(1, flow.captcha_refreshes)
+        self.assertEqual(1, self.server.recode_requests)
+        self.assertEqual(2, self.server.captcha_requests)
+        self.assertIn(b"BookingS2Form", resp.content)
+        # The request went to the link the booking page carries.
+        recode = [r.url for r in self.client.timings.records if r.label == "security_code_recode"]
+        self.assertIsNotNone(self.client.recode_link)
+        self.assertEqual([self.client.recode_link], recode)
+
+    def test_image_alone_keeps_the_same_code(self) -> None:
+        book_page = self.client.request_booking_page()
+        img_url = parse_security_img_url(book_page.content)
+
+        def code(url):
+            img = self.client.request_security_code_img(img_url=url).content
+            return Image.open(io.BytesIO(img)).info["code"]
+
+        first = code(img_url)
+        self.assertEqual(first, code(refresh_security_img_url(img_url)))
+        self.assertNotEqual(first, code(self.client.request_new_security_code(img_url)))
+
+    def test_refreshes_are_capped(self) -> None:
+        flow, resp = self.first_page([0.1, 0.1, 0.1, 0.1])
+
+        self.assertEqual(2, flow.captcha_refreshes)
+        self.assertEqual(2, self.server.recode_requests)
+        self.assertEqual(3, self.server.captcha_requests)
+        # The newest captcha is the one submitted.
+        self.assertIn(b"BookingS2Form", resp.content)
+
+    def test_zero_threshold_submits_every_read(self) -> None:
+        flow, _ = self.first_page([0.1], gate=CaptchaGate(0.0, 2))
+        self.assertEqual(0, flow.captcha_refreshes)
+        self.assertEqual(0, self.server.recode_requests)
+        self.assertEqual(1, self.server.captcha_requests)
+
+
+class LoadTestReportTest(unittest.TestCase):
+    def test_reports_attempts_per_success(self) -> None:
+        report = run(bookings=4, concurrency=2, delay_ms=0, ocr_error_rate=0.0, seed=1)
+        self.assertEqual(4, report["booked"])
+        self.assertEqual(1.0, report["attempts_per_success"])
+        self.assertEqual(4, report["captcha"]["images"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,146 @@
+import json
+import sys
+import tempfile
+import time
+import unittest
+from datetime import date, timedelta
+from pathlib import Path
+from unittest.mock import patch
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "thsr_ticket"))
+sys.path.insert(0, str(ROOT / "benchmarks"))
+
+from controller.booking_flow import BookingFlow  # noqa: E402
+from extra.image_process import Recognition  # noqa: E402
+from irs_standin import StandInIRS, booking_site  # noqa: E402
+from remote.cassette import (  # noqa: E402
+    REDACTED,
+    Cassette,
+    CassetteError,
+    Interaction,
+    record,
+    redact_form,
+    replay,
+    scrub,
+)
+from remote.http_request import HTTPRequest  # noqa: E402
+
+PII = ("A123456789", "0912345678", "user@example.com")
+PROFILE = {
+    "route": {"start": "taipei", "destination": "zuoying"},
+    "trip": {
+        "type": "one_way",
+        "outbound": {
+            "date": (date.today() + timedelta(days=7)).strftime("%Y/%m/%d"),
+            "time": "08:00",
+        },
+    },
+    "tickets": {"adult": 1},
+    "passenger": {"id": PII[0], "phone": PII[1], "email": PII[2]},
+}
+
+
+class RedactionTest(unittest.TestCase):
+    def test_pii_fields_are_redacted(self) -> None:
+        body, secrets = redact_form(
+            "dummyId=A123456789&dummyPhone=0912345678&email=user%40example.com"
+            "&TicketPassengerInfoInputPanel%3ApassengerDataView%3A0%3A"
+            "passengerDataView2%3ApassengerDataIdNumber=B234567890&homeCaptcha=K7P2"
+        )
+        self.assertEqual(
+            ["A123456789", "0912345678", "user@example.com", "B234567890"], secrets
+        )
+        for value in secrets:
+            self.assertNotIn(value, body)
+        self.assertIn(f"dummyId={REDACTED}", body)
+        self.assertIn("homeCaptcha=K7P2", body)
+
+    def test_forms_without_pii_are_kept(self) -> None:
+        self.assertEqual(("a=1&b=2", []), redact_form(b"a=1&b=2"))
+        self.assertEqual((None, []), redact_form(None))
+
+    def test_echoed_values_are_scrubbed(self) -> None:
+        interaction = Interaction(
+            "GET", "https://x/?id=A123456789", None, 200, "OK", [],
+            b"<td>A123456789</td><td>user%40example.com</td>", None, 0.0, 0.0,
+        )
+        scrubbed = scrub(interaction, ["A123456789", "user@example.com"])
+        self.assertEqual(b"<td>REDACTED</td><td>REDACTED</td>", scrubbed.body)
+        self.assertEqual("https://x/?id=REDACTED", scrubbed.url)
+
+
+class RecordReplayTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.path = Path(tempfile.mkdtemp()) / "booking.json"
+
+    def book(self, client: HTTPRequest, base_url: str):
+        with booking_site(base_url), \
+                patch("extra.image_process.read_code", return_value=Recognition("K7P2", None)), \
+                patch("builtins.print"):
+            return BookingFlow(PROFILE, client=client).run()
+
+    def record_booking(self, server: StandInIRS) -> Cassette:
+        server.start()
+        try:
+            client = HTTPRequest(ssl_context=server.client_ssl_context())
+            cassette = record(client, self.path)
+            _, retry = self.book(client, server.base_url)
+        finally:
+            server.stop()
+        self.assertFalse(retry)
+        return cassette
+
+    def test_booking_replays_offline_without_pii(self) -> None:
+        server = StandInIRS(alpn=("http/1.1",), compress=True)
+        recorded = self.record_booking(server)
+        base_url = server.base_url
+
+        text = self.path.read_text(encoding="utf-8")
+        for value in PII:
+            self.assertNotIn(value, text)
+        stored = json.loads(text)["interactions"]
+        self.assertEqual(len(recorded.interactions), len(stored))
+        self.assertEqual("gzip", stored[0]["encoding"])
+
+        # The server is gone; every response comes from the cassette.
+        client = HTTPRequest()
+        adapter = replay(client, Cassette.load(self.path))
+        for _ in range(2):
+            client.reset_session()
+            adapter.rewind()
+            resp, retry = self.book(client, base_url)
+            self.assertFalse(retry)
+            self.assertEqual(302, resp.history[0].status_code)
+            self.assertTrue(adapter.exhausted)
+        self.assertEqual("gzip", client.timings.records[0].encoding)
+
+    def test_other_requests_do_not_match(self) -> None:
+        server = StandInIRS(tls=False)
+        self.record_booking(server)
+        client = HTTPRequest()
+        adapter = replay(client, Cassette.load(self.path))
+        client.request_booking_page()
+        with self.assertRaisesRegex(ConnectionError, "Expected GET .*passCode"):
+            client.request_booking_page()
+
+        adapter.position = len(adapter.cassette.interactions)
+        with self.assertRaises(CassetteError):
+            client.sess.get(server.base_url)
+
+    def test_pace_reproduces_recorded_timing(self) -> None:
+        server = StandInIRS(tls=False, delay=0.05)
+        cassette = self.record_booking(server)
+        first = cassette.interactions[0]
+        self.assertGreaterEqual(first.ttfb, 0.05)
+
+        client = HTTPRequest()
+        replay(client, Cassette.load(self.path), pace=1.0)
+        start = time.perf_counter()
+        with booking_site(server.base_url):
+            client.request_booking_page()
+        self.assertGreaterEqual(time.perf_counter() - start, first.ttfb + first.download)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,141 @@
+import socket
+import sys
+import unittest
+from datetime import date, datetime
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "thsr_ticket"))
+sys.path.insert(0, str(ROOT / "benchmarks"))
+
+from irs_standin import StandInIRS, booking_site  # noqa: E402
+from remote.connection_warmer import (  # noqa: E402
+    ConnectionWarmer,
+    parse_start_time,
+    sales_open_time,
+)
+from remote.http2_adapter import http2_available  # noqa: E402
+from remote.http_request import HTTPRequest  # noqa: E402
+
+
+class WarmUpTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.server = StandInIRS(delay=0.01, alpn=("http/1.1",)).start()
+        self.addCleanup(self.server.stop)
+        site = booking_site(self.server.base_url)
+        site.__enter__()
+        self.addCleanup(site.__exit__, None, None, None)
+        self.client = HTTPRequest(ssl_context=self.server.client_ssl_context())
+
+    def test_first_requests_skip_connection_setup(self) -> None:
+        self.assertEqual((3, 0), self.client.warm_up(3))
+        self.assertEqual(3, self.server.connections)
+
+        page = self.client.request_booking_page()
+        self.client.request_security_code_img(img_url=f"{self.server.base_url}/IMINT/?passCode")
+
+        for timing in self.client.timings.records:
+            self.assertTrue(timing.reused)
+            self.assertEqual((0.0, 0.0, 0.0), (timing.dns, timing.connect, timing.tls))
+        self.assertIn(b"BookingS1Form", page.content)
+        self.assertEqual(3, self.server.connections)
+
+    def test_healthy_connections_are_kept(self) -> None:
+        self.client.warm_up(2)
+        self.client.request_booking_page()
+        self.assertEqual((0, 2), self.client.warm_up(2))
+        self.assertEqual(2, self.server.connections)
+
+    def test_idle_connections_are_replaced(self) -> None:
+        self.client.warm_up(2)
+        self.assertEqual((2, 0), self.client.warm_up(2, max_idle=0))
+        self.assertEqual(4, self.server.connections)
+
+    def test_dropped_connections_are_replaced(self) -> None:
+        self.client.warm_up(2)
+        pool = self.client.sess.get_adapter(self.server.base_url).poolmanager.pools
+        for key in pool.keys():
+            for conn in list(pool[key].pool.queue):
+                if conn is not None:
+                    # Reads now hit EOF, as if the server had closed its end.
+                    socket.socket.shutdown(conn.sock, socket.SHUT_RD)
+        self.assertEqual((2, 0), self.client.warm_up(2))
+
+    def test_pool_size_is_enforced(self) -> None:
+        with self.assertRaises(ValueError):
+            self.client.warm_up(50)
+
+    @unittest.skipUnless(http2_available(), "needs httpx[http2]")
+    def test_http2_transport_is_rejected(self) -> None:
+        client = HTTPRequest(transport="http2", ssl_context=self.server.client_ssl_context())
+        with self.assertRaises(ValueError):
+            client.warm_up()
+
+
+class FakeClient:
+    def __init__(self, clock: "FakeClock") -> None:
+        self.clock = clock
+        self.calls = []
+
+    def warm_up(self, connections, max_idle):
+        self.calls.append(self.clock.now)
+        return 0, connections
+
+
+class FakeClock:
+    def __init__(self, now: float) -> None:
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        assert seconds > 0
+        self.now += seconds
+
+
+class ConnectionWarmerTest(unittest.TestCase):
+    def test_refreshes_during_lead_and_checks_before_target(self) -> None:
+        clock = FakeClock(1000.0)
+        client = FakeClient(clock)
+        ConnectionWarmer(
+            client, lead=30, refresh=10, check_ahead=1, clock=clock, sleep=clock.sleep
+        ).wait_until(1100.0)
+
+        self.assertEqual([1070.0, 1080.0, 1090.0, 1099.0], client.calls)
+        self.assertEqual(1100.0, clock.now)
+
+    def test_failed_warm_up_is_retried(self) -> None:
+        clock = FakeClock(0.0)
+        calls = []
+
+        class FlakyClient:
+            def warm_up(self, connections, max_idle):
+                calls.append(clock.now)
+                if len(calls) == 1:
+                    raise ConnectionError("reset")
+                return 1, 0
+
+        ConnectionWarmer(
+            FlakyClient(), lead=5, refresh=2, clock=clock, sleep=clock.sleep
+        ).wait_until(5.0)
+        self.assertEqual([0.0, 2.0, 4.0], calls)
+
+
+class StartTimeTest(unittest.TestCase):
+    def test_parse(self) -> None:
+        now = datetime(2026, 3, 1, 23, 50)
+        self.assertEqual(datetime(2026, 3, 2, 0, 0), parse_start_time("00:00", now))
+        self.assertEqual(datetime(2026, 3, 1, 23, 59, 30), parse_start_time("23:59:30", now))
+        self.assertEqual(
+            datetime(2026, 3, 29, 0, 0), parse_start_time("2026/03/29 00:00", now)
+        )
+        with self.assertRaises(ValueError):
+            parse_start_time("midnight", now)
+
+    def test_sales_open_time(self) -> None:
+        self.assertEqual(datetime(2026, 3, 2, 0, 0), sales_open_time(date(2026, 3, 30)))
+
+
+if __name__ == "__main__":
+    unittest.main()
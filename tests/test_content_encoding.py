@@ -0,0 +1,212 @@
+import gzip
+import sys
+import threading
+import unittest
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from unittest.mock import patch
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "thsr_ticket"))
+sys.path.insert(0, str(ROOT / "benchmarks"))
+
+import remote.content_encoding as content_encoding  # noqa: E402
+from irs_standin import StandInIRS, booking_site  # noqa: E402
+from remote.content_encoding import accept_encoding, content_decoders  # noqa: E402
+from remote.http2_adapter import http2_available  # noqa: E402
+from remote.http_request import HTTPRequest, html_headers  # noqa: E402
+from remote.request_timing import format_stage_bytes  # noqa: E402
+
+PAGE = (ROOT / "tests" / "fixtures" / "pages" / "s1_booking.html").read_bytes()
+
+
+def decode(content_encoding_header: str, data: bytes, chunk: int = 100) -> bytes:
+    decoders = content_decoders(content_encoding_header)
+    out = b""
+    for i in range(0, len(data), chunk):
+        out += content_encoding._decode(decoders, data[i : i + chunk])
+    return out + content_encoding._flush(decoders)
+
+
+class AcceptEncodingTest(unittest.TestCase):
+    def test_only_decodable_encodings_are_offered(self) -> None:
+        with patch.object(content_encoding, "brotli", None), patch.object(
+            content_encoding, "zstandard", None
+        ):
+            self.assertEqual("gzip, deflate;q=0.9", accept_encoding("gzip, deflate, br"))
+
+    def test_fastest_decoder_is_preferred(self) -> None:
+        with patch.object(content_encoding, "brotli", object()), patch.object(
+            content_encoding, "zstandard", object()
+        ):
+            self.assertEqual(
+                "zstd, br;q=0.9, gzip;q=0.8",
+                accept_encoding("gzip, br, zstd"),
+            )
+
+    def test_identity_when_nothing_is_decodable(self) -> None:
+        with patch.object(content_encoding, "brotli", None):
+            self.assertEqual("identity", accept_encoding("br"))
+
+    def test_request_headers_use_negotiated_value(self) -> None:
+        with patch.object(content_encoding, "brotli", None):
+            self.assertNotIn("br", html_headers()["Accept-Encoding"])
+
+
+class DecoderTest(unittest.TestCase):
+    def test_gzip(self) -> None:
+        self.assertEqual(PAGE, decode("gzip", gzip.compress(PAGE)))
+
+    def test_concatenated_gzip_members(self) -> None:
+        data = gzip.compress(PAGE[:1000]) + gzip.compress(PAGE[1000:])
+        self.assertEqual(PAGE, decode("gzip", data))
+
+    def test_deflate_zlib_and_raw(self) -> None:
+        self.assertEqual(PAGE, decode("deflate", zlib.compress(PAGE)))
+        raw = zlib.compressobj(wbits=-zlib.MAX_WBITS)
+        self.assertEqual(PAGE, decode("deflate", raw.compress(PAGE) + raw.flush()))
+
+    def test_stacked_encodings_are_undone_in_reverse(self) -> None:
+        data = gzip.compress(zlib.compress(PAGE))
+        self.assertEqual(PAGE, decode("deflate, gzip", data))
+
+    def test_unknown_encoding_is_left_alone(self) -> None:
+        self.assertIsNone(content_decoders("compress"))
+        with patch.object(content_encoding, "brotli", None):
+            self.assertIsNone(content_decoders("br"))
+        self.assertEqual([], content_decoders("identity"))
+
+
+class StageBytesTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.server = StandInIRS(alpn=("http/1.1",), compress=True).start()
+        self.addCleanup(self.server.stop)
+        site = booking_site(self.server.base_url)
+        site.__enter__()
+        self.addCleanup(site.__exit__, None, None, None)
+        self.clients = []
+
+    def tearDown(self) -> None:
+        for client in self.clients:
+            client.sess.close()
+
+    def client(self, transport: str = "http1", server=None) -> HTTPRequest:
+        server = server or self.server
+        client = HTTPRequest(transport=transport, ssl_context=server.client_ssl_context())
+        self.clients.append(client)
+        return client
+
+    def test_gzip_page_is_counted_before_and_after_decoding(self) -> None:
+        client = self.client()
+        page = client.request_booking_page()
+        client.request_security_code_img(img_url=f"{self.server.base_url}/IMINT/?passCode")
+
+        html, image = client.timings.records
+        self.assertEqual("gzip", html.encoding)
+        self.assertEqual(len(page.content), html.content_bytes)
+        self.assertLess(html.body_bytes, html.content_bytes / 3)
+        self.assertGreater(html.decode, 0)
+        self.assertIn(b"BookingS1Form", page.content)
+
+        self.assertIsNone(image.encoding)
+        self.assertEqual(image.body_bytes, image.content_bytes)
+
+        stages = client.attempt_summary()["stages"]
+        self.assertEqual(["gzip"], stages["booking_page"]["encodings"])
+        self.assertEqual(html.body_bytes, stages["booking_page"]["body_bytes"])
+        lines = format_stage_bytes(client.attempt_summary())
+        self.assertTrue(lines[0].startswith(f"booking_page: {html.body_bytes} B on the wire"))
+
+    def test_streamed_captcha_scan_decodes_gzip(self) -> None:
+        seen = []
+        page = self.client().request_booking_page(on_captcha_url=seen.append)
+        self.assertEqual(1, len(seen))
+        self.assertIn("passCode", seen[0])
+        self.assertIn(b"BookingS1Form", page.content)
+
+    @unittest.skipUnless(http2_available(), "needs httpx[http2]")
+    def test_http2_reports_wire_bytes(self) -> None:
+        server = StandInIRS(alpn=("h2",), compress=True).start()
+        self.addCleanup(server.stop)
+        with booking_site(server.base_url):
+            client = self.client("http2", server)
+            page = client.request_booking_page()
+
+        timing = client.timings.records[-1]
+        self.assertEqual("gzip", timing.encoding)
+        self.assertEqual(len(page.content), timing.content_bytes)
+        self.assertLess(timing.body_bytes, timing.content_bytes)
+        self.assertIsNone(timing.decode)
+
+
+class BrokenBodyServer(ThreadingHTTPServer):
+    # Sends the headers and part of the body, then stalls, hangs up or
+    # sends bytes that are not gzip, as `mode` says.
+    daemon_threads = True
+
+    def __init__(self, mode: str) -> None:
+        super().__init__(("127.0.0.1", 0), BrokenBodyHandler)
+        self.mode = mode
+        self.release = threading.Event()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}/IMINT/?passCode"
+
+
+class BrokenBodyHandler(BaseHTTPRequestHandler):
+    def do_GET(self) -> None:
+        mode = self.server.mode
+        # A gzip header naming an unknown compression method.
+        body = b"\x1f\x8b\x09" + b"\x00" * 20 if mode == "corrupt" else b"x" * 100
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)) if mode == "corrupt" else "1000")
+        if mode == "corrupt":
+            self.send_header("Content-Encoding", "gzip")
+        self.end_headers()
+        self.wfile.write(body)
+        self.wfile.flush()
+        if mode == "stall":
+            self.server.release.wait(5)
+        self.close_connection = True
+
+    def log_message(self, format: str, *args) -> None:
+        pass
+
+
+class BrokenBodyTest(unittest.TestCase):
+    def serve(self, mode: str) -> BrokenBodyServer:
+        server = BrokenBodyServer(mode)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        self.addCleanup(server.release.set)
+        return server
+
+    def test_stall_mid_body_is_a_timeout(self) -> None:
+        server = self.serve("stall")
+        client = HTTPRequest(timeout=0.3)
+        self.addCleanup(client.sess.close)
+        with self.assertRaises(TimeoutError):
+            client.request_security_code_img(img_url=server.url)
+
+    def test_dropped_connection_mid_body_is_a_connection_error(self) -> None:
+        server = self.serve("drop")
+        client = HTTPRequest()
+        self.addCleanup(client.sess.close)
+        with self.assertRaisesRegex(ConnectionError, "Request Error"):
+            client.request_security_code_img(img_url=server.url)
+
+    def test_undecodable_body_is_a_connection_error(self) -> None:
+        server = self.serve("corrupt")
+        client = HTTPRequest()
+        self.addCleanup(client.sess.close)
+        with self.assertRaisesRegex(ConnectionError, "Request Error"):
+            client.request_security_code_img(img_url=server.url)
+        self.assertEqual("ContentDecodingError", client.timings.records[-1].error)
+
+
+if __name__ == "__main__":
+    unittest.main()
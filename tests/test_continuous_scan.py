@@ -9,6 +9,7 @@ ROOT = Path(__file__).resolve().parents[1]
 sys.path.insert(0, str(ROOT / "thsr_ticket"))
 
 import main as app_main
+from controller.booking_flow import SiteError
 
 
 class ContinuousScanIntegrationTest(unittest.TestCase):
@@ -43,16 +44,25 @@ class ContinuousScanIntegrationTest(unittest.TestCase):
                 "email": "user@example.com",
             },
         }
+        # main() resolves the real booking host ahead; keep the tests offline.
+        patcher = patch.object(app_main.HTTPRequest, "prefetch_dns")
+        self.prefetch_dns = patcher.start()
+        self.addCleanup(patcher.stop)
 
     def test_keep_scanning_until_booking_success(self) -> None:
         calls = {"count": 0}
+        clients = []
 
         class FakeBookingFlow:
-            def __init__(self, user_profile: dict, verbose: bool = False) -> None:
+            def __init__(
+                self, user_profile: dict, verbose: bool = False, client=None, captcha_gate=None
+            ) -> None:
                 self.user_profile = user_profile
                 self.verbose = verbose
+                self.client = client
 
             def run(self):
+                clients.append(self.client)
                 calls["count"] += 1
                 if calls["count"] < 3:
                     return None, True
@@ -73,14 +83,53 @@ class ContinuousScanIntegrationTest(unittest.TestCase):
                     )
 
         self.assertEqual(3, calls["count"])
-        # main() sleeps once per loop iteration, including the final success iteration.
-        self.assertEqual(3, mock_sleep.call_count)
+        self.assertEqual(1, self.prefetch_dns.call_count)
+        self.assertIsNotNone(clients[0])
+        self.assertTrue(all(client is clients[0] for client in clients))
+        # main() sleeps only between failed attempts, not after the booking.
+        self.assertEqual(2, mock_sleep.call_count)
+
+    def test_retry_delay_follows_failure_class(self) -> None:
+        errors = [SiteError("Error during first page handling."), TimeoutError("slow")]
+
+        class FailingBookingFlow:
+            def __init__(
+                self, user_profile: dict, verbose: bool = False, client=None, captcha_gate=None
+            ) -> None:
+                self.last_error = None
+
+            def run(self):
+                if not errors:
+                    return {"pnr": "01364429"}, False
+                self.last_error = errors.pop(0)
+                return None, True
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            profile_path = Path(tmpdir) / "profile.json"
+            profile_path.write_text(
+                json.dumps(self.profile, ensure_ascii=False), encoding="utf-8"
+            )
+
+            with patch.object(app_main, "BookingFlow", FailingBookingFlow):
+                with patch.object(app_main.time, "sleep") as mock_sleep:
+                    app_main.main(
+                        test_mode=True,
+                        test_file=str(profile_path),
+                        verbose=False,
+                    )
+
+        site_delay, timeout_delay = [call.args[0] for call in mock_sleep.call_args_list]
+        self.assertTrue(0.5 <= site_delay <= 1.5)
+        self.assertTrue(1.0 <= timeout_delay <= 3.0)
 
     def test_stop_immediately_when_flow_raises(self) -> None:
         class BrokenBookingFlow:
-            def __init__(self, user_profile: dict, verbose: bool = False) -> None:
+            def __init__(
+                self, user_profile: dict, verbose: bool = False, client=None, captcha_gate=None
+            ) -> None:
                 self.user_profile = user_profile
                 self.verbose = verbose
+                self.client = client
 
             def run(self):
                 raise RuntimeError("network down")
@@ -101,6 +150,36 @@ class ContinuousScanIntegrationTest(unittest.TestCase):
 
         self.assertEqual(0, mock_sleep.call_count)
 
+    def test_cookies_are_reset_before_each_attempt(self) -> None:
+        seen = []
+
+        class CookieBookingFlow:
+            def __init__(
+                self, user_profile: dict, verbose: bool = False, client=None, captcha_gate=None
+            ) -> None:
+                self.client = client
+
+            def run(self):
+                seen.append(self.client.sess.cookies.get("JSESSIONID"))
+                self.client.sess.cookies.set("JSESSIONID", f"session-{len(seen)}")
+                return None, len(seen) < 2
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            profile_path = Path(tmpdir) / "profile.json"
+            profile_path.write_text(
+                json.dumps(self.profile, ensure_ascii=False), encoding="utf-8"
+            )
+
+            with patch.object(app_main, "BookingFlow", CookieBookingFlow):
+                with patch.object(app_main.time, "sleep"):
+                    app_main.main(
+                        test_mode=True,
+                        test_file=str(profile_path),
+                        verbose=False,
+                    )
+
+        self.assertEqual([None, None], seen)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -1,11 +1,16 @@
 import sys
 import unittest
 from pathlib import Path
+from unittest.mock import patch
 
 ROOT = Path(__file__).resolve().parents[1]
 sys.path.insert(0, str(ROOT / "thsr_ticket"))
 
-from view_model.error_feedback import ErrorFeedback
+import html_parser  # noqa: E402
+from html_parser import ParsedPage, parse_html  # noqa: E402
+from view_model.error_feedback import ErrorFeedback  # noqa: E402
+
+FIXTURES = ROOT / "tests" / "fixtures" / "pages"
 
 
 class ErrorFeedbackTest(unittest.TestCase):
@@ -23,6 +28,32 @@ class ErrorFeedbackTest(unittest.TestCase):
 
         self.assertEqual(["Server has internal error."], [err.msg for err in errors])
 
+    def test_page_without_markers_is_not_parsed(self) -> None:
+        page = ParsedPage((FIXTURES / "s2_one_way.html").read_bytes())
+
+        with patch.object(html_parser, "_parse", wraps=html_parser._parse) as parse:
+            errors = ErrorFeedback().parse(page)
+
+        self.assertEqual([], errors)
+        parse.assert_not_called()
+        self.assertFalse(page.is_parsed)
+
+    def test_marker_outside_error_element_falls_back_to_tree(self) -> None:
+        html = b"<style>.feedbackPanelERROR { color: red; }</style><p>ok</p>"
+
+        self.assertTrue(ErrorFeedback().may_have_errors(html))
+        self.assertEqual([], ErrorFeedback().parse(html))
+
+    def test_fast_path_agrees_with_tree_on_recorded_pages(self) -> None:
+        pages = sorted(FIXTURES.glob("*.html"))
+        self.assertTrue(pages)
+        for path in pages:
+            with self.subTest(page=path.name):
+                html = path.read_bytes()
+                structural = ErrorFeedback().parse(parse_html(html))
+                self.assertEqual(structural, ErrorFeedback().parse(html))
+                self.assertEqual(structural, ErrorFeedback().parse(html.decode("utf-8")))
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,131 @@
+import sys
+import threading
+import unittest
+from datetime import date, timedelta
+from pathlib import Path
+from unittest.mock import patch
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "thsr_ticket"))
+sys.path.insert(0, str(ROOT / "benchmarks"))
+
+from controller.first_page_flow import FirstPageFlow  # noqa: E402
+from extra.image_process import Recognition  # noqa: E402
+from html_parser import ParsedPage  # noqa: E402
+from irs_standin import (  # noqa: E402
+    AJAX_RECODE_LINK,
+    RECODE_LINK,
+    RECORDED_SESSION,
+    StandInIRS,
+    booking_site,
+)
+from remote.http_request import (  # noqa: E402
+    HTTPRequest,
+    SecurityImgScanner,
+    parse_security_img_url,
+)
+
+FIXTURES = ROOT / "tests" / "fixtures" / "pages"
+PROFILE = {
+    "route": {"start": "taipei", "destination": "zuoying"},
+    "trip": {
+        "type": "one_way",
+        "outbound": {
+            "date": (date.today() + timedelta(days=7)).strftime("%Y/%m/%d"),
+            "time": "08:00",
+        },
+    },
+    "tickets": {"adult": 1},
+}
+
+
+class SecurityImgScannerTest(unittest.TestCase):
+    def test_finds_the_same_url_as_the_tree_in_small_chunks(self) -> None:
+        html = (FIXTURES / "s1_booking.html").read_bytes()
+        scanner = SecurityImgScanner()
+        found_at = None
+        for start in range(0, len(html), 512):
+            if scanner.feed_bytes(html[start:start + 512]) and found_at is None:
+                found_at = start
+
+        self.assertEqual(parse_security_img_url(ParsedPage(html)), scanner.url)
+        self.assertLess(found_at, len(html) - 512)
+
+    def test_pages_without_captcha_yield_none(self) -> None:
+        html = (FIXTURES / "s2_one_way.html").read_bytes()
+        self.assertIsNone(SecurityImgScanner().feed_bytes(html))
+
+
+class FirstPageFlowOverlapTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.server = StandInIRS().start()
+        self.addCleanup(self.server.stop)
+        site = booking_site(self.server.base_url)
+        site.__enter__()
+        self.addCleanup(site.__exit__, None, None, None)
+        self.client = HTTPRequest(ssl_context=self.server.client_ssl_context())
+
+    def test_streamed_booking_page_reports_captcha_url_once(self) -> None:
+        urls = []
+        resp = self.client.request_booking_page(on_captcha_url=urls.append)
+
+        self.assertEqual(1, len(urls))
+        session = self.client.sess.cookies["JSESSIONID"].encode()
+        recorded = (FIXTURES / "s1_booking.html").read_bytes()
+        served = RECODE_LINK.sub(lambda _: AJAX_RECODE_LINK, recorded)
+        self.assertEqual(served.replace(RECORDED_SESSION, session), resp.content)
+        self.assertEqual(parse_security_img_url(ParsedPage(resp.content)), urls[0])
+        self.assertIn("reCodeLink::IBehaviorListener", self.client.recode_link)
+
+    def test_captcha_is_read_while_form_fields_are_composed(self) -> None:
+        flow = FirstPageFlow(self.client, PROFILE, verbose=False)
+        composed = threading.Event()
+        compose = flow.compose_page_fields
+
+        def compose_page_fields(page):
+            data = compose(page)
+            composed.set()
+            return data
+
+        def recognize_security_code(img: bytes) -> Recognition:
+            # Only finishes if the form is composed while OCR is still running.
+            self.assertTrue(composed.wait(timeout=5))
+            self.assertEqual(self.server.captcha, img)
+            return Recognition("ABCD", None)
+
+        with patch.object(flow, "compose_page_fields", compose_page_fields), \
+                patch.object(flow, "recognize_security_code", recognize_security_code):
+            resp, model = flow.run()
+
+        self.assertEqual(200, resp.status_code)
+        self.assertEqual("ABCD", model.security_code)
+        paths = [path for _, path, _ in self.server.requests]
+        self.assertIn("passCode", paths[1])
+
+    def test_form_error_does_not_wait_for_the_captcha(self) -> None:
+        flow = FirstPageFlow(self.client, PROFILE, verbose=False)
+        release = threading.Event()
+        reported = threading.Event()
+
+        def compose_page_fields(page):
+            raise ValueError("Layout changed")
+
+        def recognize_security_code(img: bytes) -> Recognition:
+            release.wait(timeout=5)
+            raise RuntimeError("OCR broke")
+
+        with patch.object(flow, "compose_page_fields", compose_page_fields), \
+                patch.object(flow, "recognize_security_code", recognize_security_code), \
+                patch("builtins.print", side_effect=lambda *a, **kw: reported.set()) as log:
+            with self.assertRaisesRegex(ValueError, "Layout changed"):
+                flow.run()
+            # The captcha job was still running when the error came out.
+            self.assertFalse(reported.is_set())
+            release.set()
+            self.assertTrue(reported.wait(timeout=5))
+
+        self.assertIn("OCR broke", log.call_args[0][0])
+
+
+if __name__ == "__main__":
+    unittest.main()
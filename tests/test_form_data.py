@@ -7,7 +7,10 @@ from bs4 import BeautifulSoup
 ROOT = Path(__file__).resolve().parents[1]
 sys.path.insert(0, str(ROOT / "thsr_ticket"))
 
-from controller.form_data import compose_form_defaults, parse_form_action
+from controller.form_data import compose_form_defaults, parse_form_action, read_form
+from html_parser import ParsedPage, parse_html
+
+FIXTURES = ROOT / "tests" / "fixtures" / "pages"
 
 
 class FormDataTest(unittest.TestCase):
@@ -73,6 +76,49 @@ class FormDataTest(unittest.TestCase):
             action,
         )
 
+    def test_read_form_returns_defaults_and_action(self) -> None:
+        html = b"""
+        <html><head><script>var layout = 1;</script></head><body>
+          <div class="nav"><input name="search" value="outside"></div>
+          <form id="f" action="/s3"><input type="hidden" name="hf" value="1"></form>
+        </body></html>
+        """
+
+        data, action = read_form(html, "f")
+
+        self.assertEqual({"hf": "1"}, data)
+        self.assertEqual("/s3", action)
+
+    def test_form_scope_skips_nodes_outside_forms(self) -> None:
+        page = ParsedPage(
+            b"<div><p>layout</p><form id='a'><input name='x'></form>"
+            b"<script>1</script><form id='b'></form></div>"
+        )
+
+        forms = page.forms
+
+        self.assertFalse(page.is_parsed)
+        self.assertEqual(["form", "form"], [tag.name for tag in forms.contents])
+        self.assertIs(page.soup, page.forms)
+
+    def test_form_scope_matches_full_parse_on_recorded_pages(self) -> None:
+        pages = {
+            "s1_booking.html": "BookingS1Form",
+            "s2_round_trip.html": "BookingS2Form",
+            "s3_ticket.html": "BookingS3Form",
+            "s3_ticket_early_bird.html": "BookingS3FormSP",
+        }
+        for name, form_id in pages.items():
+            with self.subTest(page=name):
+                html = (FIXTURES / name).read_bytes()
+                full = parse_html(html)
+                expected = (
+                    compose_form_defaults(full, form_id),
+                    parse_form_action(full, form_id),
+                )
+                self.assertEqual(expected, read_form(html, form_id))
+                self.assertEqual(expected, read_form(ParsedPage(html), form_id))
+
 
 if __name__ == "__main__":
     unittest.main()
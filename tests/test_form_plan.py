@@ -0,0 +1,97 @@
+import sys
+import unittest
+from pathlib import Path
+
+from bs4 import BeautifulSoup
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "thsr_ticket"))
+
+from controller.form_plan import (  # noqa: E402
+    BookingMethod,
+    FormPlanCache,
+    layout_fingerprint,
+    load_form_plan,
+)
+from html_parser import ParsedPage  # noqa: E402
+
+FIXTURES = ROOT / "tests" / "fixtures" / "pages"
+
+
+def s1_page(html: str) -> BeautifulSoup:
+    return BeautifulSoup(html, features="html.parser")
+
+
+class FormPlanTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.html = (FIXTURES / "s1_booking.html").read_text(encoding="utf-8")
+
+    def test_plan_reads_layout_of_recorded_page(self) -> None:
+        plan = load_form_plan(s1_page(self.html), "BookingS1Form")
+
+        self.assertEqual(5, len(plan.ticket_amounts))
+        self.assertIn("1F", plan.ticket_amounts["ticketPanel:rows:0:ticketAmount"])
+        self.assertIn("1201A", plan.time_slots["toTimeTable"])
+        self.assertIn(
+            BookingMethod("radio31", "search-by-time", True), plan.booking_methods
+        )
+
+    def test_layout_change_is_read_from_the_page(self) -> None:
+        changed = self.html.replace(
+            '<option value="1P">1</option>',
+            '<option value="1P">1</option><option value="9P">9</option>',
+        )
+        self.assertNotEqual(self.html, changed)
+        plan = load_form_plan(s1_page(changed), "BookingS1Form")
+
+        self.assertIn("9P", plan.ticket_amounts["ticketPanel:rows:4:ticketAmount"])
+
+    def test_option_lists_are_immutable(self) -> None:
+        plan = load_form_plan(s1_page(self.html), "BookingS1Form")
+
+        self.assertIsInstance(plan.time_slots["toTimeTable"], tuple)
+        self.assertIsInstance(plan.ticket_amounts["ticketPanel:rows:0:ticketAmount"], tuple)
+        self.assertIsInstance(plan.booking_methods, tuple)
+
+
+class FormPlanCacheTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.html = (FIXTURES / "s1_booking.html").read_bytes()
+        self.cache = FormPlanCache(max_size=2)
+
+    def load(self, html: bytes):
+        return self.cache.load(ParsedPage(html), "BookingS1Form")
+
+    def test_new_session_reuses_the_plan(self) -> None:
+        plan = self.load(self.html)
+        other_session = self.html.replace(b"0000ANONYMISEDSESSION0000", b"1234SESSION").replace(
+            b'name="backHome" value=""', b'name="backHome" value="1"'
+        )
+
+        self.assertIs(plan, self.load(other_session))
+        self.assertEqual((1, 1), (self.cache.hits, self.cache.misses))
+        self.assertEqual(load_form_plan(s1_page(self.html.decode()), "BookingS1Form"), plan)
+
+    def test_layout_change_builds_a_new_plan(self) -> None:
+        plan = self.load(self.html)
+        added = self.html.replace(
+            b'<option value="1P">1</option>',
+            b'<option value="1P">1</option><option value="9P">9</option>',
+        )
+        moved = self.html.replace(
+            b'value="radio31" checked="checked"', b'value="radio31"'
+        ).replace(b'value="radio33"', b'value="radio33" checked="checked"')
+
+        self.assertIn("9P", self.load(added).ticket_amounts["ticketPanel:rows:4:ticketAmount"])
+        self.assertNotEqual(plan.booking_methods, self.load(moved).booking_methods)
+        self.assertEqual((0, 3, 2), (self.cache.hits, self.cache.misses, len(self.cache)))
+
+    def test_page_without_the_form_is_not_cached(self) -> None:
+        other_form = b"<html><form id='other'></form></html>"
+        self.assertIsNone(layout_fingerprint(other_form, "BookingS1Form"))
+        self.load(b"<html></html>")
+        self.assertEqual(0, len(self.cache))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,106 @@
+import sys
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "thsr_ticket"))
+
+import html_parser
+from html_parser import (
+    ParsedPage,
+    available_parser_backends,
+    declared_encoding,
+    parse_html,
+    set_parser_backend,
+)
+from view_model.avail_trains import AvailTrains
+
+
+class FakeResponse:
+    def __init__(self, content: bytes, content_type: str = "text/html") -> None:
+        self.content = content
+        self.headers = {"Content-Type": content_type}
+
+
+class ParsedPageTest(unittest.TestCase):
+    def test_soup_is_built_lazily_and_once(self) -> None:
+        page = ParsedPage(b"<form id='f'></form>")
+
+        with patch.object(html_parser, "_parse", wraps=html_parser._parse) as parse:
+            self.assertFalse(page.is_parsed)
+            first = page.soup
+            second = parse_html(page)
+
+        self.assertIs(first, second)
+        self.assertTrue(page.is_parsed)
+        parse.assert_called_once()
+
+    def test_parse_html_returns_existing_soup(self) -> None:
+        soup = parse_html(b"<p>hello</p>")
+
+        self.assertIs(soup, parse_html(soup))
+
+    def test_from_response_keeps_response(self) -> None:
+        resp = FakeResponse(b"<p>hello</p>")
+        page = ParsedPage.from_response(resp)
+
+        self.assertIs(resp, page.response)
+        self.assertEqual(b"<p>hello</p>", page.content)
+
+
+class EncodingTest(unittest.TestCase):
+    def tearDown(self) -> None:
+        set_parser_backend(None)
+
+    def test_only_explicit_charset_is_declared(self) -> None:
+        self.assertEqual("big5", declared_encoding(FakeResponse(b"", "text/html; charset=Big5")))
+        self.assertIsNone(declared_encoding(FakeResponse(b"", "text/html")))
+        self.assertIsNone(declared_encoding(FakeResponse(b"", "text/html; charset=nope")))
+        self.assertIsNone(declared_encoding(object()))
+
+    def test_declared_charset_reaches_every_backend(self) -> None:
+        html = "<form id='f'><p>早鳥</p></form>".encode("big5")
+        for backend in available_parser_backends():
+            with self.subTest(backend=backend):
+                set_parser_backend(backend)
+                page = ParsedPage.from_response(
+                    FakeResponse(html, "text/html; charset=big5")
+                )
+                self.assertEqual("早鳥", page.soup.p.text)
+                self.assertEqual("早鳥", page.forms.p.text)
+
+    def test_incremental_backend_receives_raw_bytes(self) -> None:
+        if "lxml" not in available_parser_backends():
+            self.skipTest("lxml is not installed")
+        html = "<p>早鳥</p>".encode("utf-8")
+
+        page = parse_html(html, backend="lxml")
+
+        # original_encoding is only set when bs4 decodes the bytes itself.
+        self.assertEqual("utf-8", page.original_encoding)
+        self.assertIsNone(parse_html(html, backend="html.parser").original_encoding)
+
+    def test_invalid_bytes_are_replaced(self) -> None:
+        html = b"<p id='x'>ok\xff</p>"
+        for backend in available_parser_backends():
+            with self.subTest(backend=backend):
+                page = parse_html(html, backend=backend)
+                self.assertEqual("ok\ufffd", page.find(id="x").text)
+
+    def test_streaming_train_scan_uses_declared_charset(self) -> None:
+        html = """
+        <label><input name="TrainQueryDataViewPanel:TrainGroup" type="radio"
+          value="v" QueryCode="1" QueryDeparture="08:00" QueryArrival="09:00">
+          <div class="discount"><p class="type">早鳥65折</p></div></label>
+        """.encode("big5")
+        page = ParsedPage.from_response(FakeResponse(html, "text/html; charset=big5"))
+
+        trains = AvailTrains().parse(page)
+
+        self.assertEqual(["早鳥65折"], trains[0].discount_tags)
+        self.assertFalse(page.is_parsed)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,102 @@
+import ssl
+import sys
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+import requests
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "thsr_ticket"))
+sys.path.insert(0, str(ROOT / "benchmarks"))
+
+from remote import http2_adapter  # noqa: E402
+from remote.http2_adapter import http2_available  # noqa: E402
+from remote.http_request import HTTPRequest  # noqa: E402
+
+TLS_FIXTURES = ROOT / "tests" / "fixtures" / "tls"
+
+
+class TransportOptionTest(unittest.TestCase):
+    def test_unknown_transport_is_rejected(self) -> None:
+        with self.assertRaises(ValueError):
+            HTTPRequest(transport="http3")
+
+
+@unittest.skipUnless(http2_available(), "httpx[http2] is not installed")
+class HTTP2AdapterTest(unittest.TestCase):
+    def setUp(self) -> None:
+        from irs_standin import StandInIRS
+
+        self.StandInIRS = StandInIRS
+        self.clients = []
+
+    def tearDown(self) -> None:
+        for client in self.clients:
+            client.sess.close()
+
+    def client(self, server, max_retries=3, context=None):
+        if context is None:
+            context = server.client_ssl_context()
+        client = HTTPRequest(transport="http2", max_retries=max_retries, ssl_context=context)
+        self.clients.append(client)
+        return client
+
+    def get_booking_page(self, server, max_retries=3, context=None, verify=True):
+        client = self.client(server, max_retries, context)
+        resp = client.sess.get(f"{server.base_url}/IMINT/?locale=tw", timeout=5, verify=verify)
+        return client, resp
+
+    def test_negotiates_h2_and_keeps_cookies(self) -> None:
+        with self.StandInIRS() as server:
+            client, resp = self.get_booking_page(server)
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.raw.http_version, "HTTP/2")
+        self.assertIn("BookingS1Form", resp.text)
+        self.assertTrue(client.sess.cookies.get("JSESSIONID", "").startswith("STANDIN"))
+        self.assertEqual(server.requests[0][2], "HTTP/2")
+
+    def test_falls_back_to_http1_without_h2(self) -> None:
+        with self.StandInIRS(alpn=("http/1.1",)) as server:
+            client, resp = self.get_booking_page(server)
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.raw.http_version, "HTTP/1.1")
+        self.assertIn("JSESSIONID", client.sess.cookies)
+        self.assertEqual(server.requests[0][2], "HTTP/1.1")
+
+    def test_gets_are_retried_on_server_errors(self) -> None:
+        with self.StandInIRS(availability=0.0) as server:
+            with patch.object(http2_adapter.time, "sleep") as sleep:
+                _, resp = self.get_booking_page(server, max_retries=2)
+
+        self.assertEqual(resp.status_code, 503)
+        self.assertEqual(3, len(server.requests))
+        # The stand-in asks for Retry-After: 1.
+        self.assertEqual(2, sleep.call_count)
+        self.assertTrue(all(call.args[0] >= 1.0 for call in sleep.call_args_list))
+
+    def test_posts_are_not_retried(self) -> None:
+        with self.StandInIRS(availability=0.0) as server:
+            client = self.client(server, max_retries=2)
+            resp = client.sess.post(f"{server.base_url}/IMINT/", data={"a": "1"}, timeout=5)
+
+        self.assertEqual(resp.status_code, 503)
+        self.assertEqual(1, len(server.requests))
+
+    def test_verify_argument_is_honoured(self) -> None:
+        untrusted = ssl.create_default_context()
+        with self.StandInIRS() as server:
+            with self.assertRaises(requests.exceptions.ConnectionError):
+                self.get_booking_page(server, max_retries=0, context=untrusted)
+            _, unverified = self.get_booking_page(server, context=untrusted, verify=False)
+            _, bundle = self.get_booking_page(
+                server, context=untrusted, verify=str(TLS_FIXTURES / "localhost.pem")
+            )
+
+        self.assertEqual([200, 200], [unverified.status_code, bundle.status_code])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,105 @@
+import subprocess
+import sys
+import threading
+import types
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+from PIL import Image
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "thsr_ticket"))
+
+from extra import image_process  # noqa: E402
+
+
+class SlowModel:
+    builds = 0
+
+    def __init__(self, release: threading.Event) -> None:
+        release.wait(5)
+        SlowModel.builds += 1
+
+    def classification(self, image):
+        return {"charsets": ["K", "7", "P", "2"]}
+
+
+class LazyModelTest(unittest.TestCase):
+    def setUp(self) -> None:
+        # Flows run by earlier tests may still be loading the real model.
+        if image_process._warming is not None:
+            image_process._warming.join()
+        self.release = threading.Event()
+        SlowModel.builds = 0
+        fake = types.ModuleType("ddddocr")
+        fake.DdddOcr = lambda show_ad: SlowModel(self.release)  # type: ignore[attr-defined]
+        for target in (
+            patch.dict(sys.modules, {"ddddocr": fake}),
+            patch.object(image_process, "_ocr", None),
+            patch.object(image_process, "_warming", None),
+        ):
+            target.start()
+            self.addCleanup(target.stop)
+
+    def test_import_does_not_load_the_model(self) -> None:
+        code = (
+            "import sys; sys.path.insert(0, 'thsr_ticket'); "
+            "import controller.first_page_flow; print('ddddocr' in sys.modules)"
+        )
+        out = subprocess.run(
+            [sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True
+        )
+        self.assertEqual("False", out.stdout.strip())
+
+    def test_exit_during_warm_up_waits_for_the_load(self) -> None:
+        # Exiting while onnxruntime is still importing aborts the interpreter
+        # (exit code 134). atexit hooks run after non-daemon threads end.
+        code = (
+            "import atexit, sys; sys.path.insert(0, 'thsr_ticket'); "
+            "from extra import image_process; image_process.warm_up(); "
+            "atexit.register(lambda: print(image_process.model_loaded()))"
+        )
+        out = subprocess.run(
+            [sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True
+        )
+        self.assertEqual((0, "True"), (out.returncode, out.stdout.strip()), out.stderr)
+
+    def test_warm_up_loads_in_the_background_once(self) -> None:
+        thread = image_process.warm_up()
+        self.assertIsNotNone(thread)
+        self.assertIsNone(image_process.warm_up())
+        self.assertFalse(image_process.model_loaded())
+
+        # The first captcha waits for the load already under way.
+        result = []
+        reader = threading.Thread(
+            target=lambda: result.append(image_process.verify_code(Image.new("RGB", (4, 4))))
+        )
+        reader.start()
+        self.release.set()
+        thread.join(5)
+        reader.join(5)
+
+        self.assertEqual(["K7P2"], result)
+        self.assertEqual(1, SlowModel.builds)
+        self.assertIsNone(image_process.warm_up())
+
+    def test_failed_warm_up_is_retried_on_use(self) -> None:
+        broken = types.ModuleType("ddddocr")
+
+        def fail(show_ad):
+            raise RuntimeError("model missing")
+
+        broken.DdddOcr = fail  # type: ignore[attr-defined]
+        with patch.dict(sys.modules, {"ddddocr": broken}), patch("builtins.print") as log:
+            image_process.warm_up().join(5)
+        self.assertIn("W: Could not load the OCR model", log.call_args[0][0])
+        self.assertFalse(image_process.model_loaded())
+
+        self.release.set()
+        self.assertEqual("K7P2", image_process.verify_code(Image.new("RGB", (4, 4))))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,93 @@
+import sys
+import unittest
+from datetime import date, timedelta
+from pathlib import Path
+from unittest.mock import patch
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "thsr_ticket"))
+sys.path.insert(0, str(ROOT / "benchmarks"))
+
+from configs.web.http_config import HTTPConfig, set_base_url  # noqa: E402
+from controller.booking_flow import BookingFlow  # noqa: E402
+from extra.image_process import Recognition  # noqa: E402
+from irs_standin import StandInIRS, booking_site  # noqa: E402
+from remote.http_request import HTTPRequest  # noqa: E402
+
+PROFILE = {
+    "route": {"start": "taipei", "destination": "zuoying"},
+    "trip": {
+        "type": "one_way",
+        "outbound": {
+            "date": (date.today() + timedelta(days=7)).strftime("%Y/%m/%d"),
+            "time": "08:00",
+        },
+    },
+    "tickets": {"adult": 1},
+    "passenger": {"id": "A123456789", "phone": "0912345678", "email": "user@example.com"},
+}
+
+
+class BaseUrlTest(unittest.TestCase):
+    def test_set_base_url_rebuilds_urls_and_host(self) -> None:
+        previous = set_base_url("http://127.0.0.1:8000/")
+        try:
+            self.assertEqual("http://127.0.0.1:8000/IMINT/?locale=tw", HTTPConfig.BOOKING_PAGE_URL)
+            self.assertTrue(HTTPConfig.CONFIRM_TICKET_URL.startswith("http://127.0.0.1:8000/IMINT/"))
+            self.assertEqual("127.0.0.1:8000", HTTPConfig.HTTPHeader.BOOKING_PAGE_HOST)
+        finally:
+            set_base_url(previous)
+        self.assertEqual("https://irs.thsrc.com.tw/IMINT/?locale=tw", HTTPConfig.BOOKING_PAGE_URL)
+        self.assertEqual("irs.thsrc.com.tw", HTTPConfig.HTTPHeader.BOOKING_PAGE_HOST)
+
+
+class StandInBookingTest(unittest.TestCase):
+    def book(self, server: StandInIRS, max_retries: int = 3):
+        server.start()
+        self.addCleanup(server.stop)
+        context = server.client_ssl_context() if server.tls else None
+        client = HTTPRequest(max_retries=max_retries, ssl_context=context)
+        with booking_site(server.base_url), \
+                patch("extra.image_process.read_code", return_value=Recognition("K7P2", None)), \
+                patch("builtins.print"):
+            return BookingFlow(PROFILE, client=client).run(), client
+
+    def test_full_booking_follows_wicket_redirects(self) -> None:
+        server = StandInIRS(alpn=("http/1.1",))
+        (resp, retry), _ = self.book(server)
+
+        self.assertFalse(retry)
+        self.assertEqual(1, server.bookings)
+        self.assertEqual(302, resp.history[0].status_code)
+        posts = [path for method, path, _ in server.requests if method == "POST"]
+        self.assertIn(";jsessionid=STANDIN00000001?", posts[0])
+        self.assertEqual(
+            ["BookingS1Form", "BookingS2Form", "BookingS3Form"],
+            [path.split(":")[-3] for path in posts],
+        )
+
+    def test_early_bird_page_over_plain_http(self) -> None:
+        server = StandInIRS(tls=False, early_bird=True)
+        (_, retry), _ = self.book(server)
+
+        self.assertFalse(retry)
+        self.assertTrue(any("BookingS3FormSP" in path for _, path, _ in server.requests))
+
+    def test_captcha_errors_ask_for_another_attempt(self) -> None:
+        server = StandInIRS(tls=False, captcha_error_rate=1.0)
+        (resp, retry), _ = self.book(server)
+
+        self.assertIsNone(resp)
+        self.assertTrue(retry)
+        self.assertEqual(0, server.bookings)
+
+    def test_unavailable_site_fails_the_attempt(self) -> None:
+        server = StandInIRS(tls=False, availability=0.0)
+        (resp, retry), client = self.book(server, max_retries=0)
+
+        self.assertTrue(retry)
+        self.assertEqual(503, client.timings.records[0].status)
+
+
+if __name__ == "__main__":
+    unittest.main()
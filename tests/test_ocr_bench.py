@@ -0,0 +1,119 @@
+import json
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+from PIL import Image
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "thsr_ticket"))
+sys.path.insert(0, str(ROOT / "benchmarks"))
+
+from extra.image_process import Recognition  # noqa: E402
+from irs_standin import _captcha_png  # noqa: E402
+from ocr_bench import (  # noqa: E402
+    GAP,
+    align,
+    load_samples,
+    model_options,
+    preprocessor,
+    run,
+    synthetic_samples,
+)
+
+
+class LabelTest(unittest.TestCase):
+    def test_labels_come_from_json_chunk_or_file_name(self) -> None:
+        with tempfile.TemporaryDirectory() as tmp:
+            directory = Path(tmp)
+            (directory / "a.png").write_bytes(_captcha_png("AAAA"))
+            (directory / "b.png").write_bytes(_captcha_png("CCCC", hint=True))
+            (directory / "K7P2_001.png").write_bytes(_captcha_png("K7P2"))
+            (directory / "notes.txt").write_text("not an image")
+            (directory / "labels.json").write_text(json.dumps({"a.png": "XY34"}))
+
+            samples = load_samples(directory)
+
+        self.assertEqual(
+            [("K7P2_001.png", "K7P2"), ("a.png", "XY34"), ("b.png", "CCCC")],
+            [(s.name, s.label) for s in samples],
+        )
+
+    def test_empty_directory_is_rejected(self) -> None:
+        with tempfile.TemporaryDirectory() as tmp, self.assertRaises(ValueError):
+            load_samples(Path(tmp))
+
+
+class VariantTest(unittest.TestCase):
+    def test_preprocessing_steps_chain(self) -> None:
+        image = preprocessor("gray+upscale")(Image.new("RGB", (140, 48), "white"))
+        self.assertEqual(("L", (280, 96)), (image.mode, image.size))
+        with self.assertRaises(ValueError):
+            preprocessor("gray+sepia")
+
+    def test_model_options(self) -> None:
+        self.assertEqual(({}, None), model_options("default"))
+        self.assertEqual(({"beta": True}, 6), model_options("beta,ranges=6"))
+        with self.assertRaises(ValueError):
+            model_options("fast")
+
+
+class AlignTest(unittest.TestCase):
+    def test_substitution_pairs_by_position(self) -> None:
+        self.assertEqual([("K", "K"), ("7", "1"), ("P", "P"), ("2", "2")], align("K7P2", "K1P2"))
+
+    def test_missing_and_extra_characters_pair_with_a_gap(self) -> None:
+        self.assertEqual([("K", "K"), ("7", GAP), ("P", "P"), ("2", "2")], align("K7P2", "KP2"))
+        self.assertIn((GAP, "X"), align("K7P2", "K7P2X"))
+
+
+class RunTest(unittest.TestCase):
+    def test_report_scores_each_variant(self) -> None:
+        samples = synthetic_samples(3, seed=1)
+        reads = iter([
+            Recognition("", 0.1),
+            Recognition(samples[1].label.lower(), 0.9),
+            Recognition(samples[2].label[:-1] + "?", 0.7),
+        ] * 2)
+
+        def read_code(image):
+            return next(reads)
+
+        with patch("extra.image_process.read_code", read_code):
+            report = run(samples, preprocess=("none", "gray"), warmup=0, thresholds=(0.5, 0.8))
+
+        self.assertEqual(1, report["schema_version"])
+        self.assertEqual(["none", "gray"], [r["preprocess"] for r in report["results"]])
+        result = report["results"][0]
+        self.assertEqual(("read_code", 3), (result["call"], result["images"]))
+        # Case is ignored unless asked for.
+        self.assertAlmostEqual(1 / 3, result["accuracy"], places=3)
+        self.assertAlmostEqual(7 / 12, result["char_accuracy"], places=3)
+        self.assertEqual(2, len(result["errors"]))
+        last = samples[2].label[-1]
+        self.assertEqual(1, result["confusion"][last]["?"])
+        self.assertLessEqual(result["p50_ms"], result["p95_ms"])
+        self.assertGreater(result["images_per_sec"], 0)
+
+        confidence = result["confidence"]
+        self.assertEqual((0.9, 0.4), (confidence["mean_right"], confidence["mean_wrong"]))
+        at_half, at_high = confidence["thresholds"]
+        self.assertAlmostEqual(2 / 3, at_half["submitted"], places=3)
+        self.assertEqual((0.5, 0.0), (at_half["accuracy_above"], at_half["accuracy_below"]))
+        self.assertEqual((1.0, 0.0), (at_high["accuracy_above"], at_high["accuracy_below"]))
+
+    def test_verify_code_reports_no_confidence(self) -> None:
+        samples = synthetic_samples(2, seed=1)
+
+        with patch("extra.image_process.verify_code", side_effect=lambda image: "K7P2"):
+            report = run(samples, call="verify_code", warmup=0)
+
+        result = report["results"][0]
+        self.assertEqual("verify_code", result["call"])
+        self.assertNotIn("confidence", result)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+import io
+import sys
+import unittest
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from unittest.mock import patch
+
+from PIL import Image
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "thsr_ticket"))
+sys.path.insert(0, str(ROOT / "benchmarks"))
+
+from extra import image_process  # noqa: E402
+from extra.ocr_service import OCRService, format_ocr_stats  # noqa: E402
+from irs_standin import _captcha_png  # noqa: E402
+
+CAPTCHA = _captcha_png()
+
+
+class InProcessTest(unittest.TestCase):
+    def test_disabled_pool_reads_on_the_caller_thread(self) -> None:
+        service = OCRService(workers=0)
+        with patch("extra.image_process.verify_code", return_value="K7P2") as ocr:
+            future = service.verify_code(CAPTCHA)
+        self.assertTrue(future.done())
+        self.assertEqual("K7P2", future.result())
+        self.assertEqual((140, 48), ocr.call_args[0][0].size)
+
+        stats = service.stats()
+        self.assertEqual((0, 0, 1), (stats["workers"], stats["queue_depth"], stats["completed"]))
+        self.assertEqual(0.0, stats["queued_avg"])
+
+    def test_errors_are_raised_by_the_future(self) -> None:
+        service = OCRService(workers=0)
+        future = service.verify_code(b"not an image")
+        with self.assertRaises(Exception):
+            future.result()
+        self.assertEqual(1, service.stats()["failed"])
+        self.assertEqual(0, service.stats()["queue_depth"])
+
+    def test_negative_workers_are_rejected(self) -> None:
+        with self.assertRaises(ValueError):
+            OCRService(workers=-1)
+
+
+class WorkerPoolTest(unittest.TestCase):
+    def test_workers_read_captchas_like_in_process(self) -> None:
+        service = OCRService(workers=2)
+        self.addCleanup(service.shutdown)
+        service.start()
+
+        futures = [service.verify_code(CAPTCHA) for _ in range(4)]
+        results = [future.result(timeout=60) for future in futures]
+
+        expected = image_process.verify_code(Image.open(io.BytesIO(CAPTCHA)))
+        self.assertEqual([expected] * 4, results)
+        stats = service.stats()
+        self.assertEqual((2, 0, 4), (stats["workers"], stats["queue_depth"], stats["completed"]))
+        self.assertGreater(stats["ocr_avg"], 0)
+        self.assertGreaterEqual(stats["total_max"], stats["ocr_max"])
+        self.assertIn("2 workers, 0 queued, 4 read", format_ocr_stats(stats))
+
+    def test_broken_pool_falls_back_to_in_process(self) -> None:
+        service = OCRService(workers=1)
+        self.addCleanup(service.shutdown)
+        service.start()
+        with patch.object(
+            service._pool, "submit", side_effect=BrokenProcessPool("worker died")
+        ), patch("extra.image_process.verify_code", return_value="K7P2"), \
+                patch("builtins.print") as log:
+            self.assertEqual("K7P2", service.verify_code(CAPTCHA).result())
+
+        self.assertFalse(service.pooled)
+        self.assertIn("reading captchas in-process", log.call_args[0][0])
+
+
+if __name__ == "__main__":
+    unittest.main()
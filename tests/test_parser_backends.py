@@ -0,0 +1,83 @@
+import sys
+import unittest
+from pathlib import Path
+from typing import Any, Dict
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "thsr_ticket"))
+
+from controller.form_data import compose_form_defaults, parse_form_action
+from html_parser import available_parser_backends, parse_html, set_parser_backend
+from view_model.avail_trains import AvailTrains
+from view_model.booking_result import BookingResult
+from view_model.error_feedback import ErrorFeedback
+
+FIXTURES = ROOT / "tests" / "fixtures" / "pages"
+
+FORM_PAGES = {
+    "s1_booking.html": "BookingS1Form",
+    "s2_one_way.html": "BookingS2Form",
+    "s2_round_trip.html": "BookingS2Form",
+    "s3_ticket.html": "BookingS3Form",
+    "s3_ticket_early_bird.html": "BookingS3FormSP",
+}
+TRAIN_GROUPS = ("TrainQueryDataViewPanel:TrainGroup", "TrainQueryDataViewPanel2:TrainGroup")
+
+
+def load_page(name: str) -> bytes:
+    return (FIXTURES / name).read_bytes()
+
+
+def extract_all(backend: str) -> Dict[str, Any]:
+    set_parser_backend(backend)
+    try:
+        results: Dict[str, Any] = {}
+        for name, form_id in FORM_PAGES.items():
+            page = parse_html(load_page(name))
+            results[f"{name}:defaults"] = compose_form_defaults(page, form_id)
+            results[f"{name}:action"] = parse_form_action(page, form_id)
+        for name in ("s2_one_way.html", "s2_round_trip.html"):
+            for group in TRAIN_GROUPS:
+                trains = AvailTrains().parse(load_page(name), group)
+                results[f"{name}:{group}"] = [t.model_dump() for t in trains]
+        for path in sorted(FIXTURES.glob("*.html")):
+            results[f"{path.name}:errors"] = ErrorFeedback().parse(path.read_bytes())
+        results["booking_result.html:ticket"] = BookingResult().parse(
+            load_page("booking_result.html")
+        )
+        return results
+    finally:
+        set_parser_backend(None)
+
+
+class ParserBackendTest(unittest.TestCase):
+    def test_html_parser_backend_is_always_available(self) -> None:
+        self.assertIn("html.parser", available_parser_backends())
+
+    def test_reject_unknown_backend(self) -> None:
+        with self.assertRaisesRegex(ValueError, "not available"):
+            set_parser_backend("no-such-parser")
+
+    def test_reference_extraction_on_recorded_pages(self) -> None:
+        results = extract_all("html.parser")
+
+        self.assertEqual("1F", results["s1_booking.html:defaults"]["ticketPanel:rows:0:ticketAmount"])
+        self.assertEqual(
+            "/IMINT/?wicket:interface=:2:BookingS3FormSP::IFormSubmitListener",
+            results["s3_ticket_early_bird.html:action"],
+        )
+        self.assertEqual(10, len(results["s2_one_way.html:TrainQueryDataViewPanel:TrainGroup"]))
+        self.assertEqual(5, len(results["s2_round_trip.html:TrainQueryDataViewPanel2:TrainGroup"]))
+        self.assertEqual(1, len(results["s1_captcha_error.html:errors"]))
+        self.assertEqual(1, len(results["server_error.html:errors"]))
+        self.assertEqual("09876543", results["booking_result.html:ticket"][0].id)
+
+    def test_every_backend_matches_html_parser(self) -> None:
+        reference = extract_all("html.parser")
+        for backend in available_parser_backends():
+            with self.subTest(backend=backend):
+                self.assertEqual(reference, extract_all(backend))
+
+
+if __name__ == "__main__":
+    unittest.main()
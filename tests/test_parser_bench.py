@@ -0,0 +1,37 @@
+import sys
+import unittest
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "benchmarks"))
+
+import parser_bench  # noqa: E402
+
+
+class ParserBenchTest(unittest.TestCase):
+    def test_report_is_machine_readable(self) -> None:
+        report = parser_bench.run(iterations=2, warmup=0)
+
+        self.assertEqual(parser_bench.SCHEMA_VERSION, report["schema_version"])
+        names = {result["name"] for result in report["results"]}
+        self.assertTrue({
+            "parse_html",
+            "compose_form_defaults",
+            "AvailTrains.parse",
+            "ErrorFeedback.parse",
+            "BookingResult.parse",
+        } <= names)
+        for result in report["results"]:
+            self.assertGreater(result["ops_per_sec"], 0)
+            self.assertLessEqual(result["p50_ms"], result["p95_ms"])
+            self.assertGreaterEqual(result["peak_memory_bytes"], 0)
+
+    def test_percentile_uses_nearest_rank(self) -> None:
+        samples = [float(i) for i in range(1, 21)]
+
+        self.assertEqual(10.0, parser_bench.percentile(samples, 50))
+        self.assertEqual(19.0, parser_bench.percentile(samples, 95))
+
+
+if __name__ == "__main__":
+    unittest.main()
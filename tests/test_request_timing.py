@@ -0,0 +1,71 @@
+import socket
+import sys
+import unittest
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "thsr_ticket"))
+sys.path.insert(0, str(ROOT / "benchmarks"))
+
+from irs_standin import StandInIRS, booking_site  # noqa: E402
+from remote.http_request import HTTPRequest  # noqa: E402
+from remote.request_timing import format_summary, summarize  # noqa: E402
+
+
+class RequestTimingTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.server = StandInIRS(delay=0.05, alpn=("http/1.1",)).start()
+        self.addCleanup(self.server.stop)
+        site = booking_site(self.server.base_url)
+        site.__enter__()
+        self.addCleanup(site.__exit__, None, None, None)
+        self.client = HTTPRequest(ssl_context=self.server.client_ssl_context())
+
+    def test_records_phases_for_each_request(self) -> None:
+        seen = []
+        self.client.timings.add_hook(seen.append)
+
+        page = self.client.request_booking_page()
+        self.client.request_security_code_img(img_url=f"{self.server.base_url}/IMINT/?passCode")
+
+        first, second = seen
+        self.assertEqual(("booking_page", "GET", 200), (first.label, first.method, first.status))
+        self.assertFalse(first.reused)
+        self.assertGreater(first.connect, 0)
+        self.assertGreater(first.tls, 0)
+        self.assertGreaterEqual(first.ttfb, 0.05)
+        self.assertGreater(first.bytes_received, len(page.content))
+        self.assertEqual(0, first.retries)
+
+        self.assertEqual("security_code_img", second.label)
+        self.assertTrue(second.reused)
+        self.assertEqual((0.0, 0.0, 0.0), (second.dns, second.connect, second.tls))
+
+    def test_attempt_summary_starts_over_on_reset(self) -> None:
+        self.client.request_booking_page()
+        summary = self.client.attempt_summary()
+        self.assertEqual(1, summary["requests"])
+        self.assertGreaterEqual(summary["phases"]["ttfb"], 0.05)
+        self.assertIn("1 requests", format_summary(summary))
+
+        self.client.reset_session()
+        self.assertEqual(0, self.client.attempt_summary()["requests"])
+
+    def test_failed_requests_are_recorded(self) -> None:
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            port = sock.getsockname()[1]
+        client = HTTPRequest(max_retries=0)
+
+        with booking_site(f"https://127.0.0.1:{port}"):
+            with self.assertRaises(ConnectionError):
+                client.request_booking_page()
+
+        (timing,) = client.timings.records
+        self.assertEqual("ConnectionError", timing.error)
+        self.assertIsNone(timing.status)
+        self.assertEqual(1, summarize(list(client.timings.records))["errors"])
+
+
+if __name__ == "__main__":
+    unittest.main()
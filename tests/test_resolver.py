@@ -0,0 +1,215 @@
+import socket
+import sys
+import threading
+import time
+import unittest
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "thsr_ticket"))
+sys.path.insert(0, str(ROOT / "benchmarks"))
+
+from irs_standin import StandInIRS, booking_site  # noqa: E402
+from remote.http_request import HTTPRequest  # noqa: E402
+from remote.resolver import DNSCache, connect_first, interleave_families  # noqa: E402
+from remote.tls_session import ResumingHTTPSConnection  # noqa: E402
+
+
+def info(family, host, port=443):
+    sockaddr = (host, port, 0, 0) if family == socket.AF_INET6 else (host, port)
+    return (family, socket.SOCK_STREAM, socket.IPPROTO_TCP, "", sockaddr)
+
+
+V6 = info(socket.AF_INET6, "2001:db8::1")
+V4 = info(socket.AF_INET, "192.0.2.1")
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class DNSCacheTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.clock = FakeClock()
+        self.lookups = []
+        self.answer = ([V6, V4], 30.0)
+
+    def lookup(self, host, port):
+        self.lookups.append((host, port))
+        if isinstance(self.answer, Exception):
+            raise self.answer
+        return self.answer
+
+    def cache(self, **kwargs) -> DNSCache:
+        return DNSCache(lookup=self.lookup, clock=self.clock, **kwargs)
+
+    def test_answers_are_kept_for_their_ttl(self) -> None:
+        cache = self.cache()
+        self.assertEqual([V6, V4], cache.resolve("IRS.thsrc.com.tw", 443))
+        self.clock.now = 29
+        cache.resolve("irs.thsrc.com.tw", 443)
+        self.assertEqual(1, len(self.lookups))
+        self.clock.now = 31
+        cache.resolve("irs.thsrc.com.tw", 443)
+        self.assertEqual(2, len(self.lookups))
+        self.assertEqual({"hits": 1, "misses": 2, "names": 1}, cache.stats())
+
+    def test_ttl_is_clamped(self) -> None:
+        self.answer = ([V4], 0)
+        cache = self.cache(min_ttl=5, max_ttl=60)
+        cache.resolve("irs.thsrc.com.tw", 443)
+        self.clock.now = 4
+        cache.resolve("irs.thsrc.com.tw", 443)
+        self.assertEqual(1, len(self.lookups))
+
+        self.answer = ([V4], 86400)
+        self.clock.now = 10
+        cache.resolve("irs.thsrc.com.tw", 443)
+        self.clock.now = 71
+        cache.resolve("irs.thsrc.com.tw", 443)
+        self.assertEqual(3, len(self.lookups))
+
+    def test_stale_answer_is_used_when_the_resolver_fails(self) -> None:
+        cache = self.cache()
+        cache.resolve("irs.thsrc.com.tw", 443)
+        self.clock.now = 100
+        self.answer = socket.gaierror(socket.EAI_AGAIN, "Temporary failure")
+        self.assertEqual([V6, V4], cache.resolve("irs.thsrc.com.tw", 443))
+        with self.assertRaises(socket.gaierror):
+            cache.resolve("other.example", 443)
+
+    def test_family_filter(self) -> None:
+        cache = self.cache()
+        self.assertEqual([V4], cache.resolve("irs.thsrc.com.tw", 443, socket.AF_INET))
+        self.answer = ([V6], 30.0)
+        with self.assertRaises(socket.gaierror):
+            cache.resolve("v6only.example", 443, socket.AF_INET)
+
+    def test_concurrent_misses_share_one_lookup(self) -> None:
+        started = threading.Event()
+
+        def slow_lookup(host, port):
+            self.lookups.append(host)
+            started.set()
+            time.sleep(0.05)
+            return [V4], 30.0
+
+        cache = DNSCache(lookup=slow_lookup)
+        threads = [
+            threading.Thread(target=cache.resolve, args=("irs.thsrc.com.tw", 443))
+            for _ in range(5)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(1, len(self.lookups))
+
+    def test_prefetch(self) -> None:
+        cache = self.cache()
+        cache.prefetch("irs.thsrc.com.tw").join()
+        self.assertIsNone(cache.prefetch("irs.thsrc.com.tw"))
+        cache.resolve("irs.thsrc.com.tw", 443)
+        self.assertEqual({"hits": 1, "misses": 1, "names": 1}, cache.stats())
+
+
+class AddressSelectionTest(unittest.TestCase):
+    def test_families_are_interleaved(self) -> None:
+        v6b = info(socket.AF_INET6, "2001:db8::2")
+        v4b = info(socket.AF_INET, "192.0.2.2")
+        self.assertEqual([V6, V4, v6b, v4b], interleave_families([V6, v6b, V4, v4b]))
+        self.assertEqual([V4, V6, v4b], interleave_families([V4, v4b, V6]))
+
+    def stalled_address(self):
+        # A listener whose accept queue is full: connects to it hang, like
+        # packets to a broken IPv6 route.
+        server = socket.socket()
+        server.bind(("127.0.0.1", 0))
+        server.listen(0)
+        self.addCleanup(server.close)
+        for _ in range(4):
+            filler = socket.socket()
+            filler.setblocking(False)
+            filler.connect_ex(server.getsockname())
+            self.addCleanup(filler.close)
+        return info(socket.AF_INET, *server.getsockname())
+
+    def test_next_address_is_raced_after_the_attempt_delay(self) -> None:
+        good = socket.create_server(("127.0.0.1", 0))
+        self.addCleanup(good.close)
+        start = time.perf_counter()
+        sock = connect_first(
+            [self.stalled_address(), info(socket.AF_INET, *good.getsockname())], 5.0
+        )
+        elapsed = time.perf_counter() - start
+        self.addCleanup(sock.close)
+
+        self.assertEqual(good.getsockname(), sock.getpeername())
+        self.assertLess(elapsed, 1.0)
+        self.assertEqual(5.0, sock.gettimeout())
+
+    def test_refused_address_falls_through_at_once(self) -> None:
+        refused = socket.create_server(("127.0.0.1", 0))
+        refused_address = info(socket.AF_INET, *refused.getsockname())
+        refused.close()
+        good = socket.create_server(("127.0.0.1", 0))
+        self.addCleanup(good.close)
+
+        start = time.perf_counter()
+        sock = connect_first([refused_address, info(socket.AF_INET, *good.getsockname())], 5.0)
+        self.addCleanup(sock.close)
+        self.assertLess(time.perf_counter() - start, 0.2)
+
+    def test_timeout_covers_the_whole_race(self) -> None:
+        stalled = self.stalled_address()
+        with self.assertRaises(TimeoutError):
+            connect_first([stalled, stalled], 0.4)
+
+
+class ConnectionResolverTest(unittest.TestCase):
+    def test_connections_resolve_through_the_cache(self) -> None:
+        server = StandInIRS(alpn=("http/1.1",)).start()
+        self.addCleanup(server.stop)
+        lookups = []
+
+        def lookup(host, port):
+            lookups.append((host, port))
+            return socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM), 60.0
+
+        resolver = ResumingHTTPSConnection.resolver
+        ResumingHTTPSConnection.resolver = DNSCache(lookup=lookup)
+        self.addCleanup(setattr, ResumingHTTPSConnection, "resolver", resolver)
+
+        with booking_site(server.base_url):
+            for _ in range(2):
+                client = HTTPRequest(ssl_context=server.client_ssl_context())
+                client.request_booking_page()
+
+        self.assertEqual([("localhost", server.port)], lookups)
+
+    def test_only_an_explicit_prefetch_resolves_ahead(self) -> None:
+        lookups = []
+
+        def lookup(host, port):
+            lookups.append((host, port))
+            return socket.getaddrinfo("127.0.0.1", port, 0, socket.SOCK_STREAM), 60.0
+
+        resolver = ResumingHTTPSConnection.resolver
+        ResumingHTTPSConnection.resolver = DNSCache(lookup=lookup)
+        self.addCleanup(setattr, ResumingHTTPSConnection, "resolver", resolver)
+
+        with booking_site("https://booking.invalid:8443"):
+            client = HTTPRequest()
+            self.assertEqual([], lookups)
+            client.prefetch_dns().join(1)
+            self.assertIsNone(HTTPRequest(transport="http2").prefetch_dns())
+
+        self.assertEqual([("booking.invalid", 8443)], lookups)
+
+
+if __name__ == "__main__":
+    unittest.main()
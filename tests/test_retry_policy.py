@@ -0,0 +1,234 @@
+import random
+import socket
+import sys
+import unittest
+from pathlib import Path
+
+import requests
+from urllib3.exceptions import NewConnectionError, ProtocolError, ReadTimeoutError
+from urllib3.response import HTTPResponse
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "thsr_ticket"))
+sys.path.insert(0, str(ROOT / "benchmarks"))
+
+from controller.booking_flow import SiteError  # noqa: E402
+from irs_standin import StandInIRS, booking_site  # noqa: E402
+from remote.http_request import HTTPRequest  # noqa: E402
+from remote.retry_policy import (  # noqa: E402
+    ATTEMPT_SCHEDULES,
+    REQUEST_SCHEDULES,
+    Backoff,
+    CircuitBreaker,
+    JitteredRetry,
+    RetryPolicy,
+    classify_failure,
+    decorrelated_jitter,
+    retry_after,
+)
+
+
+def http_error(status, headers=None):
+    # What HTTPRequest raises for a bad status: ConnectionError chained to
+    # the requests HTTPError that holds the response.
+    response = requests.Response()
+    response.status_code = status
+    response.headers.update(headers or {})
+    try:
+        try:
+            response.raise_for_status()
+        except requests.exceptions.HTTPError as e:
+            raise ConnectionError(f"Request Error: {e}")
+    except ConnectionError as e:
+        return e
+
+
+def wrapped(error):
+    # HTTPRequest's ConnectionError raised while handling a requests error.
+    try:
+        try:
+            raise error
+        except requests.exceptions.RequestException as e:
+            raise ConnectionError(f"Request Error: {e}")
+    except ConnectionError as e:
+        return e
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class DecorrelatedJitterTest(unittest.TestCase):
+    def test_delays_stay_within_schedule(self) -> None:
+        backoff = Backoff(1.0, 20.0)
+        rng = random.Random(7)
+        delay = 0.0
+        for _ in range(50):
+            previous = delay
+            delay = decorrelated_jitter(backoff, previous, rng)
+            self.assertGreaterEqual(delay, 1.0)
+            self.assertLessEqual(delay, min(20.0, max(1.0, (previous or 1.0) * 3)))
+
+    def test_first_delay_is_near_base(self) -> None:
+        rng = random.Random(1)
+        delays = [decorrelated_jitter(Backoff(0.5, 5.0), 0.0, rng) for _ in range(100)]
+        self.assertTrue(all(0.5 <= d <= 1.5 for d in delays))
+
+
+class ClassifyFailureTest(unittest.TestCase):
+    def test_classes(self) -> None:
+        self.assertEqual("timeout", classify_failure(TimeoutError("slow")))
+        self.assertEqual("server_error", classify_failure(http_error(503)))
+        self.assertEqual("throttled", classify_failure(http_error(429)))
+        self.assertEqual("site_error", classify_failure(SiteError("wrong captcha")))
+        self.assertEqual("other", classify_failure(http_error(404)))
+        self.assertEqual("other", classify_failure(ValueError("JSESSIONID not found")))
+        self.assertEqual("other", classify_failure(None))
+
+    def test_connections_without_a_response_are_overload(self) -> None:
+        reset = requests.exceptions.ConnectionError(
+            ProtocolError("Connection aborted.", ConnectionResetError(104, "reset"))
+        )
+        self.assertEqual("connection_error", classify_failure(wrapped(reset)))
+        self.assertEqual("connection_error", classify_failure(ConnectionRefusedError(111, "refused")))
+        self.assertEqual("connection_error", classify_failure(ConnectionError("Request Error")))
+        # Other requests errors are wrapped the same way but are not overload.
+        self.assertEqual("other", classify_failure(wrapped(requests.exceptions.InvalidURL("bad"))))
+
+    def test_retry_after_is_read_from_the_chained_response(self) -> None:
+        self.assertEqual(7, retry_after(http_error(429, {"Retry-After": "7"})))
+        self.assertIsNone(retry_after(http_error(503)))
+
+
+class CircuitBreakerTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.clock = FakeClock()
+        self.breaker = CircuitBreaker(threshold=3, cooldown=10, max_cooldown=30, clock=self.clock)
+
+    def trip(self) -> None:
+        for _ in range(3):
+            self.breaker.record_failure("server_error")
+
+    def test_opens_after_threshold_overload_failures(self) -> None:
+        self.breaker.record_failure("timeout")
+        self.breaker.record_failure("throttled")
+        self.assertEqual(0, self.breaker.wait_time())
+        self.breaker.record_failure("server_error")
+        self.assertEqual("open", self.breaker.state)
+        self.assertEqual(10, self.breaker.wait_time())
+
+    def test_site_errors_reset_the_count(self) -> None:
+        self.breaker.record_failure("timeout")
+        self.breaker.record_failure("timeout")
+        self.breaker.record_failure("site_error")
+        self.breaker.record_failure("timeout")
+        self.assertEqual("closed", self.breaker.state)
+
+    def test_refused_connections_keep_counting(self) -> None:
+        self.breaker.record_failure("timeout")
+        self.breaker.record_failure("timeout")
+        self.breaker.record_failure(classify_failure(ConnectionRefusedError(111, "refused")))
+        self.assertEqual("open", self.breaker.state)
+
+    def test_single_probe_after_cooldown(self) -> None:
+        self.trip()
+        self.clock.now = 10
+        self.assertEqual(0, self.breaker.wait_time())
+        self.assertEqual("half_open", self.breaker.state)
+        # Everyone else keeps waiting while the probe runs.
+        self.assertEqual(CircuitBreaker.PROBE_POLL, self.breaker.wait_time())
+
+        self.breaker.record_success()
+        self.assertEqual("closed", self.breaker.state)
+        self.assertEqual(0, self.breaker.wait_time())
+
+    def test_failed_probe_doubles_cooldown(self) -> None:
+        self.trip()
+        for expected in (20, 30, 30):
+            self.clock.now += self.breaker.wait_time()
+            self.assertEqual(0, self.breaker.wait_time())
+            self.breaker.record_failure("timeout")
+            self.assertEqual(expected, self.breaker.wait_time())
+
+
+class RetryPolicyTest(unittest.TestCase):
+    def test_schedule_per_failure_class(self) -> None:
+        policy = RetryPolicy(rng=random.Random(3))
+        for _ in range(20):
+            failure_class, delay = policy.next_delay(SiteError("wrong captcha"))
+            self.assertEqual("site_error", failure_class)
+            self.assertLessEqual(delay, ATTEMPT_SCHEDULES["site_error"].cap)
+
+        failure_class, delay = policy.next_delay(http_error(429))
+        self.assertEqual("throttled", failure_class)
+        self.assertGreaterEqual(delay, ATTEMPT_SCHEDULES["throttled"].base)
+
+    def test_retry_after_raises_the_delay(self) -> None:
+        policy = RetryPolicy(rng=random.Random(3))
+        _, delay = policy.next_delay(http_error(503, {"Retry-After": "90"}))
+        self.assertEqual(90, delay)
+
+    def test_overload_pauses_every_attempt(self) -> None:
+        policy = RetryPolicy(breaker=CircuitBreaker(threshold=2, cooldown=5, clock=FakeClock()))
+        policy.next_delay(http_error(503))
+        self.assertEqual(0, policy.pause())
+        policy.next_delay(TimeoutError("slow"))
+        self.assertEqual(5, policy.pause())
+
+
+class JitteredRetryTest(unittest.TestCase):
+    def test_backoff_follows_last_failure(self) -> None:
+        retry = JitteredRetry(total=5, status_forcelist=[429, 503], rng=random.Random(5))
+        retry = retry.increment("GET", "/", response=HTTPResponse(status=429))
+        throttled = retry.get_backoff_time()
+        self.assertGreaterEqual(throttled, REQUEST_SCHEDULES["throttled"].base)
+        self.assertLessEqual(throttled, REQUEST_SCHEDULES["throttled"].cap)
+
+        retry = retry.increment("GET", "/", error=ReadTimeoutError(None, "/", "slow"))
+        self.assertEqual("timeout", retry.failure_class())
+        self.assertEqual(throttled, retry.previous_backoff)
+        self.assertLessEqual(retry.get_backoff_time(), REQUEST_SCHEDULES["timeout"].cap)
+
+        retry = retry.increment("GET", "/", error=NewConnectionError(None, "refused"))
+        self.assertEqual("connection_error", retry.failure_class())
+
+
+class ServerErrorRetryTest(unittest.TestCase):
+    def test_overloaded_site_is_classified_as_server_error(self) -> None:
+        server = StandInIRS(delay=0.0, alpn=("http/1.1",), availability=0.0).start()
+        self.addCleanup(server.stop)
+        site = booking_site(server.base_url)
+        site.__enter__()
+        self.addCleanup(site.__exit__, None, None, None)
+        client = HTTPRequest(max_retries=1, ssl_context=server.client_ssl_context())
+
+        with self.assertRaises(ConnectionError) as caught:
+            client.request_booking_page()
+
+        self.assertEqual("server_error", classify_failure(caught.exception))
+        self.assertEqual(1, client.timings.records[-1].retries)
+        self.assertEqual(2, len(server.requests))
+
+
+class RefusedConnectionTest(unittest.TestCase):
+    def test_refused_connection_is_classified_as_connection_error(self) -> None:
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            port = sock.getsockname()[1]
+        site = booking_site(f"http://127.0.0.1:{port}")
+        site.__enter__()
+        self.addCleanup(site.__exit__, None, None, None)
+        client = HTTPRequest(max_retries=0)
+
+        with self.assertRaises(ConnectionError) as caught:
+            client.request_booking_page()
+
+        self.assertEqual("connection_error", classify_failure(caught.exception))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,133 @@
+import ssl
+import sys
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from unittest.mock import patch
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "thsr_ticket"))
+
+from configs.web.http_config import set_base_url  # noqa: E402
+from remote import tls_session  # noqa: E402
+from remote.http_request import HTTPRequest  # noqa: E402
+from remote.tls_session import (  # noqa: E402
+    ResumingHTTPSConnection,
+    ResumingHTTPSConnectionPool,
+    TLSSessionCache,
+    shared_ssl_context,
+)
+
+TLS_FIXTURES = ROOT / "tests" / "fixtures" / "tls"
+
+
+class OkHandler(BaseHTTPRequestHandler):
+    def do_GET(self) -> None:
+        body = b"ok"
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+class LocalTLSServer:
+    def __enter__(self) -> "LocalTLSServer":
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(TLS_FIXTURES / "localhost.pem", TLS_FIXTURES / "localhost.key")
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), OkHandler)
+        self.httpd.socket = context.wrap_socket(self.httpd.socket, server_side=True)
+        self.port = self.httpd.server_address[1]
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class TLSSessionTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.cache = TLSSessionCache(hosts=["localhost"])
+        self.client_context = ssl.create_default_context(cafile=TLS_FIXTURES / "localhost.pem")
+        patcher = patch.object(ResumingHTTPSConnection, "session_cache", self.cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def fetch(self, port: int) -> bytes:
+        pool = ResumingHTTPSConnectionPool(
+            "localhost", port, ssl_context=self.client_context, maxsize=1
+        )
+        try:
+            return pool.request("GET", "/").data
+        finally:
+            pool.close()
+
+    def test_second_connection_resumes_session(self) -> None:
+        with LocalTLSServer() as server:
+            self.assertEqual(b"ok", self.fetch(server.port))
+            self.assertEqual(b"ok", self.fetch(server.port))
+
+        self.assertEqual(1, self.cache.full)
+        self.assertEqual(1, self.cache.resumed)
+        self.assertEqual([False, True], [h.resumed for h in self.cache.handshakes])
+
+    def test_other_hosts_always_do_full_handshakes(self) -> None:
+        self.cache.hosts = {"irs.thsrc.com.tw"}
+
+        with LocalTLSServer() as server:
+            self.fetch(server.port)
+            self.fetch(server.port)
+
+        self.assertEqual((2, 0), (self.cache.full, self.cache.resumed))
+        self.assertEqual(0, self.cache.stats()["cached_sessions"])
+
+    def test_resumption_follows_a_new_base_url(self) -> None:
+        # As the shared cache: the booking host is read from HTTPConfig.
+        self.cache.hosts = None
+        previous = set_base_url("https://localhost:8443")
+        self.addCleanup(set_base_url, previous)
+
+        with LocalTLSServer() as server:
+            self.fetch(server.port)
+            self.fetch(server.port)
+
+        self.assertEqual((1, 1), (self.cache.full, self.cache.resumed))
+        self.assertIsNone(tls_session.tls_session_cache().hosts)
+
+    def test_rejected_resumption_falls_back_to_full_handshake(self) -> None:
+        with LocalTLSServer() as server:
+            self.fetch(server.port)
+            real_wrap = self.client_context.wrap_socket
+
+            def refuse_resumed(sock, *args, **kwargs):
+                if kwargs.get("session") is not None:
+                    sock.close()
+                    raise ssl.SSLCertVerificationError("empty peer chain")
+                return real_wrap(sock, *args, **kwargs)
+
+            with patch.object(self.client_context, "wrap_socket", side_effect=refuse_resumed):
+                self.assertEqual(b"ok", self.fetch(server.port))
+
+        self.assertEqual((2, 0), (self.cache.full, self.cache.resumed))
+
+
+class SharedContextTest(unittest.TestCase):
+    def test_clients_share_one_lazily_built_context(self) -> None:
+        with patch.object(tls_session, "_shared_context", None):
+            first = HTTPRequest()
+            second = HTTPRequest()
+            context = shared_ssl_context()
+
+        adapters = [client.sess.get_adapter("https://irs.thsrc.com.tw") for client in (first, second)]
+        self.assertTrue(all(adapter.ssl_context is context for adapter in adapters))
+        pools = [adapter.poolmanager.pool_classes_by_scheme["https"] for adapter in adapters]
+        self.assertEqual([ResumingHTTPSConnectionPool] * 2, pools)
+
+
+if __name__ == "__main__":
+    unittest.main()
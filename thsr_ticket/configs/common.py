@@ -46,3 +46,10 @@ AVAILABLE_TIME_TABLE = [
 ]
 
 MAX_TICKET_NUM = 10
+
+# A captcha read whose least certain character is below this confidence is
+# not submitted; another captcha is fetched instead, at most this many times.
+# Off (0) until a threshold has been measured on the site's captchas with
+# benchmarks/ocr_bench.py.
+CAPTCHA_MIN_CONFIDENCE = 0.0
+CAPTCHA_MAX_REFRESHES = 2
@@ -1,3 +1,10 @@
+import os
+from urllib.parse import urlsplit
+
+# Set to point the client at another server, e.g. the local IRS stand-in.
+BASE_URL_ENV = "THSR_BASE_URL"
+
+
 class HTTPConfig:
     BASE_URL = "https://irs.thsrc.com.tw"
     BOOKING_PAGE_URL = f"{BASE_URL}/IMINT/?locale=tw"
@@ -21,3 +28,20 @@ class HTTPConfig:
         ACCEPT_LANGUAGE = "zh-TW,zh;q=0.8,en-US;q=0.5,en;q=0.3"
         ACCEPT_ENCODING = "gzip, deflate, br"
         BOOKING_PAGE_HOST = "irs.thsrc.com.tw"
+
+
+def set_base_url(base_url: str) -> str:
+    # Rebuilds every URL above, and the Host header, for another server.
+    # Returns the previous base URL so callers can switch back.
+    previous = HTTPConfig.BASE_URL
+    old = f"{previous}/"
+    new = f"{base_url.rstrip('/')}/"
+    for name in ("BOOKING_PAGE_URL", "SUBMIT_FORM_URL", "CONFIRM_TRAIN_URL", "CONFIRM_TICKET_URL"):
+        setattr(HTTPConfig, name, getattr(HTTPConfig, name).replace(old, new, 1))
+    HTTPConfig.BASE_URL = new.rstrip("/")
+    HTTPConfig.HTTPHeader.BOOKING_PAGE_HOST = urlsplit(new).netloc
+    return previous
+
+
+if os.environ.get(BASE_URL_ENV):
+    set_base_url(os.environ[BASE_URL_ENV])
@@ -3,6 +3,7 @@ from typing import Mapping, Any
 
 BOOKING_PAGE: Mapping[str, Any] = {
     "security_code_img": {"id": "BookingS1Form_homeCaptcha_passCode"},
+    "security_code_recode": {"id": "BookingS1Form_homeCaptcha_reCodeLink"},
     "seat_prefer_radio": {"id": "BookingS1Form_seatCon_seatRadioGroup"},
     "types_of_trip": {"id": "BookingS1Form_tripCon_typesoftrip"},
 }
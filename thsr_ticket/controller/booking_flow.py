@@ -1,44 +1,68 @@
-from typing import Tuple, Optional
+import asyncio
+from typing import TYPE_CHECKING, Any, Tuple, Optional
 
 from requests.models import Response
 
-from controller.confirm_train_flow import ConfirmTrainFlow
-from controller.confirm_ticket_flow import ConfirmTicketFlow
-from controller.first_page_flow import FirstPageFlow
-from html_parser import parse_html
+from controller.confirm_train_flow import AsyncConfirmTrainFlow, ConfirmTrainFlow
+from controller.confirm_ticket_flow import AsyncConfirmTicketFlow, ConfirmTicketFlow
+from controller.first_page_flow import AsyncFirstPageFlow, CaptchaGate, FirstPageFlow
+from html_parser import HTMLSource, ParsedPage, parse_forms
 from view_model.error_feedback import ErrorFeedback
 from view_model.booking_result import BookingResult
 from view.web.show_error_msg import ShowErrorMsg
 from view.web.show_booking_result import ShowBookingResult
 from remote.http_request import HTTPRequest
+from remote.retry_policy import SITE_ERROR
+
+if TYPE_CHECKING:
+    from remote.async_http_request import AsyncHTTPRequest
+
+
+class SiteError(Exception):
+    # The site answered with an error message, e.g. a wrong captcha or no
+    # seats; the retry policy gives these their own schedule.
+    failure_class = SITE_ERROR
 
 
 class BookingFlow:
     TICKET_FORM_IDS = {"BookingS3Form", "BookingS3FormSP"}
 
-    def __init__(self, user_profile: dict, verbose: bool = False) -> None:
-        self.client = HTTPRequest()
+    def __init__(
+        self,
+        user_profile: dict,
+        verbose: bool = False,
+        client: Optional[HTTPRequest] = None,
+        captcha_gate: Optional[CaptchaGate] = None,
+    ) -> None:
+        self.client = client or HTTPRequest()
         self.user_profile = user_profile
+        self.captcha_gate = captcha_gate
         self.error_feedback = ErrorFeedback()
         self.show_error_msg = ShowErrorMsg()
         self.verbose = verbose
+        self._page: Optional[ParsedPage] = None
+        # Why the last run() asked for a retry; read by the retry policy.
+        self.last_error: Optional[Exception] = None
 
     def run(self) -> Tuple[Optional[Response], bool]:
         try:
             book_resp = self.handle_first_page()
         except Exception as e:
+            self.last_error = e
             print(f"E: First page handling failed: {e}")
             return None, True
 
         try:
             train_resp = self.handle_train_confirmation(book_resp)
         except Exception as e:
+            self.last_error = e
             print(f"E: Train confirmation failed: {e}")
             return None, True
 
         try:
             ticket_resp = self.handle_ticket_confirmation(train_resp)
         except Exception as e:
+            self.last_error = e
             print(f"E: Ticket confirmation failed: {e}")
             return None, True
 
@@ -52,46 +76,165 @@ class BookingFlow:
 
     def handle_first_page(self) -> Response:
         book_resp, _ = FirstPageFlow(
-            client=self.client, data_dict=self.user_profile, verbose=self.verbose
+            client=self.client,
+            data_dict=self.user_profile,
+            verbose=self.verbose,
+            captcha_gate=self.captcha_gate,
         ).run()
-        if self.show_error(book_resp.content):
-            raise Exception("Error during first page handling.")
+        if self.verbose:
+            tls = self.client.tls_stats()
+            print(f"I: TLS handshakes: {tls['full']} full, {tls['resumed']} resumed")
+        if self.show_error(self.parsed_page(book_resp)):
+            raise SiteError("Error during first page handling.")
         return book_resp
 
     def handle_train_confirmation(self, book_resp: Response) -> Response:
-        if self.is_ticket_confirmation_page(book_resp.content):
+        book_page = self.parsed_page(book_resp)
+        if self.is_ticket_confirmation_page(book_page):
             if self.verbose:
                 print("I: S1 returned ticket confirmation page; skipping S2 train selection.")
             return book_resp
 
         train_resp, _ = ConfirmTrainFlow(
-            self.client, book_resp, self.user_profile, verbose=self.verbose
+            self.client,
+            book_resp,
+            self.user_profile,
+            verbose=self.verbose,
+            page=book_page,
         ).run()
-        if self.show_error(train_resp.content):
-            raise Exception("Error during train confirmation.")
+        if self.show_error(self.parsed_page(train_resp)):
+            raise SiteError("Error during train confirmation.")
         return train_resp
 
     def handle_ticket_confirmation(self, train_resp: Response) -> Response:
         ticket_resp, _ = ConfirmTicketFlow(
-            self.client, train_resp, self.user_profile, verbose=self.verbose
+            self.client,
+            train_resp,
+            self.user_profile,
+            verbose=self.verbose,
+            page=self.parsed_page(train_resp),
         ).run()
-        if self.show_error(ticket_resp.content):
-            raise Exception("Error during ticket confirmation.")
+        if self.show_error(self.parsed_page(ticket_resp)):
+            raise SiteError("Error during ticket confirmation.")
         return ticket_resp
 
     def display_booking_result(self, ticket_resp: Response) -> None:
-        result_model = BookingResult().parse(ticket_resp.content)
+        result_model = BookingResult().parse(self.parsed_page(ticket_resp))
         book = ShowBookingResult()
         book.show(result_model)
         print("\nPlease use the official channels to complete payment and ticket collection!")
 
-    def show_error(self, html: bytes) -> bool:
+    def parsed_page(self, resp: Response) -> ParsedPage:
+        # Stages run in order, so caching the latest response is enough to
+        # parse every page once while letting older trees be released.
+        if self._page is None or self._page.response is not resp:
+            self._page = ParsedPage.from_response(resp)
+        return self._page
+
+    def show_error(self, html: HTMLSource) -> bool:
         errors = self.error_feedback.parse(html)
         if len(errors) == 0:
             return False
         self.show_error_msg.show(errors)
         return True
 
-    def is_ticket_confirmation_page(self, html: bytes) -> bool:
-        page = parse_html(html)
+    def is_ticket_confirmation_page(self, html: HTMLSource) -> bool:
+        page = parse_forms(html)
         return any(page.find("form", attrs={"id": form_id}) for form_id in self.TICKET_FORM_IDS)
+
+
+class AsyncBookingFlow(BookingFlow):
+    # BookingFlow on an AsyncHTTPRequest. Requests are awaited on the event
+    # loop; page parsing, OCR and result display run in worker threads.
+
+    def __init__(
+        self,
+        user_profile: dict,
+        verbose: bool = False,
+        client: Optional["AsyncHTTPRequest"] = None,
+        captcha_gate: Optional[CaptchaGate] = None,
+    ) -> None:
+        if client is None:
+            from remote.async_http_request import AsyncHTTPRequest
+
+            client = AsyncHTTPRequest()
+        super().__init__(
+            user_profile,
+            verbose=verbose,
+            client=client,  # type: ignore[arg-type]
+            captcha_gate=captcha_gate,
+        )
+
+    async def run(self) -> Tuple[Optional[Any], bool]:  # type: ignore[override]
+        try:
+            book_resp = await self.handle_first_page()
+        except Exception as e:
+            self.last_error = e
+            print(f"E: First page handling failed: {e}")
+            return None, True
+
+        try:
+            train_resp = await self.handle_train_confirmation(book_resp)
+        except Exception as e:
+            self.last_error = e
+            print(f"E: Train confirmation failed: {e}")
+            return None, True
+
+        try:
+            ticket_resp = await self.handle_ticket_confirmation(train_resp)
+        except Exception as e:
+            self.last_error = e
+            print(f"E: Ticket confirmation failed: {e}")
+            return None, True
+
+        try:
+            await asyncio.to_thread(self.display_booking_result, ticket_resp)
+        except Exception as e:
+            print(f"E: Failed to display booking result: {e}")
+            return ticket_resp, False
+
+        return ticket_resp, False
+
+    async def handle_first_page(self) -> Any:  # type: ignore[override]
+        book_resp, _ = await AsyncFirstPageFlow(
+            client=self.client,
+            data_dict=self.user_profile,
+            verbose=self.verbose,
+            captcha_gate=self.captcha_gate,
+        ).run()
+        if await self.has_error(book_resp):
+            raise SiteError("Error during first page handling.")
+        return book_resp
+
+    async def handle_train_confirmation(self, book_resp: Any) -> Any:  # type: ignore[override]
+        book_page = self.parsed_page(book_resp)
+        if await asyncio.to_thread(self.is_ticket_confirmation_page, book_page):
+            if self.verbose:
+                print("I: S1 returned ticket confirmation page; skipping S2 train selection.")
+            return book_resp
+
+        train_resp, _ = await AsyncConfirmTrainFlow(
+            self.client,
+            book_resp,
+            self.user_profile,
+            verbose=self.verbose,
+            page=book_page,
+        ).run()
+        if await self.has_error(train_resp):
+            raise SiteError("Error during train confirmation.")
+        return train_resp
+
+    async def handle_ticket_confirmation(self, train_resp: Any) -> Any:  # type: ignore[override]
+        ticket_resp, _ = await AsyncConfirmTicketFlow(
+            self.client,
+            train_resp,
+            self.user_profile,
+            verbose=self.verbose,
+            page=self.parsed_page(train_resp),
+        ).run()
+        if await self.has_error(ticket_resp):
+            raise SiteError("Error during ticket confirmation.")
+        return ticket_resp
+
+    async def has_error(self, resp: Any) -> bool:
+        return await asyncio.to_thread(self.show_error, self.parsed_page(resp))
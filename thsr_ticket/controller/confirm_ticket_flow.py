@@ -1,14 +1,18 @@
+import asyncio
 import json
-from typing import Tuple, cast
+from typing import TYPE_CHECKING, Any, Optional, Tuple, cast
 
 from bs4 import BeautifulSoup
 from requests.models import Response
 
 from configs.web.param_schema import ConfirmTicketModel, ConfirmTicketRequestParams
 from remote.http_request import HTTPRequest
-from controller.form_data import compose_form_defaults, parse_form_action
+from controller.form_data import read_form
 from controller.profile_config import normalize_profile
-from html_parser import parse_html
+from html_parser import ParsedPage
+
+if TYPE_CHECKING:
+    from remote.async_http_request import AsyncHTTPRequest
 
 
 class ConfirmTicketFlow:
@@ -18,14 +22,23 @@ class ConfirmTicketFlow:
         train_resp: Response,
         user_profile: dict,
         verbose: bool = False,
+        page: Optional[ParsedPage] = None,
     ):
         self.client = client
         self.train_resp = train_resp
         self.user_profile = normalize_profile(user_profile)
         self.verbose = verbose
+        self.page = page
 
     def run(self) -> Tuple[Response, ConfirmTicketModel]:
-        page = parse_html(self.train_resp.content)
+        params, ticket_model, action_url = self.prepare()
+        resp = self.client.submit_ticket(params, action_url=action_url)
+        return resp, ticket_model
+
+    def prepare(self) -> Tuple[ConfirmTicketRequestParams, ConfirmTicketModel, str]:
+        if self.page is None:
+            self.page = ParsedPage.from_response(self.train_resp)
+        page = self.page.forms
         form_id = self.detect_ticket_form_id(page)
         form_mark_name = f"{form_id}:hf:0"
         is_early_bird = self.check_if_early_bird(page)
@@ -33,7 +46,7 @@ class ConfirmTicketFlow:
         if self.verbose:
             print(f"I: Early bird ticket detected: {is_early_bird}")
 
-        data = compose_form_defaults(page, form_id)
+        data, action_url = read_form(page, form_id)
         data.update({
             "dummyId": self.user_profile["ID_number"],
             "dummyPhone": self.user_profile["phone_number"],
@@ -70,11 +83,7 @@ class ConfirmTicketFlow:
         dict_params.update(
             self._filter_model_params_for_form(model_params, form_mark_name)
         )
-        resp = self.client.submit_ticket(
-            cast(ConfirmTicketRequestParams, dict_params),
-            action_url=parse_form_action(page, form_id),
-        )
-        return resp, ticket_model
+        return cast(ConfirmTicketRequestParams, dict_params), ticket_model, action_url
 
     def _filter_model_params_for_form(
         self, model_params: dict, form_mark_name: str
@@ -119,3 +128,20 @@ class ConfirmTicketFlow:
             },
         )
         return early_bird_id_input is not None
+
+
+class AsyncConfirmTicketFlow(ConfirmTicketFlow):
+    def __init__(
+        self,
+        client: "AsyncHTTPRequest",
+        train_resp: Any,
+        user_profile: dict,
+        verbose: bool = False,
+        page: Optional[ParsedPage] = None,
+    ):
+        super().__init__(client, train_resp, user_profile, verbose, page)  # type: ignore[arg-type]
+
+    async def run(self) -> Tuple[Any, ConfirmTicketModel]:  # type: ignore[override]
+        params, ticket_model, action_url = await asyncio.to_thread(self.prepare)
+        resp = await self.client.submit_ticket(params, action_url=action_url)
+        return resp, ticket_model
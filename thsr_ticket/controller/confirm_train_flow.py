@@ -1,15 +1,19 @@
+import asyncio
 import json
 from datetime import datetime, timedelta
-from typing import List, Tuple, cast
+from typing import TYPE_CHECKING, Any, List, Optional, Tuple, cast
 from bs4 import BeautifulSoup
 from requests.models import Response
 
 from remote.http_request import HTTPRequest
-from view_model.avail_trains import AvailTrains
+from view_model.avail_trains import OUTBOUND_GROUP, RETURN_GROUP, AvailTrains
 from configs.web.param_schema import ConfirmTrainModel, ConfirmTrainRequestParams, Train
-from controller.form_data import compose_form_defaults, parse_form_action
+from controller.form_data import read_form
 from controller.profile_config import normalize_profile
-from html_parser import parse_html
+from html_parser import ParsedPage
+
+if TYPE_CHECKING:
+    from remote.async_http_request import AsyncHTTPRequest
 
 
 class ConfirmTrainFlow:
@@ -19,38 +23,46 @@ class ConfirmTrainFlow:
         book_resp: Response,
         data_dict: dict,
         verbose: bool = False,
+        page: Optional[ParsedPage] = None,
     ):
         self.client    = client
         self.book_resp = book_resp
         self.data_dict = normalize_profile(data_dict)
         self.verbose   = verbose
+        self.page      = page
 
     def run(self) -> Tuple[Response, ConfirmTrainModel]:
-        trains = AvailTrains().parse(
-            self.book_resp.content, "TrainQueryDataViewPanel:TrainGroup"
-        )
+        params, confirm_model, action_url = self.prepare()
+        resp = self.client.submit_train(params, action_url=action_url)
+        return resp, confirm_model
+
+    def prepare(self) -> Tuple[ConfirmTrainRequestParams, ConfirmTrainModel, str]:
+        round_trip = self.data_dict["trip_type"] == 1
+        groups = (OUTBOUND_GROUP, RETURN_GROUP) if round_trip else (OUTBOUND_GROUP,)
+        # Both directions are collected in one pass over the page.
+        found = AvailTrains().parse_groups(self._book_page(), groups)
+
+        trains = found[OUTBOUND_GROUP]
         if not trains:
             raise ValueError("No available trains!")
 
         selected_train = self.select_available_trains(trains, "outbound_time")
         page = self._parse_page()
 
-        data = compose_form_defaults(page, "BookingS2Form")
+        data, action_url = read_form(page, "BookingS2Form")
         data.update({
-            "TrainQueryDataViewPanel:TrainGroup": selected_train.form_value,
+            OUTBOUND_GROUP: selected_train.form_value,
             "BookingS2Form:hf:0": "",
         })
 
-        if self.data_dict["trip_type"] == 1:
-            return_trains = AvailTrains().parse(
-                self.book_resp.content, "TrainQueryDataViewPanel2:TrainGroup"
-            )
+        if round_trip:
+            return_trains = found[RETURN_GROUP]
             if not return_trains:
                 raise ValueError("No available return trains!")
             selected_return_train = self.select_available_trains(
                 return_trains, "return_time"
             )
-            data["TrainQueryDataViewPanel2:TrainGroup"] = (
+            data[RETURN_GROUP] = (
                 selected_return_train.form_value
             )
 
@@ -62,14 +74,15 @@ class ConfirmTrainFlow:
             )
         )
 
-        resp = self.client.submit_train(
-            cast(ConfirmTrainRequestParams, dict_params),
-            action_url=parse_form_action(page, "BookingS2Form"),
-        )
-        return resp, confirm_model
+        return cast(ConfirmTrainRequestParams, dict_params), confirm_model, action_url
+
+    def _book_page(self) -> ParsedPage:
+        if self.page is None:
+            self.page = ParsedPage.from_response(self.book_resp)
+        return self.page
 
     def _parse_page(self) -> BeautifulSoup:
-        return parse_html(self.book_resp.content)
+        return self._book_page().forms
 
     def select_available_trains(
         self, trains: List[Train], time_key: str = "outbound_time"
@@ -156,3 +169,20 @@ class ConfirmTrainFlow:
             return datetime.strptime(s.zfill(4), "%H%M")
         except Exception:
             return None
+
+
+class AsyncConfirmTrainFlow(ConfirmTrainFlow):
+    def __init__(
+        self,
+        client: "AsyncHTTPRequest",
+        book_resp: Any,
+        data_dict: dict,
+        verbose: bool = False,
+        page: Optional[ParsedPage] = None,
+    ):
+        super().__init__(client, book_resp, data_dict, verbose, page)  # type: ignore[arg-type]
+
+    async def run(self) -> Tuple[Any, ConfirmTrainModel]:  # type: ignore[override]
+        params, confirm_model, action_url = await asyncio.to_thread(self.prepare)
+        resp = await self.client.submit_train(params, action_url=action_url)
+        return resp, confirm_model
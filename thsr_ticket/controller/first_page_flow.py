@@ -1,52 +1,149 @@
-import io
+import asyncio
 import json
 import re
+import threading
+from collections import namedtuple
+from concurrent.futures import CancelledError, Future, ThreadPoolExecutor
 from datetime import datetime
-from typing import Any, Dict, List, Mapping, Tuple, cast
-from PIL import Image
+from functools import partial
+from typing import TYPE_CHECKING, Any, Dict, List, Mapping, Optional, Tuple, cast
 from bs4 import BeautifulSoup
 from requests.models import Response
 
-from remote.http_request import HTTPRequest
+from remote.http_request import (
+    HTTPRequest,
+    find_security_img_url,
+    parse_security_img_url,
+)
 from configs.web.param_schema import BookingModel, BookingRequestParams
 from configs.web.parse_html_element import BOOKING_PAGE
 from configs.web.enums import StationMapping
-from configs.common import AVAILABLE_TIME_TABLE
+from configs.common import AVAILABLE_TIME_TABLE, CAPTCHA_MAX_REFRESHES, CAPTCHA_MIN_CONFIDENCE
 from controller.form_data import compose_form_defaults, parse_form_action
+from controller.form_plan import FormPlan, form_plan_cache, load_form_plan
 from controller.profile_config import normalize_profile
-from html_parser import parse_html
-from extra import image_process
+from html_parser import ParsedPage
+from extra.image_process import Recognition
+from extra.ocr_service import ocr_service
+
+if TYPE_CHECKING:
+    from remote.async_http_request import AsyncHTTPRequest
+
+# A captcha read below min_confidence is not submitted; a new captcha is
+# fetched instead, at most max_refreshes times per attempt. min_confidence 0
+# submits every read.
+CaptchaGate = namedtuple("CaptchaGate", ["min_confidence", "max_refreshes"])
+DEFAULT_CAPTCHA_GATE = CaptchaGate(CAPTCHA_MIN_CONFIDENCE, CAPTCHA_MAX_REFRESHES)
 
 
 class FirstPageFlow:
     def __init__(
-        self, client: HTTPRequest, data_dict: Mapping[str, Any], verbose: bool = True
+        self,
+        client: HTTPRequest,
+        data_dict: Mapping[str, Any],
+        verbose: bool = True,
+        captcha_gate: Optional[CaptchaGate] = None,
     ) -> None:
         self.client = client
         self.data_dict = normalize_profile(data_dict)
         self.verbose = verbose
+        self.captcha_gate = captcha_gate or DEFAULT_CAPTCHA_GATE
+        # Captchas fetched again because the read looked wrong.
+        self.captcha_refreshes = 0
+        self._plan: Optional[Tuple[BeautifulSoup, FormPlan]] = None
+        # Set when run() fails while the captcha is still being read.
+        self._abandoned = threading.Event()
 
     def run(self) -> Tuple[Response, BookingModel]:
-        book_page = self.client.request_booking_page().content
-        page = parse_html(book_page)
-        captcha_img_resp = self.client.request_security_code_img(book_page).content
+        # The OCR model loads while the booking page downloads.
+        ocr_service().warm_up()
+        pool = ThreadPoolExecutor(max_workers=1)
+        captcha: List["Future[str]"] = []
 
-        form_data = self.compose_form_data(page, captcha_img_resp)
+        def read_captcha(img_url: str) -> None:
+            captcha.append(pool.submit(self.read_security_code, img_url))
+
+        try:
+            # The captcha URL is picked out of the page while it streams in, so
+            # its download and OCR overlap with reading the form below.
+            book_page = ParsedPage.from_response(
+                self.client.request_booking_page(on_captcha_url=read_captcha)
+            )
+            if not captcha:
+                read_captcha(parse_security_img_url(book_page))
+
+            page = self.page_forms(book_page)
+            form_data = self.compose_page_fields(page)
+            form_data["homeCaptcha:securityCode"] = captcha[0].result()
+            params, book_model, action_url = self.build_params(page, form_data)
+        except BaseException as error:
+            # The error comes out now rather than after the captcha download,
+            # OCR and refreshes; the job stops at its next request and any
+            # failure of its own is reported when it ends.
+            self._abandoned.set()
+            for job in captcha:
+                if not job.cancel():
+                    job.add_done_callback(partial(_report_abandoned_captcha, error=error))
+            raise
+        finally:
+            pool.shutdown(wait=False)
+
+        resp = self.client.submit_booking_form(params, action_url=action_url)
+        return resp, book_model
 
+    def read_security_code(self, img_url: str) -> str:
+        # A wrong code costs the S1 submit and a restart from the booking
+        # page; another captcha in the same session costs the "another code"
+        # call and one image request.
+        while True:
+            img_resp = self.client.request_security_code_img(img_url=img_url)
+            recognition = self.recognize_security_code(img_resp.content)
+            if self.accept_security_code(recognition):
+                return recognition.text
+            if self._abandoned.is_set():
+                raise CancelledError()
+            img_url = self.client.request_new_security_code(img_url)
+
+    def accept_security_code(self, recognition: Recognition) -> bool:
+        # Only the newest captcha counts with the site, so once the refreshes
+        # are used up the last read is submitted whatever its confidence.
+        confidence = recognition.confidence
+        if confidence is None or confidence >= self.captcha_gate.min_confidence:
+            return True
+        if self.captcha_refreshes >= self.captcha_gate.max_refreshes:
+            if self.verbose:
+                print(f"I: Submitting captcha read at {confidence:.2f} confidence")
+            return True
+        self.captcha_refreshes += 1
+        if self.verbose:
+            print(
+                f"I: Captcha read at {confidence:.2f} confidence; fetching another "
+                f"({self.captcha_refreshes}/{self.captcha_gate.max_refreshes})"
+            )
+        return False
+
+    def build_params(
+        self, page: BeautifulSoup, form_data: Dict[str, Any]
+    ) -> Tuple[BookingRequestParams, BookingModel, str]:
         book_model = BookingModel(**form_data)
         # Keep dynamically discovered fields (e.g., newly added ticket rows).
         dict_params: Dict[str, Any] = dict(form_data)
         dict_params.update(
             json.loads(book_model.model_dump_json(by_alias=True, exclude_none=True))
         )
-
-        resp = self.client.submit_booking_form(
+        return (
             cast(BookingRequestParams, dict_params),
-            action_url=parse_form_action(page, "BookingS1Form"),
+            book_model,
+            parse_form_action(page, "BookingS1Form"),
         )
-        return resp, book_model
 
     def compose_form_data(self, page: BeautifulSoup, captcha_img: bytes) -> Dict:
+        data = self.compose_page_fields(page)
+        data["homeCaptcha:securityCode"] = self.input_security_code(captcha_img)
+        return data
+
+    def compose_page_fields(self, page: BeautifulSoup) -> Dict:
+        # Everything but the security code, which is filled in once read.
         data = compose_form_defaults(page, "BookingS1Form")
         data.update({
             "selectStartStation": self.select_station("start"),
@@ -57,7 +154,7 @@ class FirstPageFlow:
             "tripCon:typesoftrip": self.data_dict["trip_type"],
             "toTimeInputField": self.select_date("outbound_date"),
             "toTimeTable": self.select_outbound_time(page),
-            "homeCaptcha:securityCode": self.input_security_code(captcha_img),
+            "homeCaptcha:securityCode": "",
             "seatCon:seatRadioGroup": self.data_dict["seat_preference"],
             "BookingS1Form:hf:0": "",
             "trainCon:trainRadioGroup": self.data_dict["car_type"],
@@ -71,10 +168,9 @@ class FirstPageFlow:
         return data
 
     def compose_ticket_amounts(self, page: BeautifulSoup) -> Dict[str, str]:
-        name_pat = re.compile(r"^ticketPanel:rows:\d+:ticketAmount$")
-        selects = page.find_all("select", attrs={"name": name_pat})
+        values_by_name = self.form_plan(page).ticket_amounts
 
-        if len(selects) == 0:
+        if len(values_by_name) == 0:
             # Fallback to legacy fixed rows if dynamic fields are not present.
             return {
                 "ticketPanel:rows:0:ticketAmount": "1F",
@@ -84,22 +180,10 @@ class FirstPageFlow:
                 "ticketPanel:rows:4:ticketAmount": "0P",
             }
 
-        ticket_amounts: Dict[str, str] = {}
-        values_by_name: Dict[str, List[str]] = {}
-
-        for select in selects:
-            field_name = str(select.get("name", "")).strip()
-            if not field_name:
-                continue
-
-            values = [
-                str(opt.get("value", "")).strip()
-                for opt in select.find_all("option")
-                if opt.get("value") is not None
-            ]
-            values_by_name[field_name] = values
-            zero_value = self.pick_default_zero_ticket(values)
-            ticket_amounts[field_name] = zero_value
+        ticket_amounts: Dict[str, str] = {
+            field_name: self.pick_default_zero_ticket(values)
+            for field_name, values in values_by_name.items()
+        }
 
         requested_tickets = self.data_dict.get("tickets") or {}
         if requested_tickets:
@@ -161,16 +245,8 @@ class FirstPageFlow:
         return self.data_dict.get("return_date") or self.data_dict["outbound_date"]
 
     def parse_available_time_slots(self, page: BeautifulSoup, field_name: str) -> List[str]:
-        slot_select = page.find("select", attrs={"name": field_name})
-        if not slot_select:
-            return list(AVAILABLE_TIME_TABLE)
-
-        values = []
-        for opt in slot_select.find_all("option"):
-            val = str(opt.get("value", "")).strip()
-            if val:
-                values.append(val)
-        return values or list(AVAILABLE_TIME_TABLE)
+        values = self.form_plan(page).time_slots.get(field_name)
+        return list(values or AVAILABLE_TIME_TABLE)
 
     def select_time(self, page: BeautifulSoup, time_key: str, field_name: str) -> str:
         input_time = self.data_dict[time_key]
@@ -241,15 +317,29 @@ class FirstPageFlow:
 
     def select_booking_method(self, page: BeautifulSoup) -> str:
         target = self.data_dict["booking_method_target"]
-        candidates = page.find_all("input", {"name": "bookingMethod"})
-        tag = next((cand for cand in candidates if cand.get("data-target") == target), None)
-        if tag:
-            return str(tag.attrs["value"])
-        tag = next((cand for cand in candidates if "checked" in cand.attrs), None)
-        if tag:
-            return str(tag.attrs["value"])
+        candidates = self.form_plan(page).booking_methods
+        method = next((cand for cand in candidates if cand.target == target), None)
+        if method:
+            return method.value
+        method = next((cand for cand in candidates if cand.checked), None)
+        if method:
+            return method.value
         raise ValueError("Failed to parse 'bookingMethod'. Possibly incorrect or outdated page structure.")
 
+    def page_forms(self, book_page: ParsedPage) -> BeautifulSoup:
+        # The forms of a booking page, with the plan of a layout seen on an
+        # earlier attempt, so the lookups below skip scanning the form.
+        plan = form_plan_cache().load(book_page, "BookingS1Form")
+        page = book_page.forms
+        self._plan = (page, plan)
+        return page
+
+    def form_plan(self, page: BeautifulSoup) -> FormPlan:
+        # The form is scanned once per page and shared by the three lookups.
+        if self._plan is None or self._plan[0] is not page:
+            self._plan = (page, load_form_plan(page, "BookingS1Form"))
+        return self._plan[1]
+
     def parse_types_of_trip_value(self, page: BeautifulSoup) -> int:
         options = page.find(**BOOKING_PAGE["types_of_trip"])
         if options:
@@ -259,11 +349,73 @@ class FirstPageFlow:
         raise ValueError("No trip type value found in page")
 
     def input_security_code(self, img_resp: bytes) -> str:
+        return self.recognize_security_code(img_resp).text
+
+    def recognize_security_code(self, img_resp: bytes) -> Recognition:
         try:
-            image = Image.open(io.BytesIO(img_resp))
-            result = image_process.verify_code(image)
+            result = ocr_service().read_code(img_resp).result()
             # if self.verbose:
-            #     print(f"Recognized Security Code: {result}")
+            #     print(f"Recognized Security Code: {result.text}")
             return result
         except Exception:
             raise ValueError("Error processing security code")
+
+
+def _report_abandoned_captcha(job: "Future[str]", error: BaseException) -> None:
+    failure = None if job.cancelled() else job.exception()
+    if failure is None or failure is error or isinstance(failure, CancelledError):
+        return
+    print(f"W: Captcha read failed after the attempt had already failed: {failure}")
+
+
+class AsyncFirstPageFlow(FirstPageFlow):
+    # Parsing and OCR run in worker threads so the event loop keeps serving
+    # other bookings while this one is busy.
+
+    def __init__(
+        self,
+        client: "AsyncHTTPRequest",
+        data_dict: Mapping[str, Any],
+        verbose: bool = True,
+        captcha_gate: Optional[CaptchaGate] = None,
+    ) -> None:
+        super().__init__(client, data_dict, verbose, captcha_gate)  # type: ignore[arg-type]
+
+    async def run(self) -> Tuple[Any, BookingModel]:  # type: ignore[override]
+        ocr_service().warm_up()
+        book_page = ParsedPage.from_response(await self.client.request_booking_page())
+        img_url = await asyncio.to_thread(self.security_img_url, book_page)
+
+        # The captcha is fetched and read while the form is parsed.
+        captcha = asyncio.create_task(self.read_security_code(img_url))
+        try:
+            page = await asyncio.to_thread(self.page_forms, book_page)
+            form_data = await asyncio.to_thread(self.compose_page_fields, page)
+        except BaseException:
+            captcha.cancel()
+            raise
+        form_data["homeCaptcha:securityCode"] = await captcha
+
+        params, book_model, action_url = await asyncio.to_thread(
+            self.build_params, page, form_data
+        )
+        resp = await self.client.submit_booking_form(params, action_url=action_url)
+        return resp, book_model
+
+    async def read_security_code(self, img_url: str) -> str:  # type: ignore[override]
+        while True:
+            img_resp = await self.client.request_security_code_img(img_url=img_url)
+            recognition = await asyncio.to_thread(
+                self.recognize_security_code, img_resp.content
+            )
+            if self.accept_security_code(recognition):
+                return recognition.text
+            img_url = await self.client.request_new_security_code(img_url)
+
+    def security_img_url(self, book_page: ParsedPage) -> str:
+        content = book_page.content
+        if isinstance(content, bytes):
+            img_url = find_security_img_url(content, book_page.encoding)
+            if img_url:
+                return img_url
+        return parse_security_img_url(book_page)
@@ -1,17 +1,40 @@
-from typing import Any, Dict, Optional
+from typing import Any, Dict, Optional, Tuple
 
 from bs4 import BeautifulSoup
 from bs4.element import Tag
 
+from html_parser import HTMLSource, parse_forms
+
+
+def read_form(
+    html: HTMLSource,
+    form_id: Optional[str] = None,
+    submit_name: Optional[str] = None,
+) -> Tuple[Dict[str, Any], Optional[str]]:
+    page = parse_forms(html, form_id)
+    form = _find_form(page, form_id)
+    return _collect_defaults(form or page, submit_name), _form_action(form)
+
 
 def compose_form_defaults(
     page: BeautifulSoup,
     form_id: Optional[str] = None,
     submit_name: Optional[str] = None,
 ) -> Dict[str, Any]:
+    form = _find_form(page, form_id)
+    return _collect_defaults(form or page, submit_name)
+
+
+def parse_form_action(page: BeautifulSoup, form_id: Optional[str] = None) -> Optional[str]:
+    return _form_action(_find_form(page, form_id))
+
+
+def _find_form(page: BeautifulSoup, form_id: Optional[str]) -> Optional[Tag]:
     form = page.find("form", id=form_id) if form_id else page.find("form")
-    root = form if isinstance(form, Tag) else page
+    return form if isinstance(form, Tag) else None
 
+
+def _collect_defaults(root: Tag, submit_name: Optional[str]) -> Dict[str, Any]:
     data: Dict[str, Any] = {}
 
     for field in root.find_all(["input", "select", "textarea"]):
@@ -47,9 +70,8 @@ def compose_form_defaults(
     return data
 
 
-def parse_form_action(page: BeautifulSoup, form_id: Optional[str] = None) -> Optional[str]:
-    form = page.find("form", id=form_id) if form_id else page.find("form")
-    if not isinstance(form, Tag):
+def _form_action(form: Optional[Tag]) -> Optional[str]:
+    if form is None:
         return None
     action = form.get("action")
     if action is None:
@@ -0,0 +1,161 @@
+import hashlib
+import re
+from collections import OrderedDict, namedtuple
+from typing import Dict, List, Optional, Tuple, Union
+
+from bs4 import BeautifulSoup
+from bs4.element import Tag
+
+from html_parser import ParsedPage
+
+
+TICKET_AMOUNT_PATTERN = re.compile(r"^ticketPanel:rows:\d+:ticketAmount$")
+TIME_TABLE_FIELDS = ("toTimeTable", "backTimeTable")
+
+# What FirstPageFlow discovers from the S1 form layout, read in one pass over
+# the form. Values that change per session (hidden fields, captcha, action
+# URL) are not part of it and are read from every page. The option lists are
+# tuples so a cached plan can be shared without copying.
+FormPlan = namedtuple(
+    "FormPlan", ["ticket_amounts", "time_slots", "booking_methods"]
+)
+BookingMethod = namedtuple("BookingMethod", ["value", "target", "checked"])
+
+
+# The markup a plan is built from: select and option tags, and radio and
+# checkbox inputs. Text and hidden inputs only carry per-session values.
+LAYOUT_TAG = re.compile(
+    rb"</?select\b[^>]*>|<option\b[^>]*>"
+    rb"""|<input\b(?=[^>]*\btype\s*=\s*["']?(?:radio|checkbox)\b)[^>]*>""",
+    re.I,
+)
+FORM_END = re.compile(rb"</form\s*>", re.I)
+FORM_ACTION = re.compile(rb"""\baction\s*=\s*["']([^"']*)["']""", re.I)
+SESSION_ID = re.compile(rb";jsessionid=[^?#]*", re.I)
+
+
+class FormPlanCache:
+    # Plans keyed by a fingerprint of the raw form bytes: the form's action
+    # without its session id, and the select, option, radio and checkbox tags
+    # in order. Taking the fingerprint is a regex pass over the bytes, far
+    # cheaper than scanning the form tree, which only a new layout pays for.
+    # Any change to those tags, option values and checked state included,
+    # gives a new key, so a stale plan is never served.
+
+    def __init__(self, max_size: int = 8) -> None:
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._plans: "OrderedDict[bytes, FormPlan]" = OrderedDict()
+
+    def load(self, page: ParsedPage, form_id: str) -> FormPlan:
+        key = layout_fingerprint(page.content, form_id)
+        plan = self._plans.get(key) if key is not None else None
+        if plan is not None:
+            self.hits += 1
+            self._plans.move_to_end(key)
+            return plan
+
+        self.misses += 1
+        plan = load_form_plan(page.forms, form_id)
+        if key is not None:
+            self._plans[key] = plan
+            if len(self._plans) > self.max_size:
+                self._plans.popitem(last=False)
+        return plan
+
+    def clear(self) -> None:
+        self._plans.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._plans)
+
+
+def layout_fingerprint(html: Union[bytes, str], form_id: str) -> Optional[bytes]:
+    # None when the form cannot be found in the raw bytes; the plan is then
+    # read from the tree and not cached.
+    if isinstance(html, str):
+        html = html.encode("utf-8")
+    start = _form_start(form_id).search(html)
+    if start is None:
+        return None
+    end = FORM_END.search(html, start.end())
+    if end is None:
+        return None
+
+    action = FORM_ACTION.search(start.group(0))
+    layout = [SESSION_ID.sub(b"", action.group(1)) if action else b""]
+    layout.extend(LAYOUT_TAG.findall(html, start.end(), end.start()))
+    return hashlib.blake2b(b"\0".join(layout), digest_size=16).digest()
+
+
+def _form_start(form_id: str) -> "re.Pattern[bytes]":
+    form = re.escape(form_id.encode())
+    return re.compile(rb"<form\b[^>]*\bid\s*=\s*[\"']?" + form + rb"(?=[\"'\s>])[^>]*>", re.I)
+
+
+# One entry per form control: (tag, name, type, data-target, checked, options).
+Control = Tuple[str, str, str, str, bool, Tuple[str, ...]]
+
+
+def build_plan(controls: List[Control]) -> FormPlan:
+    ticket_amounts: Dict[str, Tuple[str, ...]] = {}
+    time_slots: Dict[str, Tuple[str, ...]] = {}
+    booking_methods: List[BookingMethod] = []
+
+    for tag, name, input_type, target, checked, options in controls:
+        if tag == "select" and TICKET_AMOUNT_PATTERN.match(name):
+            ticket_amounts.setdefault(name.strip(), options)
+        elif tag == "select" and name in TIME_TABLE_FIELDS:
+            time_slots.setdefault(name, tuple(v for v in options if v))
+        elif tag == "input" and name == "bookingMethod":
+            booking_methods.append(BookingMethod(options[0], target, checked))
+
+    return FormPlan(ticket_amounts, time_slots, tuple(booking_methods))
+
+
+def _find_root(page: BeautifulSoup, form_id: Optional[str]) -> Tag:
+    form = page.find("form", id=form_id) if form_id else None
+    return form if isinstance(form, Tag) else page
+
+
+def _scan_controls(root: Tag) -> List[Control]:
+    controls: List[Control] = []
+    for field in root.find_all(["input", "select"]):
+        name = str(field.get("name", ""))
+        if field.name == "select":
+            options = tuple(
+                str(opt.get("value")).strip()
+                for opt in field.find_all("option")
+                if opt.get("value") is not None
+            )
+            controls.append(("select", name, "", "", False, options))
+            continue
+
+        input_type = str(field.get("type", "")).lower()
+        if input_type not in {"radio", "checkbox"}:
+            # Text and hidden inputs only carry per-session values.
+            continue
+        controls.append((
+            "input",
+            name,
+            input_type,
+            str(field.get("data-target", "")),
+            field.has_attr("checked"),
+            (str(field.get("value", "")),),
+        ))
+    return controls
+
+
+def load_form_plan(page: BeautifulSoup, form_id: Optional[str] = None) -> FormPlan:
+    return build_plan(_scan_controls(_find_root(page, form_id)))
+
+
+# Shared across attempts so later booking pages reuse the first page's plan.
+_cache = FormPlanCache()
+
+
+def form_plan_cache() -> FormPlanCache:
+    return _cache
@@ -1,14 +1,63 @@
-import ddddocr
+import threading
+from collections import namedtuple
+from typing import Any, List, Optional, Sequence, Tuple
+
 from PIL import Image
 
-ocr = ddddocr.DdddOcr(show_ad=False)
+# ddddocr (and the ONNX model it loads) is only imported on first use, so
+# importing this module stays cheap.
+_ocr: Any = None
+_lock = threading.Lock()
+_warming: Optional[threading.Thread] = None
+
+# A recognised captcha. confidence is the probability of its least certain
+# character (0..1), or None when the model does not report probabilities.
+Recognition = namedtuple("Recognition", ["text", "confidence"])
+
+
+def load_model() -> Any:
+    # Builds the OCR model once; concurrent callers wait for the same load.
+    global _ocr
+    if _ocr is None:
+        with _lock:
+            if _ocr is None:
+                import ddddocr
+
+                _ocr = ddddocr.DdddOcr(show_ad=False)
+    return _ocr
+
+
+def model_loaded() -> bool:
+    return _ocr is not None
+
+
+def warm_up() -> Optional[threading.Thread]:
+    # Loads the model on a background thread, e.g. while the booking page
+    # downloads. Returns None when it is loaded or already loading. The
+    # thread is not a daemon: onnxruntime aborts the interpreter if it exits
+    # while the model is still being imported, so exit waits for the load.
+    global _warming
+    with _lock:
+        if _ocr is not None or (_warming is not None and _warming.is_alive()):
+            return None
+        _warming = threading.Thread(target=_warm, name="ocr-warm-up")
+        _warming.start()
+        return _warming
+
+
+def _warm() -> None:
+    try:
+        load_model()
+    except Exception as e:
+        # verify_code() tries again and reports the error to the flow.
+        print(f"W: Could not load the OCR model: {e}")
 
 
 def verify_code(image: Image.Image) -> str:
     if not isinstance(image, Image.Image):
         raise ValueError("Input must be a PIL.Image.Image instance.")
 
-    result = ocr.classification(image)
+    result = load_model().classification(image)
 
     if isinstance(result, str):
         return result
@@ -17,3 +66,75 @@ def verify_code(image: Image.Image) -> str:
     else:
         print(f"W: Unexpected OCR result type: {type(result)}")
         return ""
+
+
+def read_code(image: Image.Image) -> Recognition:
+    # verify_code() plus a confidence, so callers can refuse a likely-wrong read.
+    if not isinstance(image, Image.Image):
+        raise ValueError("Input must be a PIL.Image.Image instance.")
+
+    result = load_model().classification(image, probability=True)
+
+    if isinstance(result, str):
+        return Recognition(result, None)
+    if isinstance(result, dict):
+        # "probabilities"/"charset" in current ddddocr, "probability"/"charsets"
+        # in older releases, which also leave out "text".
+        probabilities = result.get("probabilities", result.get("probability"))
+        charset = result.get("charset", result.get("charsets"))
+        text = result.get("text")
+        if probabilities is not None and charset:
+            if text is None:
+                return _decode(probabilities, charset)
+            return _score(text, probabilities, charset)
+        if text is not None:
+            return Recognition(text, None)
+    print(f"W: Unexpected OCR result type: {type(result)}")
+    return Recognition("", None)
+
+
+def _steps(probabilities: Any, charset: Sequence[str]) -> List[Tuple[str, float]]:
+    # Greedy CTC decoding: the likeliest class per step, with repeats
+    # collapsed and blanks (class 0) dropped. Returns each kept character
+    # with its probability.
+    import numpy as np
+
+    steps = np.asarray(probabilities, dtype=np.float32)
+    steps = steps.reshape(-1, steps.shape[-1])
+    best = steps.argmax(axis=1)
+    kept = []
+    previous = -1
+    for step, index in enumerate(best.tolist()):
+        if index != previous and 0 < index < len(charset):
+            kept.append((charset[index], float(steps[step, index])))
+        previous = index
+    return kept
+
+
+def _decode(probabilities: Any, charset: Sequence[str]) -> Recognition:
+    # ddddocr's own "confidence" averages over every step, blanks included,
+    # and stays high for garbled reads; the weakest kept character is a
+    # better signal.
+    kept = _steps(probabilities, charset)
+    return Recognition(
+        "".join(char for char, _ in kept), min((p for _, p in kept), default=0.0)
+    )
+
+
+def _score(text: str, probabilities: Any, charset: Sequence[str]) -> Recognition:
+    # The text stays ddddocr's, so it matches verify_code(). It is the same
+    # greedy decode with set_ranges() applied, so its characters are a
+    # subsequence of the kept steps; only those steps are scored.
+    kept = _steps(probabilities, charset)
+    confidences = []
+    position = 0
+    for char in text:
+        while position < len(kept) and kept[position][0] != char:
+            position += 1
+        if position == len(kept):
+            # Decoded some other way; fall back to every kept step.
+            confidences = [p for _, p in kept]
+            break
+        confidences.append(kept[position][1])
+        position += 1
+    return Recognition(text, min(confidences, default=0.0))
@@ -0,0 +1,240 @@
+import io
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque, namedtuple
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Deque, Dict, Optional, Tuple
+
+from PIL import Image
+
+from extra import image_process
+
+# Upper bound for the default worker count; each worker holds its own model.
+MAX_DEFAULT_WORKERS = 4
+# Timings kept for stats().
+TIMING_WINDOW = 256
+
+# Seconds one captcha spent waiting for a worker (queued), being recognised
+# (ocr) and from submission to result (total).
+OCRTiming = namedtuple("OCRTiming", ["queued", "ocr", "total"])
+
+
+def default_workers(bookings: int) -> int:
+    return max(1, min(bookings, os.cpu_count() or 1, MAX_DEFAULT_WORKERS))
+
+
+def _init_worker() -> None:
+    # Runs once per worker process, so every job finds the model loaded.
+    image_process.load_model()
+
+
+def _ready() -> None:
+    pass
+
+
+def _read(img: bytes, confidence: bool) -> Any:
+    image = Image.open(io.BytesIO(img))
+    if confidence:
+        return image_process.read_code(image)
+    return image_process.verify_code(image)
+
+
+def _recognize(img: bytes, confidence: bool) -> Tuple[Any, float, float]:
+    # Returns (result, time.time() at start, seconds spent).
+    started = time.time()
+    begin = time.perf_counter()
+    result = _read(img, confidence)
+    return result, started, time.perf_counter() - begin
+
+
+class OCRService:
+    # Captcha recognition behind a future-based API. With workers > 0 the
+    # model runs in a pool of that many processes, so OCR neither holds the
+    # GIL of the booking process nor queues behind other bookings while a
+    # worker is free. With workers == 0 OCR runs on the caller's thread, as
+    # image_process.verify_code() always did.
+
+    def __init__(self, workers: int = 0) -> None:
+        if workers < 0:
+            raise ValueError("OCR workers must be 0 (in-process) or more")
+        self.workers = workers
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._completed = 0
+        self._failed = 0
+        self._timings: Deque[OCRTiming] = deque(maxlen=TIMING_WINDOW)
+
+    @property
+    def pooled(self) -> bool:
+        return self.workers > 0
+
+    def start(self) -> None:
+        # Starts every worker and has it load the model, without waiting.
+        # Workers are spawned rather than forked: the booking process runs
+        # threads (connection pools, DNS prefetch) that fork would copy
+        # mid-operation.
+        if not self.pooled:
+            image_process.warm_up()
+            return
+        with self._lock:
+            if self._pool is not None:
+                return
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+            )
+            for _ in range(self.workers):
+                self._pool.submit(_ready)
+
+    def warm_up(self) -> None:
+        self.start()
+
+    def verify_code(self, img: bytes) -> "Future[str]":
+        # img is the captcha image file (PNG/JPEG bytes). The future raises
+        # what recognition raised.
+        return self._submit(img, False)
+
+    def read_code(self, img: bytes) -> "Future[image_process.Recognition]":
+        # Like verify_code(), with the confidence of the read.
+        return self._submit(img, True)
+
+    def _submit(self, img: bytes, confidence: bool) -> "Future[Any]":
+        submitted = time.time()
+        begin = time.perf_counter()
+        with self._lock:
+            self._pending += 1
+        if self.pooled:
+            self.start()
+            pool = self._pool
+            try:
+                if pool is None:
+                    raise RuntimeError("OCR worker pool is shut down")
+                job = pool.submit(_recognize, img, confidence)
+            except (BrokenProcessPool, RuntimeError) as e:
+                self._disable(e)
+            else:
+                result: "Future[Any]" = Future()
+                job.add_done_callback(
+                    lambda done: self._pooled_done(
+                        result, done, img, confidence, submitted, begin
+                    )
+                )
+                return result
+        return self._inline(img, confidence, begin)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            timings = list(self._timings)
+            stats: Dict[str, Any] = {
+                "workers": self.workers,
+                "queue_depth": self._pending,
+                "completed": self._completed,
+                "failed": self._failed,
+            }
+        for field in OCRTiming._fields:
+            values = sorted(getattr(t, field) for t in timings)
+            stats[f"{field}_avg"] = sum(values) / len(values) if values else None
+            stats[f"{field}_max"] = values[-1] if values else None
+        return stats
+
+    def shutdown(self, wait: bool = True) -> None:
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=wait, cancel_futures=True)
+
+    def _inline(self, img: bytes, confidence: bool, begin: float) -> "Future[Any]":
+        result: "Future[Any]" = Future()
+        try:
+            read = _read(img, confidence)
+        except Exception as e:
+            self._finish(None)
+            result.set_exception(e)
+        else:
+            elapsed = time.perf_counter() - begin
+            self._finish(OCRTiming(0.0, elapsed, elapsed))
+            result.set_result(read)
+        return result
+
+    def _pooled_done(
+        self,
+        result: "Future[Any]",
+        job: "Future[Tuple[Any, float, float]]",
+        img: bytes,
+        confidence: bool,
+        submitted: float,
+        begin: float,
+    ) -> None:
+        try:
+            read, started, ocr = job.result()
+        except BrokenProcessPool as e:
+            # A worker died (out of memory, killed); this captcha is read
+            # here and later ones too.
+            self._disable(e)
+            inline = self._inline(img, confidence, begin)
+            _copy(inline, result)
+            return
+        except BaseException as e:
+            self._finish(None)
+            result.set_exception(e)
+            return
+        total = time.perf_counter() - begin
+        self._finish(OCRTiming(max(0.0, started - submitted), ocr, total))
+        result.set_result(read)
+
+    def _finish(self, timing: Optional[OCRTiming]) -> None:
+        with self._lock:
+            self._pending -= 1
+            if timing is None:
+                self._failed += 1
+            else:
+                self._completed += 1
+                self._timings.append(timing)
+
+    def _disable(self, error: BaseException) -> None:
+        with self._lock:
+            if not self.pooled:
+                return
+            self.workers = 0
+            pool, self._pool = self._pool, None
+        print(f"W: OCR worker pool failed ({error!r}); reading captchas in-process")
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _copy(source: "Future[Any]", target: "Future[Any]") -> None:
+    error = source.exception()
+    if error is not None:
+        target.set_exception(error)
+    else:
+        target.set_result(source.result())
+
+
+_service = OCRService()
+
+
+def ocr_service() -> OCRService:
+    return _service
+
+
+def use_ocr_service(service: OCRService) -> OCRService:
+    # Makes `service` the one the booking flows use; returns the previous one.
+    global _service
+    previous, _service = _service, service
+    return previous
+
+
+def format_ocr_stats(stats: Dict[str, Any]) -> str:
+    if not stats["completed"]:
+        return f"{stats['workers']} workers, {stats['queue_depth']} queued, no captchas read yet"
+    return (
+        f"{stats['workers']} workers, {stats['queue_depth']} queued, "
+        f"{stats['completed']} read in {stats['total_avg'] * 1000:.0f} ms avg "
+        f"({stats['queued_avg'] * 1000:.0f} ms waiting, "
+        f"{stats['ocr_avg'] * 1000:.0f} ms recognising)"
+    )
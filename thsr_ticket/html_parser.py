@@ -1,7 +1,166 @@
-from bs4 import BeautifulSoup
+import codecs
+from email.message import Message
+from typing import Any, Iterator, List, Optional, Union
 
+from bs4 import BeautifulSoup, SoupStrainer
+from bs4.builder import builder_registry
 
-def parse_html(html: bytes | str) -> BeautifulSoup:
-    if isinstance(html, bytes):
-        html = html.decode("utf-8", errors="replace")
-    return BeautifulSoup(html, features="html.parser")
+
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# THSR serves UTF-8; used whenever a response declares no charset.
+DEFAULT_ENCODING = "utf-8"
+
+# Tried in order; lxml is a C parser and faster than the stdlib one.
+PARSER_BACKENDS = ("lxml", "html.parser")
+
+# Backends that take bytes and decode while parsing. html.parser needs text,
+# so bytes are decoded once up front for it.
+INCREMENTAL_BACKENDS = ("lxml",)
+
+_parser_backend: Optional[str] = None
+
+
+def available_parser_backends() -> List[str]:
+    return [name for name in PARSER_BACKENDS if builder_registry.lookup(name)]
+
+
+def get_parser_backend() -> str:
+    if _parser_backend is not None:
+        return _parser_backend
+    return available_parser_backends()[0]
+
+
+def set_parser_backend(name: Optional[str]) -> None:
+    global _parser_backend
+    if name is not None and name not in available_parser_backends():
+        raise ValueError(
+            f"HTML parser backend '{name}' is not available. "
+            f"Choose one of: {available_parser_backends()}"
+        )
+    _parser_backend = name
+
+
+def declared_encoding(response: Any) -> Optional[str]:
+    # Only an explicit charset counts; requests falls back to ISO-8859-1 for
+    # any text/* response without one, which would garble these pages.
+    headers = getattr(response, "headers", None)
+    content_type = headers.get("Content-Type") if headers is not None else None
+    if not isinstance(content_type, str):
+        return None
+
+    message = Message()
+    message["Content-Type"] = content_type
+    charset = message.get_content_charset()
+    if not charset:
+        return None
+    try:
+        return codecs.lookup(charset).name
+    except LookupError:
+        return None
+
+
+class ParsedPage:
+    def __init__(
+        self,
+        content: bytes | str,
+        response: Any = None,
+        encoding: Optional[str] = None,
+    ) -> None:
+        self.content = content
+        self.response = response
+        self.encoding = encoding
+        self._soup: Optional[BeautifulSoup] = None
+        self._forms: Optional[BeautifulSoup] = None
+
+    @classmethod
+    def from_response(cls, response: Any) -> "ParsedPage":
+        return cls(
+            response.content,
+            response=response,
+            encoding=declared_encoding(response),
+        )
+
+    @property
+    def soup(self) -> BeautifulSoup:
+        # Built on first access so stages that never need a tree skip parsing.
+        if self._soup is None:
+            self._soup = _parse(self.content, encoding=self.encoding)
+        return self._soup
+
+    @property
+    def forms(self) -> BeautifulSoup:
+        # Only <form> subtrees are built; page layout and scripts are skipped.
+        if self._soup is not None:
+            return self._soup
+        if self._forms is None:
+            self._forms = _parse(
+                self.content, parse_only=SoupStrainer("form"), encoding=self.encoding
+            )
+        return self._forms
+
+    @property
+    def is_parsed(self) -> bool:
+        return self._soup is not None
+
+
+HTMLSource = Union[bytes, str, BeautifulSoup, ParsedPage]
+
+
+def parse_html(
+    html: HTMLSource,
+    backend: Optional[str] = None,
+    encoding: Optional[str] = None,
+) -> BeautifulSoup:
+    if isinstance(html, ParsedPage):
+        return html.soup
+    if isinstance(html, BeautifulSoup):
+        return html
+    return _parse(html, backend, encoding=encoding)
+
+
+def parse_forms(html: HTMLSource, form_id: Optional[str] = None) -> BeautifulSoup:
+    if isinstance(html, ParsedPage):
+        return html.forms
+    if isinstance(html, BeautifulSoup):
+        return html
+    strainer = SoupStrainer("form", id=form_id) if form_id else SoupStrainer("form")
+    return _parse(html, parse_only=strainer)
+
+
+def _parse(
+    html: bytes | str,
+    backend: Optional[str] = None,
+    parse_only: Optional[SoupStrainer] = None,
+    encoding: Optional[str] = None,
+) -> BeautifulSoup:
+    features = backend or get_parser_backend()
+    if not isinstance(html, bytes):
+        return BeautifulSoup(html, features=features, parse_only=parse_only)
+
+    encoding = encoding or DEFAULT_ENCODING
+    if features in INCREMENTAL_BACKENDS:
+        return BeautifulSoup(
+            html, features=features, parse_only=parse_only, from_encoding=encoding
+        )
+    return BeautifulSoup(
+        html.decode(encoding, errors="replace"),
+        features=features,
+        parse_only=parse_only,
+    )
+
+
+def iter_decoded(
+    html: bytes | str,
+    chunk_size: int = STREAM_CHUNK_SIZE,
+    encoding: Optional[str] = None,
+) -> Iterator[str]:
+    # Decode in chunks so streaming consumers never hold a second full copy.
+    if isinstance(html, str):
+        yield html
+        return
+    decoder_cls = codecs.getincrementaldecoder(encoding or DEFAULT_ENCODING)
+    decoder = decoder_cls(errors="replace")
+    for start in range(0, len(html), chunk_size):
+        yield decoder.decode(html[start:start + chunk_size])
+    yield decoder.decode(b"", final=True)
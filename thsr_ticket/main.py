@@ -1,23 +1,63 @@
+import asyncio
 import json
 import time
 import argparse
-from controller.booking_flow import BookingFlow
+from datetime import datetime
+from configs.common import CAPTCHA_MAX_REFRESHES, CAPTCHA_MIN_CONFIDENCE
+from controller.booking_flow import AsyncBookingFlow, BookingFlow
+from controller.first_page_flow import CaptchaGate
 from extra.input_validation import TicketBookingValidator
+from extra.ocr_service import (
+    OCRService,
+    default_workers,
+    format_ocr_stats,
+    use_ocr_service,
+)
+from remote.async_http_request import AsyncHTTPRequest
+from remote.cassette import Cassette, record, replay
+from remote.connection_warmer import ConnectionWarmer, parse_start_time, sales_open_time
+from remote.http_request import TRANSPORTS, HTTPRequest
+from remote.request_timing import format_stage_bytes, format_summary
+from remote.retry_policy import RetryPolicy
 
 
-def main(test_mode=False, test_file=None, verbose=False):
+def load_profile(test_file):
+    try:
+        with open(test_file, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        print(f"E: Test file '{test_file}' not found.")
+    except json.JSONDecodeError as e:
+        print(f"E: Failed to parse JSON file: {e}")
+    except Exception as e:
+        print(f"E: Unexpected error reading test file: {e}")
+    return None
+
+
+def start_time(value, user_profile):
+    # "opening" is when the outbound date goes on sale.
+    if value == "opening":
+        travel_date = datetime.strptime(user_profile["trip"]["outbound"]["date"], "%Y/%m/%d")
+        return sales_open_time(travel_date.date())
+    return parse_start_time(value)
+
+
+def main(
+    test_mode=False,
+    test_file=None,
+    verbose=False,
+    transport="http1",
+    warm_at=None,
+    warm_connections=4,
+    record_path=None,
+    replay_path=None,
+    replay_pace=0.0,
+    ocr_workers=0,
+    captcha_gate=None,
+):
     if test_mode and test_file:
-        try:
-            with open(test_file, "r", encoding="utf-8") as f:
-                user_profile = json.load(f)
-        except FileNotFoundError:
-            print(f"E: Test file '{test_file}' not found.")
-            return
-        except json.JSONDecodeError as e:
-            print(f"E: Failed to parse JSON file: {e}")
-            return
-        except Exception as e:
-            print(f"E: Unexpected error reading test file: {e}")
+        user_profile = load_profile(test_file)
+        if user_profile is None:
             return
     else:
         validator = TicketBookingValidator()
@@ -30,15 +70,145 @@ def main(test_mode=False, test_file=None, verbose=False):
             print(f"E: Unexpected error during input: {e}")
             return
 
-    booking_flag = True
-    while booking_flag:
+    try:
+        ocr = OCRService(ocr_workers)
+    except ValueError as e:
+        print(f"E: {e}")
+        return
+    use_ocr_service(ocr)
+    # One client for every attempt so retries reuse pooled TLS connections.
+    try:
+        client = HTTPRequest(transport=transport)
+    except ValueError as e:
+        print(f"E: {e}")
+        return
+    replayer = None
+    if replay_path:
+        try:
+            replayer = replay(client, Cassette.load(replay_path), pace=replay_pace)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"E: Cannot load cassette '{replay_path}': {e}")
+            return
+    else:
+        # A replay never touches the network, so it needs no DNS answer.
+        client.prefetch_dns()
+    # The OCR model loads in the background once the setup has worked,
+    # during the warm-up wait if there is one.
+    ocr.warm_up()
+    if warm_at and replayer is None:
+        try:
+            target = start_time(warm_at, user_profile)
+            print(f"I: Waiting for {target:%Y/%m/%d %H:%M:%S} with warm connections")
+            warmer = ConnectionWarmer(client, connections=warm_connections, verbose=verbose)
+            warmer.wait_until(target.timestamp())
+        except (KeyError, ValueError) as e:
+            print(f"E: Cannot warm up for '{warm_at}': {e}")
+            return
+        except KeyboardInterrupt:
+            print("\nI: User interrupted the wait. Exiting.")
+            return
+    if record_path:
+        # After the warm-up, which needs the plain adapter.
+        record(client, record_path)
+        print(f"I: Recording to {record_path}")
+    policy = RetryPolicy()
+    while True:
+        pause = policy.pause()
+        if pause > 0:
+            print(f"W: The site looks overloaded; pausing for {pause:.0f}s")
+            time.sleep(pause)
+            continue
         try:
-            flow = BookingFlow(user_profile, verbose=verbose)
+            client.reset_session()
+            flow = BookingFlow(
+                user_profile, verbose=verbose, client=client, captcha_gate=captcha_gate
+            )
             _, booking_flag = flow.run()
+            if verbose:
+                summary = client.attempt_summary()
+                print(f"I: Attempt network: {format_summary(summary)}")
+                for line in format_stage_bytes(summary):
+                    print(f"I:   {line}")
+                if ocr.pooled:
+                    print(f"I: OCR: {format_ocr_stats(ocr.stats())}")
         except Exception as e:
             print(f"E: Booking process failed: {e}")
             return
-        time.sleep(1)
+        if not booking_flag:
+            policy.record_success()
+            return
+        if replayer is not None and replayer.exhausted:
+            print("I: Cassette finished")
+            return
+        time.sleep(retry_delay(policy, flow, verbose))
+
+
+def retry_delay(policy, flow, verbose=False):
+    failure_class, delay = policy.next_delay(getattr(flow, "last_error", None))
+    if verbose:
+        print(f"I: Retrying in {delay:.1f}s after {failure_class}")
+    return delay
+
+
+async def keep_booking(user_profile, client, verbose=False, policy=None, captcha_gate=None):
+    policy = policy or RetryPolicy()
+    while True:
+        pause = policy.pause()
+        if pause > 0:
+            print(f"W: The site looks overloaded; pausing for {pause:.0f}s")
+            await asyncio.sleep(pause)
+            continue
+        try:
+            client.reset_session()
+            flow = AsyncBookingFlow(
+                user_profile, verbose=verbose, client=client, captcha_gate=captcha_gate
+            )
+            _, booking_flag = await flow.run()
+        except Exception as e:
+            print(f"E: Booking process failed: {e}")
+            return
+        if not booking_flag:
+            policy.record_success()
+            return
+        await asyncio.sleep(retry_delay(policy, flow, verbose))
+
+
+async def main_concurrent(
+    profile_files, verbose=False, transport="http1", ocr_workers=None, captcha_gate=None
+):
+    profiles = [load_profile(path) for path in profile_files]
+    if any(profile is None for profile in profiles):
+        return
+
+    # Captchas are read in worker processes so OCR for one booking does not
+    # stall the event loop or wait behind the others.
+    if ocr_workers is None:
+        ocr_workers = default_workers(len(profiles))
+    try:
+        ocr = OCRService(ocr_workers)
+    except ValueError as e:
+        print(f"E: {e}")
+        return
+    use_ocr_service(ocr)
+    ocr.warm_up()
+    try:
+        client = AsyncHTTPRequest(transport=transport)
+    except ValueError as e:
+        print(f"E: {e}")
+        return
+
+    # Every booking keeps its own cookies but shares the connection pool and
+    # the retry policy, so one overloaded site pauses all of them.
+    policy = RetryPolicy()
+    async with client:
+        await asyncio.gather(
+            *(
+                keep_booking(profile, client.new_session(), verbose, policy, captcha_gate)
+                for profile in profiles
+            )
+        )
+    if verbose and ocr.pooled:
+        print(f"I: OCR: {format_ocr_stats(ocr.stats())}")
 
 
 if __name__ == "__main__":
@@ -49,6 +219,90 @@ if __name__ == "__main__":
     parser.add_argument(
         "-v", "--verbose", action="store_true", help="Enable verbose output"
     )
+    parser.add_argument(
+        "--concurrent",
+        nargs="+",
+        metavar="PROFILE",
+        help="Book every JSON profile at once on one asyncio event loop (needs httpx)",
+    )
+    parser.add_argument(
+        "--transport",
+        choices=TRANSPORTS,
+        default="http1",
+        help="HTTP transport; http2 needs httpx[http2] and falls back to HTTP/1.1",
+    )
+    parser.add_argument(
+        "--warm-at",
+        metavar="TIME",
+        help="Wait until TIME (HH:MM[:SS], YYYY/MM/DD HH:MM[:SS] or 'opening' for "
+        "when the outbound date goes on sale) with connections kept warm",
+    )
+    parser.add_argument(
+        "--warm-connections",
+        type=int,
+        default=4,
+        help="Connections to keep open for --warm-at (default: 4)",
+    )
+    parser.add_argument(
+        "--record",
+        metavar="CASSETTE",
+        help="Save every request and response, with personal data redacted, to CASSETTE",
+    )
+    parser.add_argument(
+        "--replay",
+        metavar="CASSETTE",
+        help="Answer requests from a recorded CASSETTE instead of the network",
+    )
+    parser.add_argument(
+        "--replay-pace",
+        type=float,
+        default=0.0,
+        help="Scale recorded response times on --replay; 0 replays at once, "
+        "1 at recorded speed (default: 0)",
+    )
+    parser.add_argument(
+        "--ocr-workers",
+        type=int,
+        help="Processes that read captchas; 0 reads them in-process (default: 0, "
+        "or one per profile up to 4 with --concurrent)",
+    )
+    parser.add_argument(
+        "--captcha-threshold",
+        type=float,
+        default=CAPTCHA_MIN_CONFIDENCE,
+        help="Fetch another captcha instead of submitting a read below this confidence "
+        f"(0-1, 0 submits every read; default: {CAPTCHA_MIN_CONFIDENCE})",
+    )
+    parser.add_argument(
+        "--captcha-refreshes",
+        type=int,
+        default=CAPTCHA_MAX_REFRESHES,
+        help=f"Captchas to fetch again per attempt at most (default: {CAPTCHA_MAX_REFRESHES})",
+    )
     args = parser.parse_args()
+    captcha_gate = CaptchaGate(args.captcha_threshold, args.captcha_refreshes)
 
-    main(test_mode=bool(args.test), test_file=args.test, verbose=args.verbose)
+    if args.concurrent:
+        if args.warm_at:
+            print("W: --warm-at is ignored with --concurrent")
+        if args.record or args.replay:
+            print("W: --record and --replay are ignored with --concurrent")
+        asyncio.run(
+            main_concurrent(
+                args.concurrent, args.verbose, args.transport, args.ocr_workers, captcha_gate
+            )
+        )
+    else:
+        main(
+            test_mode=bool(args.test),
+            test_file=args.test,
+            verbose=args.verbose,
+            transport=args.transport,
+            warm_at=args.warm_at,
+            warm_connections=args.warm_connections,
+            record_path=args.record,
+            replay_path=args.replay,
+            replay_pace=args.replay_pace,
+            ocr_workers=args.ocr_workers or 0,
+            captcha_gate=captcha_gate,
+        )
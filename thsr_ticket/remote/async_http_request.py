@@ -0,0 +1,226 @@
+import asyncio
+import ssl
+from typing import Any, Dict, Optional
+
+from configs.web.http_config import HTTPConfig
+from configs.web.param_schema import (
+    BookingRequestParams,
+    ConfirmTicketRequestParams,
+    ConfirmTrainRequestParams,
+)
+from html_parser import HTMLSource
+from remote.http2_adapter import http2_available
+from remote.http_request import (
+    TRANSPORTS,
+    WICKET_AJAX_HEADERS,
+    find_recode_link,
+    html_headers,
+    parse_security_img_url,
+    recode_url,
+    recoded_img_url,
+    resolve_form_url,
+)
+from remote.retry_policy import (
+    REQUEST_RETRY_AFTER_MAX,
+    REQUEST_SCHEDULES,
+    RETRY_STATUSES,
+    decorrelated_jitter,
+    response_retry_after,
+    status_class,
+)
+from remote.tls_session import shared_ssl_context
+
+try:
+    import httpx
+except ImportError:  # pragma: no cover - exercised only without the extra
+    httpx = None
+
+
+def async_available() -> bool:
+    return httpx is not None
+
+
+class AsyncHTTPRequest:
+    # The HTTPRequest operations on an asyncio client, so one event loop can
+    # drive many bookings. Each instance keeps its own cookies; new_session()
+    # starts another booking on the same connection pool.
+
+    def __init__(
+        self,
+        max_retries: int = 3,
+        timeout: int = 15,
+        transport: str = "http1",
+        ssl_context: Optional[ssl.SSLContext] = None,
+        pool: Optional["httpx.AsyncHTTPTransport"] = None,
+    ) -> None:
+        if transport not in TRANSPORTS:
+            raise ValueError(
+                f"Unknown transport '{transport}'. Choose one of: {list(TRANSPORTS)}"
+            )
+        if not async_available():
+            raise ValueError(
+                "The asyncio client needs httpx. Install it with: pip install httpx"
+            )
+        if transport == "http2" and not http2_available():
+            raise ValueError(
+                "The HTTP/2 transport needs httpx with HTTP/2 support. "
+                "Install it with: pip install 'httpx[http2]'"
+            )
+        self.transport = transport
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.owns_pool = pool is None
+        if pool is None:
+            # httpcore sets ALPN on the context, so HTTP/1.1 can share the
+            # urllib3 context while h2 needs the HTTP/2 one.
+            context = ssl_context or shared_ssl_context(http2=transport == "http2")
+            pool = httpx.AsyncHTTPTransport(
+                http2=transport == "http2", verify=context, retries=max_retries
+            )
+        self.pool = pool
+        self.sess = httpx.AsyncClient(
+            transport=pool, follow_redirects=True, trust_env=False
+        )
+        self.common_head_html: dict = html_headers()
+        # The reCodeLink Ajax URL read from the last booking page.
+        self.recode_link: Optional[str] = None
+
+    def new_session(self) -> "AsyncHTTPRequest":
+        return AsyncHTTPRequest(
+            max_retries=self.max_retries,
+            timeout=self.timeout,
+            transport=self.transport,
+            pool=self.pool,
+        )
+
+    def reset_session(self) -> None:
+        self.sess.cookies.clear()
+        self.recode_link = None
+
+    async def aclose(self) -> None:
+        if self.owns_pool:
+            await self.sess.aclose()
+
+    async def __aenter__(self) -> "AsyncHTTPRequest":
+        return self
+
+    async def __aexit__(self, *exc: object) -> None:
+        await self.aclose()
+
+    async def request_booking_page(self) -> "httpx.Response":
+        try:
+            response = await self._get(HTTPConfig.BOOKING_PAGE_URL)
+            response.raise_for_status()
+        except httpx.TimeoutException:
+            raise TimeoutError("Timeout: Booking page took too long to respond")
+        except httpx.HTTPError as e:
+            raise ConnectionError(f"Request Error: {e}")
+
+        if not self.sess.cookies.get("JSESSIONID"):
+            raise ValueError("JSESSIONID not found")
+        self.recode_link = find_recode_link(response.text, str(response.url))
+        return response
+
+    async def request_security_code_img(
+        self, book_page: Optional[HTMLSource] = None, img_url: Optional[str] = None
+    ) -> "httpx.Response":
+        if img_url is None:
+            img_url = parse_security_img_url(book_page)
+
+        try:
+            response = await self._get(img_url)
+            response.raise_for_status()
+        except httpx.TimeoutException:
+            raise TimeoutError("Timeout: Security code image took too long to respond")
+        except httpx.HTTPError as e:
+            raise ConnectionError(f"Request Error: {e}")
+
+        return response
+
+    async def request_new_security_code(self, img_url: str) -> str:
+        try:
+            response = await self._get(
+                self.recode_link or recode_url(img_url), headers=WICKET_AJAX_HEADERS
+            )
+            response.raise_for_status()
+        except httpx.TimeoutException:
+            raise TimeoutError("Timeout: New security code took too long to respond")
+        except httpx.HTTPError as e:
+            raise ConnectionError(f"Request Error: {e}")
+
+        return recoded_img_url(response.text, img_url)
+
+    async def submit_booking_form(
+        self, params: BookingRequestParams, action_url: Optional[str] = None
+    ) -> "httpx.Response":
+        jsessionid = self.sess.cookies.get("JSESSIONID")
+        if not jsessionid:
+            raise ValueError("No JSESSIONID found. Cannot submit booking form")
+
+        url = (
+            resolve_form_url(action_url)
+            if action_url
+            else HTTPConfig.SUBMIT_FORM_URL.format(jsessionid)
+        )
+        return await self._post(url, params, "Booking form submission took too long")
+
+    async def submit_train(
+        self, params: ConfirmTrainRequestParams, action_url: Optional[str] = None
+    ) -> "httpx.Response":
+        url = resolve_form_url(action_url) if action_url else HTTPConfig.CONFIRM_TRAIN_URL
+        return await self._post(url, params, "Train selection took too long")
+
+    async def submit_ticket(
+        self, params: ConfirmTicketRequestParams, action_url: Optional[str] = None
+    ) -> "httpx.Response":
+        url = resolve_form_url(action_url) if action_url else HTTPConfig.CONFIRM_TICKET_URL
+        return await self._post(url, params, "Ticket confirmation took too long")
+
+    async def _get(
+        self, url: str, headers: Optional[Dict[str, str]] = None
+    ) -> "httpx.Response":
+        # GETs are retried on throttling and server errors like HTTPRequest's
+        # JitteredRetry; connection failures are retried by the transport.
+        delay = 0.0
+        for attempt in range(self.max_retries + 1):
+            response = await self.sess.get(
+                url, headers={**self.common_head_html, **(headers or {})}, timeout=self.timeout
+            )
+            if response.status_code not in RETRY_STATUSES or attempt == self.max_retries:
+                return response
+            delay = decorrelated_jitter(
+                REQUEST_SCHEDULES[status_class(response.status_code)], delay
+            )
+            retry_after = response_retry_after(response)
+            if retry_after is not None:
+                delay = max(delay, min(retry_after, REQUEST_RETRY_AFTER_MAX))
+            await asyncio.sleep(delay)
+        return response
+
+    async def _post(self, url: str, params: Any, timeout_message: str) -> "httpx.Response":
+        try:
+            response = await self.sess.post(
+                url,
+                headers=self.common_head_html,
+                data=form_fields(params),
+                timeout=self.timeout,
+            )
+            response.raise_for_status()
+        except httpx.TimeoutException:
+            raise TimeoutError(f"Timeout: {timeout_message}")
+        except httpx.HTTPError as e:
+            raise ConnectionError(f"Request Error: {e}")
+
+        return response
+
+
+def form_fields(params: Any) -> Dict[str, Any]:
+    # Encode like requests: None drops the field and other values use str(),
+    # where httpx would send "" and "true" instead.
+    fields: Dict[str, Any] = {}
+    for key, value in dict(params).items():
+        if isinstance(value, (list, tuple)):
+            fields[key] = [str(v) for v in value if v is not None]
+        elif value is not None:
+            fields[key] = str(value)
+    return fields
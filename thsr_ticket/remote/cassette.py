@@ -0,0 +1,393 @@
+import base64
+import gzip
+import io
+import json
+import os
+import re
+import threading
+import time
+import zlib
+from collections import namedtuple
+from http.client import HTTPMessage
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple, Union
+from urllib.parse import parse_qsl, quote_plus, urlencode, urlsplit
+
+import requests
+from requests.adapters import BaseAdapter, HTTPAdapter
+from requests.models import PreparedRequest, Response
+from urllib3.response import HTTPResponse
+
+import remote.content_encoding as content_encoding
+
+CASSETTE_VERSION = 1
+REDACTED = "REDACTED"
+
+# Form fields holding personal data, matched on the last ":" part of the
+# field name, case-insensitively.
+PII_FIELDS = frozenset(
+    {
+        "dummyid",
+        "dummyphone",
+        "email",
+        "idnumber",
+        "passengerdataidnumber",
+        "membershipnumber",
+    }
+)
+
+# Headers that describe the stored body rather than the response; replay
+# sets them again for the body it serves.
+BODY_HEADERS = frozenset({"content-encoding", "content-length", "transfer-encoding"})
+
+# One request/response exchange. request_body is redacted; body is the
+# response body after Content-Encoding was undone, and encoding the one it
+# was sent with. ttfb and download are seconds.
+Interaction = namedtuple(
+    "Interaction",
+    [
+        "method",
+        "url",
+        "request_body",
+        "status",
+        "reason",
+        "headers",
+        "body",
+        "encoding",
+        "ttfb",
+        "download",
+    ],
+)
+
+_JSESSIONID = re.compile(r";jsessionid=[^?#]*", re.IGNORECASE)
+_ANTI_CACHE = re.compile(r"&?wicket:antiCache=\d*")
+
+
+class CassetteError(requests.exceptions.RequestException):
+    # The flow asked for something the cassette did not record.
+    pass
+
+
+class Cassette:
+    # Recorded exchanges in the order they happened, stored as JSON.
+
+    def __init__(
+        self,
+        interactions: Optional[Iterable[Interaction]] = None,
+        secrets: Optional[Iterable[str]] = None,
+    ) -> None:
+        self.interactions: List[Interaction] = list(interactions or ())
+        # Redacted values, scrubbed from every body and URL before saving.
+        self.secrets: Set[str] = set(secrets or ())
+        self._lock = threading.Lock()
+
+    def add(self, interaction: Interaction, secrets: Iterable[str] = ()) -> None:
+        with self._lock:
+            self.interactions.append(interaction)
+            self.secrets.update(s for s in secrets if s)
+
+    @classmethod
+    def load(cls, path: Union[str, "os.PathLike[str]"]) -> "Cassette":
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("version") != CASSETTE_VERSION:
+            raise ValueError(f"Unsupported cassette version: {data.get('version')}")
+        return cls(_from_json(item) for item in data["interactions"])
+
+    def save(self, path: Union[str, "os.PathLike[str]"]) -> None:
+        with self._lock:
+            interactions = [scrub(i, self.secrets) for i in self.interactions]
+        data = {
+            "version": CASSETTE_VERSION,
+            "interactions": [_to_json(i) for i in interactions],
+        }
+        # Written aside and renamed, so a crash never leaves half a cassette.
+        tmp = f"{os.fspath(path)}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=1)
+        os.replace(tmp, path)
+
+
+def redact_form(body: Any) -> Tuple[Any, List[str]]:
+    # Returns (body with PII fields replaced, the values replaced).
+    if not body:
+        return body, []
+    text = body.decode("utf-8", "replace") if isinstance(body, bytes) else str(body)
+    fields = parse_qsl(text, keep_blank_values=True)
+    secrets = []
+    redacted = []
+    for key, value in fields:
+        if value and key.rsplit(":", 1)[-1].lower() in PII_FIELDS:
+            secrets.append(value)
+            value = REDACTED
+        redacted.append((key, value))
+    if not secrets:
+        return text, []
+    return urlencode(redacted), secrets
+
+
+def scrub(interaction: Interaction, secrets: Iterable[str]) -> Interaction:
+    # Removes redacted values wherever the site echoed them back.
+    body = interaction.body
+    url = interaction.url
+    request_body = interaction.request_body
+    for secret in sorted(secrets, key=len, reverse=True):
+        for form in {secret, quote_plus(secret)}:
+            body = body.replace(form.encode("utf-8"), REDACTED.encode("utf-8"))
+            url = url.replace(form, REDACTED)
+            if request_body:
+                request_body = request_body.replace(form, REDACTED)
+    return interaction._replace(body=body, url=url, request_body=request_body)
+
+
+def encode_body(body: bytes, encoding: Optional[str]) -> Optional[bytes]:
+    # body compressed as it was sent, or None when no encoder is installed.
+    if encoding in (None, "", "identity"):
+        return body
+    if encoding in ("gzip", "x-gzip"):
+        return gzip.compress(body)
+    if encoding == "deflate":
+        return zlib.compress(body)
+    if encoding == "br" and content_encoding.brotli is not None:
+        return content_encoding.brotli.compress(body)
+    if encoding == "zstd" and content_encoding.zstandard is not None:
+        return content_encoding.zstandard.ZstdCompressor().compress(body)
+    return None
+
+
+class _RecordedMessage:
+    # Just enough of http.client's response for requests to read cookies from.
+
+    def __init__(self, headers: Sequence[Tuple[str, str]]) -> None:
+        self.msg = HTTPMessage()
+        for key, value in headers:
+            self.msg[key] = value
+
+    def info(self) -> HTTPMessage:
+        return self.msg
+
+    def isclosed(self) -> bool:
+        return True
+
+
+class _PacedBody(io.BytesIO):
+    # Holds back the first read for the recorded download time.
+
+    def __init__(self, data: bytes, delay: float) -> None:
+        super().__init__(data)
+        self.delay = delay
+
+    def read(self, size: Optional[int] = -1) -> bytes:
+        if self.delay > 0:
+            time.sleep(self.delay)
+            self.delay = 0.0
+        return super().read(size)
+
+
+class CassetteAdapter(HTTPAdapter):
+    # Base for the recording and replaying adapters: turns an Interaction
+    # into a streamed requests Response, so HTTPRequest reads and decodes
+    # it the same way as a live one.
+
+    def __init__(self, cassette: Cassette) -> None:
+        super().__init__()
+        self.cassette = cassette
+
+    def serve(
+        self, request: PreparedRequest, interaction: Interaction, pace: float = 0.0
+    ) -> Response:
+        wire = encode_body(interaction.body, interaction.encoding)
+        headers = [(k, v) for k, v in interaction.headers if k.lower() not in BODY_HEADERS]
+        if wire is None:
+            wire = interaction.body
+        elif interaction.encoding not in (None, "", "identity"):
+            headers.append(("Content-Encoding", interaction.encoding))
+        headers.append(("Content-Length", str(len(wire))))
+
+        raw = HTTPResponse(
+            body=_PacedBody(wire, interaction.download * pace),
+            headers=headers,
+            status=interaction.status,
+            reason=interaction.reason,
+            preload_content=False,
+            original_response=_RecordedMessage(headers),  # type: ignore[arg-type]
+            request_method=request.method,
+            request_url=request.url,
+        )
+        return self.build_response(request, raw)
+
+
+class RecordingAdapter(CassetteAdapter):
+    # Sends through `inner` and records every exchange, redacted, saving
+    # the cassette to `path` after each one when a path is given.
+
+    def __init__(
+        self,
+        inner: BaseAdapter,
+        cassette: Optional[Cassette] = None,
+        path: Optional[Union[str, "os.PathLike[str]"]] = None,
+    ) -> None:
+        super().__init__(cassette or Cassette())
+        self.inner = inner
+        self.path = path
+
+    def send(  # type: ignore[override]
+        self,
+        request: PreparedRequest,
+        stream: bool = False,
+        timeout: Any = None,
+        verify: Any = True,
+        cert: Any = None,
+        proxies: Any = None,
+    ) -> Response:
+        start = time.perf_counter()
+        live = self.inner.send(
+            request, stream=True, timeout=timeout, verify=verify, cert=cert, proxies=proxies
+        )
+        headers_at = time.perf_counter()
+        body, encoding = _decoded_body(live)
+        download = time.perf_counter() - headers_at
+
+        request_body, secrets = redact_form(request.body)
+        interaction = Interaction(
+            method=request.method or "GET",
+            url=request.url or "",
+            request_body=request_body,
+            status=live.status_code,
+            reason=live.reason,
+            headers=_header_pairs(live),
+            body=body,
+            encoding=encoding,
+            ttfb=headers_at - start,
+            download=download,
+        )
+        self.cassette.add(interaction, secrets)
+        if self.path is not None:
+            self.cassette.save(self.path)
+        return self.serve(request, interaction)
+
+    def close(self) -> None:
+        self.inner.close()
+
+
+class ReplayAdapter(CassetteAdapter):
+    # Answers requests from a cassette, in recorded order, without network.
+    # pace scales the recorded timings: 0 replays at once, 1 at the recorded
+    # speed. Method and URL must match what was recorded.
+
+    def __init__(self, cassette: Cassette, pace: float = 0.0) -> None:
+        super().__init__(cassette)
+        self.pace = pace
+        self.position = 0
+        self._lock = threading.Lock()
+
+    def rewind(self) -> None:
+        with self._lock:
+            self.position = 0
+
+    @property
+    def exhausted(self) -> bool:
+        return self.position >= len(self.cassette.interactions)
+
+    def send(  # type: ignore[override]
+        self,
+        request: PreparedRequest,
+        stream: bool = False,
+        timeout: Any = None,
+        verify: Any = True,
+        cert: Any = None,
+        proxies: Any = None,
+    ) -> Response:
+        with self._lock:
+            if self.exhausted:
+                raise CassetteError(
+                    f"Cassette has no more interactions for {request.method} {request.url}",
+                    request=request,
+                )
+            interaction = self.cassette.interactions[self.position]
+            self.position += 1
+
+        if (request.method, _url_key(request.url or "")) != (
+            interaction.method,
+            _url_key(interaction.url),
+        ):
+            raise CassetteError(
+                f"Expected {interaction.method} {interaction.url}, "
+                f"got {request.method} {request.url}",
+                request=request,
+            )
+        if self.pace > 0:
+            time.sleep(interaction.ttfb * self.pace)
+        return self.serve(request, interaction, self.pace)
+
+
+def record(
+    client: Any, path: Optional[Union[str, "os.PathLike[str]"]] = None
+) -> Cassette:
+    # Records everything `client` (an HTTPRequest) sends from now on, through
+    # the adapters it already has, into the returned cassette.
+    cassette = Cassette()
+    for prefix in ("https://", "http://"):
+        inner = client.sess.get_adapter(prefix)
+        client.sess.mount(prefix, RecordingAdapter(inner, cassette, path))
+    return cassette
+
+
+def replay(client: Any, cassette: Cassette, pace: float = 0.0) -> ReplayAdapter:
+    # Serves everything `client` (an HTTPRequest) sends from `cassette`.
+    adapter = ReplayAdapter(cassette, pace)
+    client.sess.mount("https://", adapter)
+    client.sess.mount("http://", adapter)
+    return adapter
+
+
+def _decoded_body(response: Response) -> Tuple[bytes, Optional[str]]:
+    encoding = response.headers.get("Content-Encoding")
+    stats = content_encoding.BodyStats()
+    body = content_encoding.read_body(response, stats)
+    if stats.decode is None:
+        # The transport decoded it already (HTTP/2).
+        return body, encoding
+    if encoding and content_encoding.content_decoders(encoding) is None:
+        # Left encoded; store it as it came.
+        return body, None
+    return body, encoding
+
+
+def _header_pairs(response: Response) -> List[Tuple[str, str]]:
+    # Repeated headers (Set-Cookie) stay separate.
+    headers = getattr(response.raw, "headers", None)
+    items = headers.items() if hasattr(headers, "items") else response.headers.items()
+    return [(str(k), str(v)) for k, v in items]
+
+
+def _url_key(url: str) -> str:
+    # Host and port differ between a recording and a replay; path and query
+    # do not, apart from the session id the site writes into URLs and the
+    # timestamp on captcha refreshes.
+    parts = urlsplit(url)
+    path = _JSESSIONID.sub("", parts.path)
+    query = _ANTI_CACHE.sub("", parts.query)
+    return f"{path}?{query}" if query else path
+
+
+def _to_json(interaction: Interaction) -> Dict[str, Any]:
+    data = interaction._asdict()
+    data["headers"] = [list(pair) for pair in interaction.headers]
+    try:
+        data["body"] = interaction.body.decode("utf-8")
+        data["body_format"] = "utf-8"
+    except UnicodeDecodeError:
+        data["body"] = base64.b64encode(interaction.body).decode("ascii")
+        data["body_format"] = "base64"
+    return data
+
+
+def _from_json(data: Dict[str, Any]) -> Interaction:
+    data = dict(data)
+    body_format = data.pop("body_format", "utf-8")
+    if body_format == "base64":
+        data["body"] = base64.b64decode(data["body"])
+    else:
+        data["body"] = data["body"].encode("utf-8")
+    data["headers"] = [tuple(pair) for pair in data["headers"]]
+    return Interaction(**data)
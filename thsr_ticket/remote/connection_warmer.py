@@ -0,0 +1,86 @@
+import time
+from datetime import date, datetime, timedelta
+from typing import Any, Callable, Optional
+
+from configs.common import DAYS_BEFORE_BOOKING_AVAILABLE
+
+START_TIME_FORMATS = ("%Y/%m/%d %H:%M:%S", "%Y/%m/%d %H:%M", "%H:%M:%S", "%H:%M")
+
+
+def parse_start_time(value: str, now: Optional[datetime] = None) -> datetime:
+    # "YYYY/MM/DD HH:MM[:SS]", or "HH:MM[:SS]" for its next occurrence.
+    now = now or datetime.now()
+    for fmt in START_TIME_FORMATS:
+        try:
+            parsed = datetime.strptime(value.strip(), fmt)
+        except ValueError:
+            continue
+        if fmt.startswith("%Y"):
+            return parsed
+        target = datetime.combine(now.date(), parsed.time())
+        return target if target > now else target + timedelta(days=1)
+    raise ValueError(f"Invalid start time '{value}'. Use HH:MM[:SS] or YYYY/MM/DD HH:MM[:SS]")
+
+
+def sales_open_time(travel_date: date) -> datetime:
+    # The booking window spans DAYS_BEFORE_BOOKING_AVAILABLE days counting
+    # today, so a travel date goes on sale at local midnight one day later
+    # than that many days before.
+    opening = travel_date - timedelta(days=DAYS_BEFORE_BOOKING_AVAILABLE - 1)
+    return datetime.combine(opening, datetime.min.time())
+
+
+class ConnectionWarmer:
+    # Waits for a target time and keeps `connections` warm to the booking host
+    # for the last `lead` seconds. The pool is checked every `refresh` seconds
+    # and once more `check_ahead` seconds before the target, so the first
+    # requests at the target reuse healthy connections.
+
+    def __init__(
+        self,
+        client: Any,
+        connections: int = 4,
+        lead: float = 60.0,
+        refresh: float = 10.0,
+        max_idle: Optional[float] = 20.0,
+        check_ahead: float = 1.0,
+        verbose: bool = False,
+        clock: Callable[[], float] = time.time,
+        sleep: Callable[[float], None] = time.sleep,
+    ) -> None:
+        self.client = client
+        self.connections = connections
+        self.lead = lead
+        self.refresh = refresh
+        self.max_idle = max_idle
+        self.check_ahead = check_ahead
+        self.verbose = verbose
+        self.clock = clock
+        self.sleep = sleep
+
+    def wait_until(self, target: float) -> None:
+        # target is a time.time() value. Warm-up failures are reported and
+        # retried on the next refresh; an unsupported client raises ValueError.
+        while True:
+            remaining = target - self.clock()
+            if remaining <= self.check_ahead:
+                break
+            if remaining > self.lead:
+                self.sleep(remaining - self.lead)
+                continue
+            self.refresh_pool()
+            self.sleep(min(self.refresh, remaining - self.check_ahead))
+
+        self.refresh_pool()
+        remaining = target - self.clock()
+        if remaining > 0:
+            self.sleep(remaining)
+
+    def refresh_pool(self) -> None:
+        try:
+            opened, kept = self.client.warm_up(self.connections, self.max_idle)
+        except (ConnectionError, TimeoutError) as e:
+            print(f"W: Connection warm-up failed: {e}")
+            return
+        if self.verbose:
+            print(f"I: Warm connections: {kept} kept, {opened} opened")
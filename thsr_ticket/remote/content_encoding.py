@@ -0,0 +1,248 @@
+import time
+import zlib
+from typing import Any, Iterator, List, Optional, Tuple
+
+from requests.exceptions import (
+    ConnectionError as RequestsConnectionError,
+    ContentDecodingError,
+    ReadTimeout,
+    SSLError,
+)
+from urllib3.exceptions import ProtocolError, ReadTimeoutError
+from urllib3.exceptions import SSLError as Urllib3SSLError
+
+# The fastest zlib-compatible inflater installed; python-isal and zlib-ng
+# decode gzip two to three times faster than the standard zlib.
+try:
+    from isal import isal_zlib as fast_zlib
+except ImportError:  # pragma: no cover - depends on the optional extra
+    try:
+        from zlib_ng import zlib_ng as fast_zlib
+    except ImportError:
+        fast_zlib = zlib
+
+# The brotli C extension has less call overhead than the cffi binding that
+# urllib3 tries first.
+try:
+    import brotli
+except ImportError:  # pragma: no cover - depends on the optional extra
+    try:
+        import brotlicffi as brotli
+    except ImportError:
+        brotli = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - depends on the optional extra
+    zstandard = None
+
+
+# Cheapest to decode first; the q-values in Accept-Encoding follow this order.
+ENCODING_PREFERENCE = ("zstd", "br", "gzip", "deflate")
+
+READ_CHUNK_SIZE = 64 * 1024
+
+
+def decodable_encodings() -> Tuple[str, ...]:
+    available = {"gzip", "deflate"}
+    if brotli is not None:
+        available.add("br")
+    if zstandard is not None:
+        available.add("zstd")
+    return tuple(e for e in ENCODING_PREFERENCE if e in available)
+
+
+def accept_encoding(wanted: str) -> str:
+    # The encodings from `wanted` this client can decode, best first. Sending
+    # one we cannot decode would hand the page parser compressed bytes.
+    requested = {e.split(";")[0].strip().lower() for e in wanted.split(",")}
+    usable = [e for e in decodable_encodings() if e in requested]
+    if not usable:
+        return "identity"
+    return ", ".join(
+        e if i == 0 else f"{e};q={1 - i / 10:.1f}" for i, e in enumerate(usable)
+    )
+
+
+class _DeflateDecoder:
+    # "deflate" is zlib-wrapped by the RFC, but some servers send raw deflate.
+
+    def __init__(self) -> None:
+        self._first = True
+        self._obj = fast_zlib.decompressobj()
+
+    def decompress(self, data: bytes) -> bytes:
+        if not self._first:
+            return self._obj.decompress(data)
+        self._first = False
+        try:
+            return self._obj.decompress(data)
+        except zlib.error:
+            self._obj = fast_zlib.decompressobj(-zlib.MAX_WBITS)
+            return self._obj.decompress(data)
+
+    def flush(self) -> bytes:
+        return self._obj.flush()
+
+
+class _GzipDecoder:
+    def __init__(self) -> None:
+        self._obj = fast_zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+    def decompress(self, data: bytes) -> bytes:
+        out = self._obj.decompress(data)
+        # Concatenated gzip members are legal; start over on the next one.
+        while self._obj.eof and self._obj.unused_data:
+            rest = self._obj.unused_data
+            self._obj = fast_zlib.decompressobj(16 + zlib.MAX_WBITS)
+            out += self._obj.decompress(rest)
+        return out
+
+    def flush(self) -> bytes:
+        return self._obj.flush()
+
+
+class _BrotliDecoder:
+    def __init__(self) -> None:
+        self._obj = brotli.Decompressor()
+
+    def decompress(self, data: bytes) -> bytes:
+        if hasattr(self._obj, "process"):
+            return self._obj.process(data)
+        return self._obj.decompress(data)
+
+    def flush(self) -> bytes:
+        return b""
+
+
+class _ZstdDecoder:
+    def __init__(self) -> None:
+        self._obj = zstandard.ZstdDecompressor().decompressobj()
+
+    def decompress(self, data: bytes) -> bytes:
+        return self._obj.decompress(data)
+
+    def flush(self) -> bytes:
+        return b""
+
+
+def _decode_errors() -> Tuple[type, ...]:
+    errors = {zlib.error, getattr(fast_zlib, "error", zlib.error)}
+    if brotli is not None:
+        errors.add(brotli.error)
+    if zstandard is not None:
+        errors.add(zstandard.ZstdError)
+    return tuple(errors)
+
+
+DECODE_ERRORS = _decode_errors()
+
+
+DECODERS = {
+    "gzip": _GzipDecoder,
+    "x-gzip": _GzipDecoder,
+    "deflate": _DeflateDecoder,
+    "br": _BrotliDecoder,
+    "zstd": _ZstdDecoder,
+}
+
+
+class BodyStats:
+    # Bytes and decode time of one response body. body_bytes is the body as
+    # transferred, content_bytes after Content-Encoding is undone; decode is
+    # None when the transport decoded the body itself (HTTP/2).
+
+    def __init__(self) -> None:
+        self.encoding: Optional[str] = None
+        self.body_bytes = 0
+        self.content_bytes = 0
+        self.decode: Optional[float] = 0.0
+
+
+def content_decoders(content_encoding: str) -> Optional[List[Any]]:
+    # Encodings are listed in the order they were applied; None means one of
+    # them is unknown and the body is left as it came.
+    names = [e.strip().lower() for e in content_encoding.split(",") if e.strip()]
+    names = [e for e in names if e != "identity"]
+    if any(e not in DECODERS or not _usable(e) for e in names):
+        return None
+    return [DECODERS[e]() for e in reversed(names)]
+
+
+def _usable(encoding: str) -> bool:
+    if encoding == "br":
+        return brotli is not None
+    if encoding == "zstd":
+        return zstandard is not None
+    return True
+
+
+def iter_body(
+    response: Any, stats: BodyStats, chunk_size: int = READ_CHUNK_SIZE
+) -> Iterator[bytes]:
+    # The decoded body of a streamed requests Response. The wire bytes are
+    # read undecoded and inflated here, so decoding is timed on its own.
+    # Reading the raw stream bypasses requests' error wrapping, so failures
+    # mid-body are raised as the requests exceptions callers already handle.
+    stats.encoding = response.headers.get("Content-Encoding")
+    stream = getattr(response.raw, "stream", None)
+    if stream is None:
+        content = response.content
+        stats.body_bytes = getattr(response.raw, "body_bytes", len(content))
+        stats.content_bytes = len(content)
+        stats.decode = None
+        yield content
+        return
+
+    decoders = content_decoders(stats.encoding or "")
+    if decoders is None:
+        print(f"W: Cannot decode Content-Encoding '{stats.encoding}'; body left as is")
+        decoders = []
+    try:
+        for chunk in stream(chunk_size, decode_content=False):
+            stats.body_bytes += len(chunk)
+            if decoders:
+                start = time.perf_counter()
+                chunk = _decode(decoders, chunk)
+                stats.decode += time.perf_counter() - start
+            stats.content_bytes += len(chunk)
+            if chunk:
+                yield chunk
+        if decoders:
+            start = time.perf_counter()
+            tail = _flush(decoders)
+            stats.decode += time.perf_counter() - start
+            stats.content_bytes += len(tail)
+            if tail:
+                yield tail
+    except ReadTimeoutError as e:
+        raise ReadTimeout(e)
+    except Urllib3SSLError as e:
+        raise SSLError(e)
+    except ProtocolError as e:
+        raise RequestsConnectionError(e)
+    except DECODE_ERRORS as e:
+        raise ContentDecodingError(e)
+    finally:
+        response._content_consumed = True
+
+
+def read_body(response: Any, stats: BodyStats) -> bytes:
+    content = b"".join(iter_body(response, stats))
+    response._content = content
+    return content
+
+
+def _decode(decoders: List[Any], data: bytes) -> bytes:
+    for decoder in decoders:
+        data = decoder.decompress(data)
+    return data
+
+
+def _flush(decoders: List[Any]) -> bytes:
+    data = b""
+    for decoder in decoders:
+        if data:
+            data = decoder.decompress(data)
+        data += decoder.flush()
+    return data
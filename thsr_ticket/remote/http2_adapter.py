@@ -0,0 +1,213 @@
+import os
+import ssl
+import time
+from http.client import HTTPMessage
+from typing import Any, Optional, Set, Tuple, Union
+
+import requests
+from requests.adapters import BaseAdapter
+from requests.cookies import extract_cookies_to_jar
+from requests.models import PreparedRequest, Response
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+from remote.retry_policy import (
+    REQUEST_RETRY_AFTER_MAX,
+    REQUEST_SCHEDULES,
+    RETRY_STATUSES,
+    decorrelated_jitter,
+    response_retry_after,
+    status_class,
+)
+from remote.tls_session import shared_ssl_context
+
+try:
+    import httpx
+except ImportError:  # pragma: no cover - exercised only without the extra
+    httpx = None
+
+try:
+    import h2  # noqa: F401
+except ImportError:  # pragma: no cover - exercised only without the extra
+    h2 = None
+
+
+# Connection-specific headers are forbidden on HTTP/2 streams; httpx sets its
+# own for HTTP/1.1 fallbacks.
+HOP_BY_HOP_HEADERS = frozenset(
+    {"connection", "keep-alive", "proxy-connection", "te", "transfer-encoding", "upgrade"}
+)
+
+
+def http2_available() -> bool:
+    return httpx is not None and h2 is not None
+
+
+class _HTTP2Raw:
+    # Just enough of urllib3's response for requests to read cookies from.
+
+    def __init__(
+        self, headers: "httpx.Headers", http_version: str, body_bytes: int = 0
+    ) -> None:
+        self.msg = HTTPMessage()
+        for key, value in headers.multi_items():
+            self.msg[key] = value
+        self.http_version = http_version
+        # The body as it came off the stream, before httpx decoded it.
+        self.body_bytes = body_bytes
+        self._original_response = self
+
+    def info(self) -> HTTPMessage:
+        return self.msg
+
+    def release_conn(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+class HTTP2Adapter(BaseAdapter):
+    # Sends requests through an httpx client that negotiates HTTP/2 over ALPN.
+    # Servers that do not offer h2 get HTTP/1.1 on the same client.
+
+    def __init__(
+        self,
+        max_retries: int = 0,
+        ssl_context: Optional[ssl.SSLContext] = None,
+    ) -> None:
+        if not http2_available():
+            raise ValueError(
+                "The HTTP/2 transport needs httpx with HTTP/2 support. "
+                "Install it with: pip install 'httpx[http2]'"
+            )
+        super().__init__()
+        self.max_retries = max_retries
+        self.ssl_context = ssl_context or shared_ssl_context(http2=True)
+        self.client = self._new_client(self.ssl_context)
+        # For requests sent with verify=False, built on first use.
+        self._unverified_client: Optional["httpx.Client"] = None
+        self._ca_locations: Set[str] = set()
+
+    def send(
+        self,
+        request: PreparedRequest,
+        stream: bool = False,
+        timeout: Union[None, float, Tuple[float, float]] = None,
+        verify: Union[bool, str] = True,
+        cert: Any = None,
+        proxies: Any = None,
+    ) -> Response:
+        # GETs are retried on throttling and server errors like the http1
+        # transport's JitteredRetry; connection failures are retried by the
+        # httpx transport.
+        client = self._client_for(verify)
+        retries = self.max_retries if request.method == "GET" else 0
+        delay = 0.0
+        for attempt in range(retries + 1):
+            incoming, content = self._send_once(client, request, timeout)
+            if incoming.status_code not in RETRY_STATUSES or attempt == retries:
+                break
+            delay = decorrelated_jitter(
+                REQUEST_SCHEDULES[status_class(incoming.status_code)], delay
+            )
+            retry_after = response_retry_after(incoming)
+            if retry_after is not None:
+                delay = max(delay, min(retry_after, REQUEST_RETRY_AFTER_MAX))
+            time.sleep(delay)
+
+        return self.build_response(request, incoming, content)
+
+    def _send_once(
+        self,
+        client: "httpx.Client",
+        request: PreparedRequest,
+        timeout: Union[None, float, Tuple[float, float]],
+    ) -> Tuple["httpx.Response", bytes]:
+        outgoing = httpx.Request(
+            request.method or "GET",
+            request.url or "",
+            headers=[
+                (key, value)
+                for key, value in request.headers.items()
+                if key.lower() not in HOP_BY_HOP_HEADERS
+            ],
+            content=request.body,
+            extensions={"timeout": _timeout(timeout).as_dict()},
+        )
+        try:
+            incoming = client.send(outgoing)
+            return incoming, incoming.read()
+        except httpx.TimeoutException as e:
+            raise requests.exceptions.Timeout(e, request=request)
+        except httpx.TransportError as e:
+            raise requests.exceptions.ConnectionError(e, request=request)
+        except httpx.HTTPError as e:
+            raise requests.exceptions.RequestException(e, request=request)
+        finally:
+            # Cookies belong to the requests session, not the httpx client.
+            client.cookies.clear()
+
+    def _client_for(self, verify: Union[bool, str]) -> "httpx.Client":
+        # verify means what it does for requests' own adapter: False skips
+        # certificate checks, and a CA bundle or directory is trusted on top
+        # of the context, as urllib3 loads it into the pool's context.
+        if verify is False:
+            if self._unverified_client is None:
+                self._unverified_client = self._new_client(_unverified_context())
+            return self._unverified_client
+        if isinstance(verify, str) and verify not in self._ca_locations:
+            if os.path.isdir(verify):
+                self.ssl_context.load_verify_locations(capath=verify)
+            else:
+                self.ssl_context.load_verify_locations(cafile=verify)
+            self._ca_locations.add(verify)
+        return self.client
+
+    def _new_client(self, context: ssl.SSLContext) -> "httpx.Client":
+        return httpx.Client(
+            transport=httpx.HTTPTransport(
+                http2=True, verify=context, retries=self.max_retries
+            ),
+            follow_redirects=False,
+            trust_env=False,
+        )
+
+    def build_response(
+        self, request: PreparedRequest, incoming: "httpx.Response", content: bytes
+    ) -> Response:
+        response = Response()
+        response.status_code = incoming.status_code
+        response.reason = incoming.reason_phrase
+        response.headers = CaseInsensitiveDict(incoming.headers.items())
+        response.encoding = get_encoding_from_headers(response.headers)
+        response.raw = _HTTP2Raw(
+            incoming.headers, incoming.http_version, incoming.num_bytes_downloaded
+        )
+        response.url = request.url or ""
+        response.request = request
+        response.connection = self
+        response._content = content
+        response._content_consumed = True
+        extract_cookies_to_jar(response.cookies, request, response.raw)
+        return response
+
+    def close(self) -> None:
+        self.client.close()
+        if self._unverified_client is not None:
+            self._unverified_client.close()
+            self._unverified_client = None
+
+
+def _timeout(timeout: Union[None, float, Tuple[float, float]]) -> "httpx.Timeout":
+    if isinstance(timeout, tuple):
+        connect, read = timeout
+        return httpx.Timeout(read, connect=connect)
+    return httpx.Timeout(timeout)
+
+
+def _unverified_context() -> ssl.SSLContext:
+    context = ssl.create_default_context()
+    context.check_hostname = False
+    context.verify_mode = ssl.CERT_NONE
+    return context
@@ -1,12 +1,17 @@
+import codecs
+import re
 import ssl
-from typing import Any, Optional
-from urllib.parse import urljoin
+import threading
+import time
+from html import unescape
+from html.parser import HTMLParser
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import urljoin, urlsplit
 
 import requests
-import truststore
 from requests.adapters import HTTPAdapter
 from requests.models import Response
-from urllib3.util.retry import Retry
+from urllib3.exceptions import ConnectTimeoutError, HTTPError
 
 from configs.web.http_config import HTTPConfig
 from configs.web.parse_html_element import BOOKING_PAGE
@@ -15,12 +20,30 @@ from configs.web.param_schema import (
     ConfirmTicketRequestParams,
     ConfirmTrainRequestParams,
 )
-from html_parser import parse_html
+from html_parser import DEFAULT_ENCODING, HTMLSource, declared_encoding, parse_forms
+from remote.content_encoding import BodyStats, accept_encoding, iter_body, read_body
+from remote.http2_adapter import HTTP2Adapter
+from remote.request_timing import RequestRecorder, RequestTiming
+from remote.retry_policy import REQUEST_RETRY_AFTER_MAX, RETRY_STATUSES, JitteredRetry
+from remote.tls_session import (
+    ResumingHTTPSConnection,
+    ResumingHTTPSConnectionPool,
+    shared_ssl_context,
+    tls_session_cache,
+)
+
+
+TRANSPORTS = ("http1", "http2")
+
+# Small enough that the captcha URL is seen before the whole page arrives.
+CAPTCHA_SCAN_CHUNK_SIZE = 4 * 1024
 
 
 class SystemTrustStoreHTTPAdapter(HTTPAdapter):
-    def __init__(self, *args: Any, **kwargs: Any) -> None:
-        self.ssl_context = truststore.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+    def __init__(
+        self, *args: Any, ssl_context: Optional[ssl.SSLContext] = None, **kwargs: Any
+    ) -> None:
+        self.ssl_context = ssl_context or shared_ssl_context()
         super().__init__(*args, **kwargs)
 
     def init_poolmanager(
@@ -32,6 +55,18 @@ class SystemTrustStoreHTTPAdapter(HTTPAdapter):
     ) -> None:
         pool_kwargs["ssl_context"] = self.ssl_context
         super().init_poolmanager(connections, maxsize, block=block, **pool_kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            **self.poolmanager.pool_classes_by_scheme,
+            "https": ResumingHTTPSConnectionPool,
+        }
+
+    def warm(
+        self, url: str, count: int, max_idle: Optional[float] = None, verify: Any = True
+    ) -> Tuple[int, int]:
+        # Warms the same pool that requests for `url` will be sent through.
+        request = requests.Request("GET", url).prepare()
+        pool = self.get_connection_with_tls_context(request, verify)
+        return pool.warm(count, max_idle)
 
     def proxy_manager_for(self, proxy: str, **proxy_kwargs: Any) -> Any:
         proxy_kwargs["ssl_context"] = self.ssl_context
@@ -39,37 +74,123 @@ class SystemTrustStoreHTTPAdapter(HTTPAdapter):
 
 
 class HTTPRequest:
-    def __init__(self, max_retries: int = 3, timeout: int = 15) -> None:
+    def __init__(
+        self,
+        max_retries: int = 3,
+        timeout: int = 15,
+        transport: str = "http1",
+        ssl_context: Optional[ssl.SSLContext] = None,
+    ) -> None:
+        if transport not in TRANSPORTS:
+            raise ValueError(
+                f"Unknown transport '{transport}'. Choose one of: {list(TRANSPORTS)}"
+            )
+        self.transport = transport
         self.sess = requests.Session()
-        retry_cfg = Retry(
+        retry_cfg = JitteredRetry(
             total=max_retries,
             connect=max_retries,
             read=max_retries,
-            backoff_factor=0.3,
             allowed_methods=frozenset(["GET"]),
-            status_forcelist=[429, 500, 502, 503, 504],
+            status_forcelist=RETRY_STATUSES,
             raise_on_status=False,
+            retry_after_max=REQUEST_RETRY_AFTER_MAX,
         )
-        self.sess.mount("https://", SystemTrustStoreHTTPAdapter(max_retries=retry_cfg))
+        if transport == "http2":
+            adapter: Any = HTTP2Adapter(max_retries=max_retries, ssl_context=ssl_context)
+        else:
+            adapter = SystemTrustStoreHTTPAdapter(
+                max_retries=retry_cfg, ssl_context=ssl_context
+            )
+        self.sess.mount("https://", adapter)
         self.timeout = timeout
 
-        self.common_head_html: dict = {
-            "Host": HTTPConfig.HTTPHeader.BOOKING_PAGE_HOST,
-            "User-Agent": HTTPConfig.HTTPHeader.USER_AGENT,
-            "Accept": HTTPConfig.HTTPHeader.ACCEPT_HTML,
-            "Accept-Language": HTTPConfig.HTTPHeader.ACCEPT_LANGUAGE,
-            "Accept-Encoding": HTTPConfig.HTTPHeader.ACCEPT_ENCODING,
-        }
+        self.common_head_html: dict = html_headers()
+        # Hooks added with timings.add_hook() get every RequestTiming.
+        self.timings = RequestRecorder()
+        # The reCodeLink Ajax URL read from the last booking page.
+        self.recode_link: Optional[str] = None
+
+    def prefetch_dns(self) -> Optional[threading.Thread]:
+        # Resolves the booking host in the background while the caller is
+        # still getting ready. Only the http1 transport uses the DNS cache.
+        if self.transport != "http1":
+            return None
+        booking_host = urlsplit(HTTPConfig.BOOKING_PAGE_URL)
+        return ResumingHTTPSConnection.resolver.prefetch(
+            booking_host.hostname or "", booking_host.port or 443
+        )
+
+    def tls_stats(self) -> Dict[str, Any]:
+        return tls_session_cache().stats()
+
+    def warm_up(
+        self, connections: int = 4, max_idle: Optional[float] = None
+    ) -> Tuple[int, int]:
+        # Opens connections to the booking host ahead of time and replaces the
+        # ones that went stale, so the next requests skip DNS, TCP and TLS.
+        # Returns (opened, kept).
+        url = HTTPConfig.BOOKING_PAGE_URL
+        adapter = self.sess.get_adapter(url)
+        if not isinstance(adapter, SystemTrustStoreHTTPAdapter):
+            raise ValueError("Connection warm-up needs the http1 transport")
+        # requests folds REQUESTS_CA_BUNDLE and friends into the pool key, so
+        # resolve verify the same way to warm the pool requests will use.
+        verify = self.sess.merge_environment_settings(url, {}, None, None, None)["verify"]
+        try:
+            return adapter.warm(url, connections, max_idle, verify)
+        except (ConnectTimeoutError, TimeoutError):
+            raise TimeoutError("Timeout: Booking host took too long to connect")
+        except (HTTPError, OSError) as e:
+            raise ConnectionError(f"Request Error: {e}")
+
+    def reset_session(self) -> None:
+        # Drop the server-side booking state (JSESSIONID and friends) while
+        # keeping the pooled connections and their TLS sessions warm.
+        self.sess.cookies.clear()
+        self.timings.clear()
+        self.recode_link = None
+
+    def attempt_summary(self) -> Dict[str, Any]:
+        # Covers the requests since the last reset_session(), i.e. one attempt.
+        return self.timings.summary()
+
+    def request_booking_page(
+        self, on_captcha_url: Optional[Callable[[str], None]] = None
+    ) -> Response:
+        # With on_captcha_url the page is streamed and the callback gets the
+        # captcha URL as soon as the captcha panel arrives, before the body
+        # completes. The panel's reCodeLink is kept for
+        # request_new_security_code().
+        self.recode_link = None
+
+        def captcha_found(img_url: str, recode_link: Optional[str]) -> None:
+            self.recode_link = recode_link
+            if on_captcha_url is not None:
+                on_captcha_url(img_url)
 
-    def request_booking_page(self) -> Response:
         try:
-            response = self.sess.get(
+            response = self._send(
+                "GET",
                 HTTPConfig.BOOKING_PAGE_URL,
-                headers=self.common_head_html,
+                "booking_page",
+                read=(
+                    (
+                        lambda resp, stats: _read_with_captcha_scan(
+                            resp, captcha_found, stats
+                        )
+                    )
+                    if on_captcha_url is not None
+                    else None
+                ),
                 allow_redirects=True,
-                timeout=self.timeout,
             )
             response.raise_for_status()
+            if on_captcha_url is None:
+                html = response.content.decode(
+                    declared_encoding(response) or DEFAULT_ENCODING, errors="replace"
+                )
+                self.recode_link = find_recode_link(html, response.url)
 
             jsessionid = self.sess.cookies.get("JSESSIONID")
 
@@ -83,13 +204,14 @@ class HTTPRequest:
 
         return response
 
-    def request_security_code_img(self, book_page: bytes) -> Response:
-        img_url = parse_security_img_url(book_page)
+    def request_security_code_img(
+        self, book_page: Optional[HTMLSource] = None, img_url: Optional[str] = None
+    ) -> Response:
+        if img_url is None:
+            img_url = parse_security_img_url(book_page)
 
         try:
-            response = self.sess.get(
-                img_url, headers=self.common_head_html, timeout=self.timeout
-            )
+            response = self._send("GET", img_url, "security_code_img")
             response.raise_for_status()
         except requests.exceptions.Timeout:
             raise TimeoutError("Timeout: Security code image took too long to respond")
@@ -98,6 +220,24 @@ class HTTPRequest:
 
         return response
 
+    def request_new_security_code(self, img_url: str) -> str:
+        # Asks the page's "another code" link for a new captcha in this
+        # session and returns the URL of its image.
+        try:
+            response = self._send(
+                "GET",
+                self.recode_link or recode_url(img_url),
+                "security_code_recode",
+                headers=WICKET_AJAX_HEADERS,
+            )
+            response.raise_for_status()
+        except requests.exceptions.Timeout:
+            raise TimeoutError("Timeout: New security code took too long to respond")
+        except requests.exceptions.RequestException as e:
+            raise ConnectionError(f"Request Error: {e}")
+
+        return recoded_img_url(response.text, img_url)
+
     def submit_booking_form(
         self, params: BookingRequestParams, action_url: Optional[str] = None
     ) -> Response:
@@ -112,12 +252,8 @@ class HTTPRequest:
         )
 
         try:
-            response = self.sess.post(
-                url,
-                headers=self.common_head_html,
-                data=params,
-                allow_redirects=True,
-                timeout=self.timeout,
+            response = self._send(
+                "POST", url, "submit_booking_form", data=params, allow_redirects=True
             )
             response.raise_for_status()
         except requests.exceptions.Timeout:
@@ -136,12 +272,8 @@ class HTTPRequest:
             else HTTPConfig.CONFIRM_TRAIN_URL
         )
         try:
-            response = self.sess.post(
-                url,
-                headers=self.common_head_html,
-                data=params,
-                allow_redirects=True,
-                timeout=self.timeout,
+            response = self._send(
+                "POST", url, "submit_train", data=params, allow_redirects=True
             )
             response.raise_for_status()
         except requests.exceptions.Timeout:
@@ -160,12 +292,8 @@ class HTTPRequest:
             else HTTPConfig.CONFIRM_TICKET_URL
         )
         try:
-            response = self.sess.post(
-                url,
-                headers=self.common_head_html,
-                data=params,
-                allow_redirects=True,
-                timeout=self.timeout,
+            response = self._send(
+                "POST", url, "submit_ticket", data=params, allow_redirects=True
             )
             response.raise_for_status()
         except requests.exceptions.Timeout:
@@ -176,14 +304,288 @@ class HTTPRequest:
         return response
 
     def _resolve_url(self, action_url: Optional[str]) -> str:
-        if not action_url:
-            raise ValueError("Form action URL is empty")
-        return urljoin(HTTPConfig.BASE_URL, action_url)
+        return resolve_form_url(action_url)
+
+    def _send(
+        self,
+        method: str,
+        url: str,
+        label: str,
+        read: Optional[Callable[[Response, BodyStats], None]] = None,
+        **kwargs: Any,
+    ) -> Response:
+        # The body is read here, apart from the headers, so waiting for the
+        # server and downloading the page are timed separately.
+        start = time.perf_counter()
+        response: Optional[Response] = None
+        headers_at: Optional[float] = None
+        connection = None
+        body = BodyStats()
+        headers = {**self.common_head_html, **kwargs.pop("headers", {})}
+        try:
+            response = self.sess.request(
+                method,
+                url,
+                headers=headers,
+                timeout=self.timeout,
+                stream=True,
+                **kwargs,
+            )
+            headers_at = time.perf_counter()
+            # Read before the body is consumed and the connection released.
+            connection = _connection_info(response)
+            if read is not None:
+                read(response, body)
+            else:
+                read_body(response, body)
+        except Exception as e:
+            self.timings.record(
+                _request_timing(
+                    label, method, url, start, headers_at, response, connection, body, e
+                )
+            )
+            raise
+        self.timings.record(
+            _request_timing(label, method, url, start, headers_at, response, connection, body)
+        )
+        return response
+
+
+def _connection_info(response: Response) -> Optional[Tuple[Any, bool]]:
+    connection = getattr(response.raw, "connection", None)
+    timing = getattr(connection, "connect_timing", None)
+    if timing is None:
+        return None
+    return timing, connection.reused
+
+
+def _request_timing(
+    label: str,
+    method: str,
+    url: str,
+    start: float,
+    headers_at: Optional[float],
+    response: Optional[Response],
+    connection: Optional[Tuple[Any, bool]],
+    body: BodyStats,
+    error: Optional[Exception] = None,
+) -> RequestTiming:
+    end = time.perf_counter()
+    dns = connect = tls = None
+    reused = None
+    if connection is not None:
+        timing, reused = connection
+        dns, connect, tls = (0.0, 0.0, 0.0) if reused else timing
+
+    ttfb = download = None
+    if headers_at is not None:
+        ttfb = max(0.0, headers_at - start - (dns or 0.0) - (connect or 0.0) - (tls or 0.0))
+        download = end - headers_at
+
+    status = bytes_sent = bytes_received = retries = None
+    if response is not None:
+        status = response.status_code
+        bytes_sent = _request_size(response.request)
+        bytes_received = _response_size(response)
+        history = getattr(getattr(response.raw, "retries", None), "history", None)
+        retries = len(history or ())
+    return RequestTiming(
+        label=label,
+        started=start,
+        method=method,
+        url=url,
+        status=status,
+        dns=dns,
+        connect=connect,
+        tls=tls,
+        ttfb=ttfb,
+        download=download,
+        total=end - start,
+        bytes_sent=bytes_sent or 0,
+        bytes_received=bytes_received or 0,
+        retries=retries or 0,
+        reused=reused,
+        error=type(error).__name__ if error is not None else None,
+        encoding=body.encoding,
+        body_bytes=body.body_bytes,
+        content_bytes=body.content_bytes,
+        decode=body.decode,
+    )
 
 
-def parse_security_img_url(html: bytes) -> str:
-    page = parse_html(html)
+def _request_size(request: Any) -> int:
+    # Request line, headers and body as sent for HTTP/1.1.
+    size = len(f"{request.method} {request.path_url} HTTP/1.1\r\n") + 2
+    size += sum(len(k) + len(v) + 4 for k, v in request.headers.items())
+    body = request.body
+    if isinstance(body, str):
+        body = body.encode("utf-8")
+    return size + len(body or b"")
+
+
+def _response_size(response: Response) -> int:
+    # Status line and headers, plus the body as transferred (before any
+    # Content-Encoding is undone) when the transport can tell.
+    size = len(f"HTTP/1.1 {response.status_code} {response.reason}\r\n") + 2
+    size += sum(len(k) + len(v) + 4 for k, v in response.headers.items())
+    tell = getattr(response.raw, "tell", None)
+    if callable(tell):
+        return size + tell()
+    content = getattr(response, "_content", None)
+    return size + (len(content) if isinstance(content, bytes) else 0)
+
+
+def html_headers() -> Dict[str, str]:
+    return {
+        "Host": HTTPConfig.HTTPHeader.BOOKING_PAGE_HOST,
+        "User-Agent": HTTPConfig.HTTPHeader.USER_AGENT,
+        "Accept": HTTPConfig.HTTPHeader.ACCEPT_HTML,
+        "Accept-Language": HTTPConfig.HTTPHeader.ACCEPT_LANGUAGE,
+        "Accept-Encoding": accept_encoding(HTTPConfig.HTTPHeader.ACCEPT_ENCODING),
+    }
+
+
+def resolve_form_url(action_url: Optional[str]) -> str:
+    if not action_url:
+        raise ValueError("Form action URL is empty")
+    return urljoin(HTTPConfig.BASE_URL, action_url)
+
+
+def parse_security_img_url(html: HTMLSource) -> str:
+    # The captcha image is rendered inside BookingS1Form.
+    page = parse_forms(html)
     element = page.find(**BOOKING_PAGE["security_code_img"])
     if element and "src" in element.attrs:
         return urljoin(HTTPConfig.BASE_URL, str(element["src"]))
     raise ValueError("Captcha image not found")
+
+
+# Sent by Wicket's own Ajax calls; without it a behavior answers with a page.
+WICKET_AJAX_HEADERS = {"Wicket-Ajax": "true", "Accept": "text/xml"}
+
+RECODE_IMG = re.compile(
+    r"<img\b[^>]*\bid=[\"']%s[\"'][^>]*>" % re.escape(BOOKING_PAGE["security_code_img"]["id"])
+)
+IMG_SRC = re.compile(r"\bsrc=[\"']([^\"']+)[\"']")
+RECODE_LINK = re.compile(
+    r"<a\b[^>]*\bid=[\"']%s[\"'][^>]*>" % re.escape(BOOKING_PAGE["security_code_recode"]["id"])
+)
+# Wicket 1.4 renders an AjaxLink as href="#" with
+# onclick="var wcall=wicketAjaxGet('<behavior URL>', ...);return !wcall;".
+WICKET_AJAX_GET = re.compile(r"wicketAjaxGet\(\s*[\"']([^\"']+)[\"']")
+
+
+def ajax_link_url(attrs: Dict[str, Optional[str]], page_url: str) -> Optional[str]:
+    # The behavior URL of a Wicket Ajax link, from its (unescaped) onclick
+    # or href attribute.
+    for name in ("onclick", "href"):
+        found = WICKET_AJAX_GET.search(attrs.get(name) or "")
+        if found:
+            return urljoin(page_url, found.group(1))
+    return None
+
+
+def find_recode_link(html: str, page_url: str) -> Optional[str]:
+    tag = RECODE_LINK.search(html)
+    found = WICKET_AJAX_GET.search(unescape(tag.group(0))) if tag else None
+    return urljoin(page_url, found.group(1)) if found else None
+
+
+def recode_url(img_url: str) -> str:
+    # Only used when the page's reCodeLink carries no Ajax URL: the link is
+    # an Ajax link on the same Wicket page version as the image, and its
+    # behavior draws a new code for the session. The image URL alone only
+    # defeats browser caching and serves the old code.
+    base, _, query = img_url.partition("?")
+    params = []
+    for param in query.split("&"):
+        if not param or param.startswith("wicket:antiCache="):
+            continue
+        if param.startswith("wicket:interface="):
+            param = param.replace(
+                ":passCode::IResourceListener", ":reCodeLink::IBehaviorListener"
+            )
+        params.append(param)
+    params.append("wicket:behaviorId=0")
+    return f"{base}?{'&'.join(params)}"
+
+
+def recoded_img_url(ajax_response: str, img_url: str) -> str:
+    # The Ajax response re-renders the image with a fresh antiCache value;
+    # if it does not, the old resource URL with a new one serves the new code.
+    tag = RECODE_IMG.search(ajax_response)
+    src = IMG_SRC.search(tag.group(0)) if tag else None
+    if src:
+        # Wicket writes it relative to the page, e.g. "?wicket:interface=...".
+        return urljoin(img_url, unescape(src.group(1)))
+    return refresh_security_img_url(img_url)
+
+
+def refresh_security_img_url(img_url: str) -> str:
+    # A new antiCache value only makes the browser fetch the image again;
+    # call recode_url() first so there is a new code to fetch.
+    base, _, query = img_url.partition("?")
+    params = [p for p in query.split("&") if p and not p.startswith("wicket:antiCache=")]
+    params.append(f"wicket:antiCache={int(time.time() * 1000)}")
+    return f"{base}?{'&'.join(params)}"
+
+
+class SecurityImgScanner(HTMLParser):
+    # Finds the captcha <img>, and the reCodeLink that follows it, in a page
+    # fed piece by piece, without a tree.
+
+    def __init__(self, encoding: Optional[str] = None, page_url: Optional[str] = None) -> None:
+        super().__init__()
+        self.element_id = BOOKING_PAGE["security_code_img"]["id"]
+        self.recode_id = BOOKING_PAGE["security_code_recode"]["id"]
+        self.page_url = page_url or HTTPConfig.BOOKING_PAGE_URL
+        self.decoder = codecs.getincrementaldecoder(encoding or DEFAULT_ENCODING)(
+            errors="replace"
+        )
+        self.url: Optional[str] = None
+        self.recode_link: Optional[str] = None
+        self.recode_seen = False
+
+    def feed_bytes(self, chunk: bytes) -> Optional[str]:
+        if self.url is None or not self.recode_seen:
+            self.feed(self.decoder.decode(chunk))
+        return self.url
+
+    def handle_starttag(self, tag: str, attrs: List[Tuple[str, Optional[str]]]) -> None:
+        if tag == "img" and self.url is None:
+            values = dict(attrs)
+            if values.get("id") == self.element_id and values.get("src"):
+                self.url = urljoin(HTTPConfig.BASE_URL, str(values["src"]))
+        elif tag == "a" and not self.recode_seen:
+            values = dict(attrs)
+            if values.get("id") == self.recode_id:
+                self.recode_seen = True
+                self.recode_link = ajax_link_url(values, self.page_url)
+
+
+def find_security_img_url(html: bytes, encoding: Optional[str] = None) -> Optional[str]:
+    return SecurityImgScanner(encoding).feed_bytes(html)
+
+
+def _read_with_captcha_scan(
+    response: Response,
+    on_captcha: Callable[[str, Optional[str]], None],
+    stats: BodyStats,
+) -> None:
+    # on_captcha gets the image URL and the reCodeLink URL once both tags
+    # are in; they sit next to each other, so waiting for the link costs
+    # nothing. A page without the link reports at the end of the body.
+    scanner = SecurityImgScanner(declared_encoding(response), response.url)
+    reported = False
+    chunks: List[bytes] = []
+    for chunk in iter_body(response, stats, CAPTCHA_SCAN_CHUNK_SIZE):
+        chunks.append(chunk)
+        if not reported:
+            scanner.feed_bytes(chunk)
+            if scanner.url and scanner.recode_seen:
+                on_captcha(scanner.url, scanner.recode_link)
+                reported = True
+    if not reported and scanner.url:
+        on_captcha(scanner.url, None)
+    # Later stages read response.content as usual.
+    response._content = b"".join(chunks)
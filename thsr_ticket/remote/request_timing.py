@@ -0,0 +1,186 @@
+import socket
+import time
+from collections import deque, namedtuple
+from typing import Any, Callable, Deque, Dict, List, Optional, Sequence, Tuple
+
+from urllib3.util.connection import allowed_gai_family
+
+from remote.resolver import DNSCache, connect_first
+
+
+# How one connection was set up; seconds per phase.
+ConnectTiming = namedtuple("ConnectTiming", ["dns", "connect", "tls"])
+
+# One request as seen by HTTPRequest. Phase times are seconds; dns, connect
+# and tls are zero on a reused connection and None when the transport does
+# not report them (HTTP/2). ttfb is the time left between sending and the
+# response headers, so it holds the server's think time plus retries.
+# started is a time.perf_counter() value. body_bytes is the body as
+# transferred and content_bytes the body after Content-Encoding is undone;
+# decode is the part of download spent decompressing (None when the
+# transport decodes the body itself).
+RequestTiming = namedtuple(
+    "RequestTiming",
+    [
+        "label",
+        "started",
+        "method",
+        "url",
+        "status",
+        "dns",
+        "connect",
+        "tls",
+        "ttfb",
+        "download",
+        "total",
+        "bytes_sent",
+        "bytes_received",
+        "retries",
+        "reused",
+        "error",
+        "encoding",
+        "body_bytes",
+        "content_bytes",
+        "decode",
+    ],
+    defaults=(None, 0, 0, None),
+)
+
+PHASES = ("dns", "connect", "tls", "ttfb", "download")
+
+TimingHook = Callable[[RequestTiming], None]
+
+
+def create_connection(
+    address: Tuple[str, int],
+    timeout: Any,
+    source_address: Optional[Tuple[str, int]] = None,
+    socket_options: Optional[Sequence[Tuple[int, int, Any]]] = None,
+    resolver: Optional[DNSCache] = None,
+) -> Tuple[socket.socket, float, float]:
+    # urllib3's create_connection, split so name resolution and the TCP
+    # connect are timed separately, with names served from `resolver` and
+    # the addresses raced Happy Eyeballs style. Returns
+    # (sock, dns_seconds, connect_seconds).
+    host, port = address
+    if host.startswith("["):
+        host = host.strip("[]")
+
+    start = time.perf_counter()
+    if resolver is not None:
+        addresses = resolver.resolve(host, port, allowed_gai_family())
+    else:
+        addresses = socket.getaddrinfo(host, port, allowed_gai_family(), socket.SOCK_STREAM)
+    resolved = time.perf_counter()
+
+    sock = connect_first(addresses, timeout, source_address, socket_options)
+    return sock, resolved - start, time.perf_counter() - resolved
+
+
+class RequestRecorder:
+    # Keeps the latest request timings and passes each one to the hooks.
+
+    def __init__(self, history: int = 200) -> None:
+        self.records: Deque[RequestTiming] = deque(maxlen=history)
+        self.hooks: List[TimingHook] = []
+
+    def add_hook(self, hook: TimingHook) -> None:
+        self.hooks.append(hook)
+
+    def remove_hook(self, hook: TimingHook) -> None:
+        self.hooks.remove(hook)
+
+    def record(self, timing: RequestTiming) -> None:
+        self.records.append(timing)
+        for hook in list(self.hooks):
+            try:
+                hook(timing)
+            except Exception as e:
+                print(f"W: Request timing hook failed: {e}")
+
+    def clear(self) -> None:
+        self.records.clear()
+
+    def summary(self) -> Dict[str, Any]:
+        return summarize(list(self.records))
+
+
+def summarize(records: Sequence[RequestTiming]) -> Dict[str, Any]:
+    phases = {
+        phase: sum(getattr(r, phase) or 0.0 for r in records) for phase in PHASES
+    }
+    slowest = max(records, key=lambda r: r.total, default=None)
+    # Requests may overlap (the captcha is fetched during the S1 download),
+    # so wall time is measured from the first start to the last finish.
+    wall = (
+        max(r.started + r.total for r in records) - min(r.started for r in records)
+        if records
+        else 0.0
+    )
+    return {
+        "requests": len(records),
+        "total": sum(r.total for r in records),
+        "wall": wall,
+        "phases": phases,
+        "bytes_sent": sum(r.bytes_sent for r in records),
+        "bytes_received": sum(r.bytes_received for r in records),
+        "retries": sum(r.retries for r in records),
+        "reused": sum(1 for r in records if r.reused),
+        "errors": sum(1 for r in records if r.error),
+        "slowest": slowest.label if slowest else None,
+        "stages": stage_bytes(records),
+    }
+
+
+def stage_bytes(records: Sequence[RequestTiming]) -> Dict[str, Dict[str, Any]]:
+    # Per label: bytes on the wire against bytes after decoding, and the
+    # download time split into network and decompression. A stage with
+    # network time but little decode time is bound by bandwidth; one whose
+    # decode time stands out is bound by CPU.
+    stages: Dict[str, Dict[str, Any]] = {}
+    for r in records:
+        stage = stages.setdefault(
+            r.label,
+            {
+                "requests": 0,
+                "encodings": [],
+                "body_bytes": 0,
+                "content_bytes": 0,
+                "network": 0.0,
+                "decode": 0.0,
+            },
+        )
+        stage["requests"] += 1
+        encoding = r.encoding or "identity"
+        if encoding not in stage["encodings"]:
+            stage["encodings"].append(encoding)
+        stage["body_bytes"] += r.body_bytes
+        stage["content_bytes"] += r.content_bytes
+        stage["network"] += max(0.0, (r.download or 0.0) - (r.decode or 0.0))
+        stage["decode"] += r.decode or 0.0
+    return stages
+
+
+def format_summary(summary: Dict[str, Any]) -> str:
+    phases = ", ".join(
+        f"{phase} {seconds * 1000:.0f}" for phase, seconds in summary["phases"].items()
+    )
+    return (
+        f"{summary['requests']} requests in {summary['wall'] * 1000:.0f} ms "
+        f"({phases} ms), {summary['bytes_sent']} B sent, "
+        f"{summary['bytes_received']} B received, {summary['retries']} retries, "
+        f"{summary['reused']} on reused connections, slowest: {summary['slowest']}"
+    )
+
+
+def format_stage_bytes(summary: Dict[str, Any]) -> List[str]:
+    lines = []
+    for label, stage in summary["stages"].items():
+        ratio = stage["content_bytes"] / stage["body_bytes"] if stage["body_bytes"] else 1.0
+        lines.append(
+            f"{label}: {stage['body_bytes']} B on the wire, "
+            f"{stage['content_bytes']} B decoded ({'/'.join(stage['encodings'])}, "
+            f"x{ratio:.1f}), network {stage['network'] * 1000:.1f} ms, "
+            f"decode {stage['decode'] * 1000:.1f} ms"
+        )
+    return lines
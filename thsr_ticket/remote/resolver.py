@@ -0,0 +1,289 @@
+import errno
+import ipaddress
+import os
+import selectors
+import socket
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from urllib3.util.connection import _set_socket_options
+from urllib3.util.timeout import _DEFAULT_TIMEOUT
+
+try:
+    import dns.exception
+    import dns.resolver
+except ImportError:  # pragma: no cover - depends on the optional extra
+    dns = None
+
+
+# (family, type, proto, canonname, sockaddr), as socket.getaddrinfo returns.
+AddrInfo = Tuple[int, int, int, str, Any]
+Lookup = Callable[[str, int], Tuple[List[AddrInfo], float]]
+
+# getaddrinfo() does not report TTLs; its answers are kept this long.
+DEFAULT_TTL = 60.0
+MIN_TTL = 5.0
+MAX_TTL = 600.0
+# dnspython gives up on a name after this many seconds.
+DNS_LIFETIME = 3.0
+# RFC 8305 "Connection Attempt Delay": how long one address gets before the
+# next one is tried alongside it.
+CONNECTION_ATTEMPT_DELAY = 0.25
+
+# connect_ex() results that mean the attempt is under way.
+_IN_PROGRESS = frozenset(
+    {0, errno.EINPROGRESS, errno.EWOULDBLOCK, getattr(errno, "WSAEWOULDBLOCK", 10035)}
+)
+
+
+def system_lookup(host: str, port: int) -> Tuple[List[AddrInfo], float]:
+    return socket.getaddrinfo(host, port, socket.AF_UNSPEC, socket.SOCK_STREAM), DEFAULT_TTL
+
+
+def dnspython_lookup(host: str, port: int) -> Tuple[List[AddrInfo], float]:
+    # Queries AAAA and A records so the answers come with their TTLs. Names
+    # the DNS does not know (localhost, /etc/hosts entries) fall back to the
+    # system resolver.
+    if _is_ip_literal(host):
+        return system_lookup(host, port)
+    resolver = dns.resolver.get_default_resolver()
+    infos: List[AddrInfo] = []
+    ttls: List[float] = []
+    for rdtype, family in (("AAAA", socket.AF_INET6), ("A", socket.AF_INET)):
+        try:
+            answer = resolver.resolve(host, rdtype, lifetime=DNS_LIFETIME)
+        except (dns.resolver.NoAnswer, dns.resolver.NXDOMAIN):
+            continue
+        except dns.exception.DNSException:
+            return system_lookup(host, port)
+        ttls.append(answer.rrset.ttl)
+        for record in answer:
+            sockaddr: Any = (record.address, port)
+            if family == socket.AF_INET6:
+                sockaddr = (record.address, port, 0, 0)
+            infos.append((family, socket.SOCK_STREAM, socket.IPPROTO_TCP, "", sockaddr))
+    if not infos:
+        return system_lookup(host, port)
+    return infos, min(ttls)
+
+
+def default_lookup() -> Lookup:
+    return dnspython_lookup if dns is not None else system_lookup
+
+
+def _is_ip_literal(host: str) -> bool:
+    try:
+        ipaddress.ip_address(host.strip("[]"))
+    except ValueError:
+        return False
+    return True
+
+
+class DNSCache:
+    # Resolved addresses per (host, port), kept for the record TTL (clamped
+    # to min_ttl..max_ttl). Concurrent lookups of one name wait for a single
+    # query, and a stale answer is used when the resolver fails.
+
+    def __init__(
+        self,
+        lookup: Optional[Lookup] = None,
+        min_ttl: float = MIN_TTL,
+        max_ttl: float = MAX_TTL,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.lookup = lookup or default_lookup()
+        self.min_ttl = min_ttl
+        self.max_ttl = max_ttl
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._entries: Dict[Tuple[str, int], Tuple[float, List[AddrInfo]]] = {}
+        self._lock = threading.Lock()
+        self._key_locks: Dict[Tuple[str, int], threading.Lock] = {}
+
+    def resolve(self, host: str, port: int, family: int = socket.AF_UNSPEC) -> List[AddrInfo]:
+        key = (host.lower(), port)
+        addresses = self._fresh(key)
+        if addresses is None:
+            with self._key_lock(key):
+                addresses = self._fresh(key)
+                if addresses is None:
+                    addresses = self._refresh(key)
+        else:
+            with self._lock:
+                self.hits += 1
+        if family != socket.AF_UNSPEC:
+            addresses = [a for a in addresses if a[0] == family]
+            if not addresses:
+                raise socket.gaierror(
+                    socket.EAI_FAMILY, f"No address of the requested family for {host}"
+                )
+        return addresses
+
+    def prefetch(self, host: str, port: int = 443) -> Optional[threading.Thread]:
+        # Resolves in the background so the first connection finds the answer.
+        if not host or self._fresh((host.lower(), port)) is not None:
+            return None
+
+        def run() -> None:
+            try:
+                self.resolve(host, port)
+            except OSError as e:
+                print(f"W: Could not pre-resolve {host}: {e}")
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        return thread
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "names": len(self._entries)}
+
+    def _fresh(self, key: Tuple[str, int]) -> Optional[List[AddrInfo]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > self.clock():
+                return entry[1]
+            return None
+
+    def _refresh(self, key: Tuple[str, int]) -> List[AddrInfo]:
+        with self._lock:
+            self.misses += 1
+            stale = self._entries.get(key)
+        try:
+            addresses, ttl = self.lookup(*key)
+        except OSError:
+            if stale is None:
+                raise
+            return stale[1]
+        ttl = min(self.max_ttl, max(self.min_ttl, ttl))
+        with self._lock:
+            self._entries[key] = (self.clock() + ttl, addresses)
+        return addresses
+
+    def _key_lock(self, key: Tuple[str, int]) -> threading.Lock:
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+
+_dns_cache = DNSCache()
+
+
+def dns_cache() -> DNSCache:
+    return _dns_cache
+
+
+def interleave_families(addresses: Sequence[AddrInfo]) -> List[AddrInfo]:
+    # RFC 8305 section 4: alternate families, starting with the resolver's
+    # first choice, so one broken family costs at most one attempt delay.
+    if not addresses:
+        return []
+    first = addresses[0][0]
+    preferred = [a for a in addresses if a[0] == first]
+    others = [a for a in addresses if a[0] != first]
+    ordered: List[AddrInfo] = []
+    for i in range(max(len(preferred), len(others))):
+        ordered.extend(preferred[i : i + 1])
+        ordered.extend(others[i : i + 1])
+    return ordered
+
+
+def connect_first(
+    addresses: Sequence[AddrInfo],
+    timeout: Any,
+    source_address: Optional[Tuple[str, int]] = None,
+    socket_options: Optional[Sequence[Tuple[int, int, Any]]] = None,
+    attempt_delay: float = CONNECTION_ATTEMPT_DELAY,
+) -> socket.socket:
+    # Happy Eyeballs: start on the next address every attempt_delay seconds
+    # (at once when an attempt fails) and keep the first socket to connect.
+    # timeout bounds the whole race, like a single connect in urllib3.
+    addresses = interleave_families(addresses)
+    if len(addresses) == 1:
+        return _connect_one(addresses[0], timeout, source_address, socket_options)
+
+    deadline = None
+    if timeout is not _DEFAULT_TIMEOUT and timeout is not None:
+        deadline = time.monotonic() + timeout
+    waiting = list(addresses)
+    selector = selectors.DefaultSelector()
+    pending: List[socket.socket] = []
+    err: Optional[OSError] = None
+    try:
+        while waiting or pending:
+            if waiting:
+                sock = None
+                try:
+                    af, socktype, proto, _, sa = waiting.pop(0)
+                    sock = socket.socket(af, socktype, proto)
+                    _set_socket_options(sock, socket_options)
+                    if source_address:
+                        sock.bind(source_address)
+                    sock.setblocking(False)
+                    code = sock.connect_ex(sa)
+                    if code not in _IN_PROGRESS:
+                        raise OSError(code, os.strerror(code))
+                    selector.register(sock, selectors.EVENT_WRITE)
+                    pending.append(sock)
+                except OSError as e:
+                    err = e
+                    if sock is not None:
+                        sock.close()
+                    continue
+
+            wait = attempt_delay if waiting else None
+            if deadline is not None:
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    raise socket.timeout("timed out")
+                wait = left if wait is None else min(wait, left)
+
+            for key, _ in selector.select(wait):
+                sock = key.fileobj  # type: ignore[assignment]
+                selector.unregister(sock)
+                pending.remove(sock)
+                code = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+                if code == 0:
+                    sock.setblocking(True)
+                    sock.settimeout(
+                        socket.getdefaulttimeout() if timeout is _DEFAULT_TIMEOUT else timeout
+                    )
+                    return sock
+                err = OSError(code, os.strerror(code))
+                sock.close()
+    finally:
+        for sock in pending:
+            sock.close()
+        selector.close()
+
+    if err is not None:
+        raise err
+    raise OSError("getaddrinfo returns an empty list")
+
+
+def _connect_one(
+    address: AddrInfo,
+    timeout: Any,
+    source_address: Optional[Tuple[str, int]],
+    socket_options: Optional[Sequence[Tuple[int, int, Any]]],
+) -> socket.socket:
+    af, socktype, proto, _, sa = address
+    sock = socket.socket(af, socktype, proto)
+    try:
+        _set_socket_options(sock, socket_options)
+        if timeout is not _DEFAULT_TIMEOUT:
+            sock.settimeout(timeout)
+        if source_address:
+            sock.bind(source_address)
+        sock.connect(sa)
+        return sock
+    except OSError:
+        sock.close()
+        raise
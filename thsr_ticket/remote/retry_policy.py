@@ -0,0 +1,295 @@
+import random
+import threading
+import time
+from collections import namedtuple
+from typing import Any, Callable, Dict, Mapping, Optional, Tuple
+
+import requests
+from urllib3.exceptions import NewConnectionError, ProtocolError
+from urllib3.exceptions import TimeoutError as Urllib3TimeoutError
+from urllib3.util.retry import Retry
+
+
+TIMEOUT = "timeout"
+CONNECTION_ERROR = "connection_error"
+SERVER_ERROR = "server_error"
+THROTTLED = "throttled"
+SITE_ERROR = "site_error"
+OTHER = "other"
+FAILURE_CLASSES = (TIMEOUT, CONNECTION_ERROR, SERVER_ERROR, THROTTLED, SITE_ERROR, OTHER)
+
+# Failures that mean the site itself is struggling; only these trip the breaker.
+# Refused and reset connections count too: they are what an overloaded site
+# does before it manages to answer 503.
+OVERLOAD_CLASSES = frozenset({TIMEOUT, CONNECTION_ERROR, SERVER_ERROR, THROTTLED})
+
+# Decorrelated jitter bounds in seconds: every delay is drawn between base and
+# three times the previous delay, then capped.
+Backoff = namedtuple("Backoff", ["base", "cap"])
+
+# Between whole booking attempts. A site error (wrong captcha, no seats yet)
+# is worth retrying at once; 429 asks us to back off the longest.
+ATTEMPT_SCHEDULES: Dict[str, Backoff] = {
+    TIMEOUT: Backoff(1.0, 20.0),
+    CONNECTION_ERROR: Backoff(2.0, 60.0),
+    SERVER_ERROR: Backoff(2.0, 60.0),
+    THROTTLED: Backoff(5.0, 120.0),
+    SITE_ERROR: Backoff(0.5, 5.0),
+    OTHER: Backoff(1.0, 30.0),
+}
+
+# Between retries of one GET inside HTTPRequest, so they stay well within
+# the request timeout.
+REQUEST_SCHEDULES: Dict[str, Backoff] = {
+    TIMEOUT: Backoff(0.2, 2.0),
+    CONNECTION_ERROR: Backoff(0.3, 3.0),
+    SERVER_ERROR: Backoff(0.3, 3.0),
+    THROTTLED: Backoff(1.0, 5.0),
+    SITE_ERROR: Backoff(0.2, 2.0),
+    OTHER: Backoff(0.2, 2.0),
+}
+
+# Longest Retry-After honoured inside a single request.
+REQUEST_RETRY_AFTER_MAX = 10.0
+
+# Responses a GET is retried on, by every transport.
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+
+def decorrelated_jitter(
+    backoff: Backoff, previous: float = 0.0, rng: Any = random
+) -> float:
+    # previous is the last delay of this schedule; 0 starts it over.
+    upper = max(backoff.base, (previous or backoff.base) * 3)
+    return min(backoff.cap, rng.uniform(backoff.base, upper))
+
+
+def status_class(status: Optional[int]) -> Optional[str]:
+    if status == 429:
+        return THROTTLED
+    if status is not None and status >= 500:
+        return SERVER_ERROR
+    return None
+
+
+def classify_failure(error: Optional[BaseException]) -> str:
+    # HTTPRequest re-raises requests errors as TimeoutError/ConnectionError,
+    # so the original exception and its response are found down the chain.
+    chain = list(_exception_chain(error))
+    for e in chain:
+        failure_class = getattr(e, "failure_class", None)
+        if failure_class in FAILURE_CLASSES:
+            return failure_class
+        if _is_timeout(e):
+            return TIMEOUT
+        by_status = status_class(_response_status(getattr(e, "response", None)))
+        if by_status is not None:
+            return by_status
+    # No response at all: refused, reset or dropped. HTTPRequest's own
+    # ConnectionError wraps every requests error, so a plain OSError only
+    # counts at the root of the chain.
+    if any(isinstance(e, CONNECTION_FAILURES) for e in chain) or (
+        chain
+        and isinstance(chain[-1], OSError)
+        and not isinstance(chain[-1], requests.exceptions.RequestException)
+    ):
+        return CONNECTION_ERROR
+    return OTHER
+
+
+CONNECTION_FAILURES = (requests.exceptions.ConnectionError, NewConnectionError, ProtocolError)
+
+
+def _is_timeout(e: BaseException) -> bool:
+    # urllib3 files a refused connection (NewConnectionError) under
+    # ConnectTimeoutError, but nothing timed out.
+    if isinstance(e, NewConnectionError):
+        return False
+    return isinstance(e, (TimeoutError, requests.exceptions.Timeout, Urllib3TimeoutError))
+
+
+def retry_after(error: Optional[BaseException]) -> Optional[float]:
+    for e in _exception_chain(error):
+        seconds = response_retry_after(getattr(e, "response", None))
+        if seconds is not None:
+            return seconds
+    return None
+
+
+def response_retry_after(response: Any) -> Optional[float]:
+    headers = getattr(response, "headers", None)
+    value = headers.get("Retry-After") if headers is not None else None
+    if not value:
+        return None
+    try:
+        return Retry().parse_retry_after(value)
+    except Exception:
+        return None
+
+
+def _response_status(response: Any) -> Optional[int]:
+    status = getattr(response, "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def _exception_chain(error: Optional[BaseException]):
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        yield error
+        error = error.__cause__ or error.__context__
+
+
+class JitteredRetry(Retry):
+    # urllib3 Retry that sleeps with decorrelated jitter on the schedule of
+    # the last failure instead of a fixed exponential backoff. Retry-After
+    # is still honoured first, as urllib3 does.
+
+    def __init__(
+        self,
+        *args: Any,
+        schedules: Optional[Mapping[str, Backoff]] = None,
+        previous_backoff: float = 0.0,
+        rng: Any = random,
+        **kwargs: Any,
+    ) -> None:
+        super().__init__(*args, **kwargs)
+        self.schedules = schedules or REQUEST_SCHEDULES
+        self.previous_backoff = previous_backoff
+        self.rng = rng
+
+    def new(self, **kw: Any) -> "JitteredRetry":
+        kw.setdefault("schedules", self.schedules)
+        kw.setdefault("previous_backoff", self.previous_backoff)
+        kw.setdefault("rng", self.rng)
+        return super().new(**kw)  # type: ignore[return-value]
+
+    def failure_class(self) -> str:
+        if not self.history:
+            return OTHER
+        last = self.history[-1]
+        if isinstance(last.error, (NewConnectionError, ProtocolError)):
+            return CONNECTION_ERROR
+        if isinstance(last.error, Urllib3TimeoutError):
+            return TIMEOUT
+        return status_class(last.status) or OTHER
+
+    def get_backoff_time(self) -> float:
+        if not self.history:
+            return 0.0
+        # sleep() runs on the Retry that increment() just returned, and the
+        # next increment() copies it, so the previous delay carries forward.
+        self.previous_backoff = decorrelated_jitter(
+            self.schedules[self.failure_class()], self.previous_backoff, self.rng
+        )
+        return self.previous_backoff
+
+
+class CircuitBreaker:
+    # Pauses every attempt once `threshold` overload failures arrive in a
+    # row. When the pause ends one probe attempt goes through: success closes
+    # the breaker, another overload reopens it for twice as long (up to
+    # max_cooldown). Shared by every booking, so it is thread-safe.
+
+    # How often the other bookings look again while the probe is running.
+    PROBE_POLL = 1.0
+
+    def __init__(
+        self,
+        threshold: int = 5,
+        cooldown: float = 30.0,
+        max_cooldown: float = 300.0,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.threshold = threshold
+        self.base_cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.clock = clock
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_until: Optional[float] = None
+        self.probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self.opened_until is None:
+                return "closed"
+            if self.probing or self.clock() >= self.opened_until:
+                return "half_open"
+            return "open"
+
+    def wait_time(self) -> float:
+        # Seconds to wait before the next attempt may start; 0 means go now.
+        with self._lock:
+            if self.opened_until is None:
+                return 0.0
+            remaining = self.opened_until - self.clock()
+            if remaining > 0:
+                return remaining
+            if self.probing:
+                return self.PROBE_POLL
+            self.probing = True
+            return 0.0
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self.opened_until = None
+            self.probing = False
+            self.cooldown = self.base_cooldown
+
+    def record_failure(self, failure_class: str) -> None:
+        if failure_class not in OVERLOAD_CLASSES:
+            # The site answered properly, so it is not overloaded.
+            self.record_success()
+            return
+        with self._lock:
+            self.failures += 1
+            if self.probing:
+                self.probing = False
+                self.cooldown = min(self.max_cooldown, self.cooldown * 2)
+                self.opened_until = self.clock() + self.cooldown
+            elif self.opened_until is None and self.failures >= self.threshold:
+                self.opened_until = self.clock() + self.cooldown
+
+
+class RetryPolicy:
+    # Decides how long to wait before the next booking attempt from why the
+    # last one failed. One schedule per failure class, so a run of timeouts
+    # does not slow down the retry after a wrong captcha.
+
+    def __init__(
+        self,
+        schedules: Optional[Mapping[str, Backoff]] = None,
+        breaker: Optional[CircuitBreaker] = None,
+        rng: Optional[random.Random] = None,
+    ) -> None:
+        self.schedules = {**ATTEMPT_SCHEDULES, **(schedules or {})}
+        self.breaker = breaker or CircuitBreaker()
+        self.rng = rng or random.Random()
+        self.previous: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def pause(self) -> float:
+        # Seconds the circuit breaker still holds every attempt back.
+        return self.breaker.wait_time()
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.previous.clear()
+        self.breaker.record_success()
+
+    def next_delay(self, error: Optional[BaseException]) -> Tuple[str, float]:
+        # Returns (failure_class, seconds to sleep before the next attempt).
+        failure_class = classify_failure(error)
+        self.breaker.record_failure(failure_class)
+        with self._lock:
+            delay = decorrelated_jitter(
+                self.schedules[failure_class],
+                self.previous.get(failure_class, 0.0),
+                self.rng,
+            )
+            self.previous[failure_class] = delay
+        return failure_class, max(delay, retry_after(error) or 0.0)
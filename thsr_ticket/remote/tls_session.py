@@ -0,0 +1,308 @@
+import socket
+import ssl
+import sys
+import threading
+import time
+from collections import deque, namedtuple
+from typing import Any, Deque, Dict, Iterable, Optional, Tuple
+from urllib.parse import urlsplit
+
+import truststore
+from urllib3.connection import HTTPSConnection
+from urllib3.connectionpool import HTTPSConnectionPool
+from urllib3.exceptions import ConnectTimeoutError, NameResolutionError, NewConnectionError
+from urllib3.util.wait import wait_for_read
+
+from configs.web.http_config import HTTPConfig
+from remote.request_timing import ConnectTiming, create_connection
+from remote.resolver import dns_cache
+
+
+Handshake = namedtuple("Handshake", ["host", "port", "resumed", "seconds"])
+
+_context_lock = threading.Lock()
+_shared_context: Optional[ssl.SSLContext] = None
+_shared_http2_context: Optional[ssl.SSLContext] = None
+
+
+def shared_ssl_context(http2: bool = False) -> ssl.SSLContext:
+    # Loading the system trust store is slow, and TLS sessions can only be
+    # resumed by the context that created them, so every client shares one.
+    # The HTTP/2 transport advertises h2 over ALPN, so it gets its own
+    # context; urllib3 connections must never negotiate h2.
+    global _shared_context, _shared_http2_context
+    with _context_lock:
+        if http2:
+            if _shared_http2_context is None:
+                _shared_http2_context = truststore.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+            return _shared_http2_context
+        if _shared_context is None:
+            _shared_context = truststore.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+        return _shared_context
+
+
+class TLSSessionCache:
+    # Sessions are kept for `hosts` only. hosts=None follows the booking host
+    # in HTTPConfig, so a set_base_url() later on moves resumption along.
+
+    def __init__(self, hosts: Optional[Iterable[str]] = None, history: int = 100) -> None:
+        self.hosts = None if hosts is None else set(hosts)
+        self.resumed = 0
+        self.full = 0
+        self.handshakes: Deque[Handshake] = deque(maxlen=history)
+        # A session only resumes with the context that created it, so the
+        # context is part of the key.
+        self._sessions: Dict[Tuple[str, int, Any], ssl.SSLSession] = {}
+        self._lock = threading.Lock()
+
+    def resumable(self, host: str) -> bool:
+        if self.hosts is None:
+            return host == urlsplit(HTTPConfig.BASE_URL).hostname
+        return host in self.hosts
+
+    def get(self, host: str, port: int, context: Any = None) -> Optional[ssl.SSLSession]:
+        with self._lock:
+            session = self._sessions.get((host, port, context))
+            if session is not None and session.time + session.timeout <= time.time():
+                del self._sessions[(host, port, context)]
+                return None
+            return session
+
+    def store(
+        self, host: str, port: int, session: Optional[ssl.SSLSession], context: Any = None
+    ) -> None:
+        if session is None or not self.resumable(host):
+            return
+        with self._lock:
+            self._sessions[(host, port, context)] = session
+
+    def discard(self, host: str, port: int, context: Any = None) -> None:
+        with self._lock:
+            self._sessions.pop((host, port, context), None)
+
+    def record(self, host: str, port: int, resumed: bool, seconds: float) -> None:
+        with self._lock:
+            if resumed:
+                self.resumed += 1
+            else:
+                self.full += 1
+            self.handshakes.append(Handshake(host, port, resumed, seconds))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "resumed": self.resumed,
+                "full": self.full,
+                "cached_sessions": len(self._sessions),
+                "last": self.handshakes[-1] if self.handshakes else None,
+            }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._sessions.clear()
+            self.handshakes.clear()
+            self.resumed = 0
+            self.full = 0
+
+
+_session_cache = TLSSessionCache()
+
+
+def tls_session_cache() -> TLSSessionCache:
+    return _session_cache
+
+
+class _SessionOfferingContext:
+    # Forwards to the real context, adding the cached session when urllib3
+    # wraps the socket; urllib3 itself has no way to pass one through.
+
+    def __init__(self, context: ssl.SSLContext, session: ssl.SSLSession) -> None:
+        object.__setattr__(self, "_context", context)
+        object.__setattr__(self, "_session", session)
+
+    def wrap_socket(self, sock: Any, *args: Any, **kwargs: Any) -> ssl.SSLSocket:
+        kwargs.setdefault("session", self._session)
+        return self._context.wrap_socket(sock, *args, **kwargs)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._context, name)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        setattr(self._context, name, value)
+
+
+class ResumingHTTPSConnection(HTTPSConnection):
+    session_cache = _session_cache
+    resolver = dns_cache()
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.connect_timing: Optional[ConnectTiming] = None
+        self.request_count = 0
+        # Set when the pool opened this connection ahead of any request.
+        self.warmed = False
+        self.last_active = time.monotonic()
+        self._dns_seconds = 0.0
+        self._connect_seconds = 0.0
+
+    def connect(self) -> None:
+        cache = self.session_cache
+        context = self.ssl_context
+        session = cache.get(self.host, self.port, context) if cache.resumable(self.host) else None
+        if session is None:
+            self._handshake(None)
+            return
+
+        try:
+            self._handshake(session)
+        except ssl.SSLError:
+            # Some trust stores cannot verify a resumed session because the
+            # server sends no certificate chain; retry with a full handshake.
+            cache.discard(self.host, self.port, context)
+            self.close()
+            self._handshake(None)
+
+    def request(self, *args: Any, **kwargs: Any) -> None:
+        self.request_count += 1
+        super().request(*args, **kwargs)
+
+    def getresponse(self, *args: Any, **kwargs: Any) -> Any:
+        response = super().getresponse(*args, **kwargs)
+        self.last_active = time.monotonic()
+        self._store_session()
+        return response
+
+    @property
+    def reused(self) -> bool:
+        # Whether the current request skipped connection setup.
+        return self.request_count > 1 or self.warmed
+
+    def idle_seconds(self) -> float:
+        return time.monotonic() - self.last_active
+
+    @property
+    def is_connected(self) -> bool:
+        # urllib3 takes any readable idle socket for a closed one, but TLS 1.3
+        # session tickets sent after the handshake make a connection that has
+        # not been used yet readable too. Read them before deciding.
+        if self.sock is None:
+            return False
+        if not wait_for_read(self.sock, timeout=0.0):
+            return True
+        return self._settle()
+
+    def _settle(self) -> bool:
+        # Returns False, closing the connection, if the server closed it or
+        # sent bytes ahead of any request.
+        sock = self.sock
+        timeout = sock.gettimeout()
+        sock.settimeout(0)
+        try:
+            data = sock.recv(1)
+        except (ssl.SSLWantReadError, BlockingIOError):
+            data = None
+        except OSError:
+            data = b""
+        finally:
+            sock.settimeout(timeout)
+        if data is not None:
+            self.close()
+            return False
+        self._store_session()
+        return True
+
+    def close(self) -> None:
+        # Responses that close the connection do so inside getresponse().
+        self._store_session()
+        super().close()
+
+    def _handshake(self, session: Optional[ssl.SSLSession]) -> None:
+        context = self.ssl_context
+        if session is not None and context is not None:
+            self.ssl_context = _SessionOfferingContext(context, session)  # type: ignore[assignment]
+
+        start = time.perf_counter()
+        try:
+            super().connect()
+        finally:
+            self.ssl_context = context
+        elapsed = time.perf_counter() - start
+
+        resumed = bool(getattr(self.sock, "session_reused", False))
+        self.session_cache.record(self.host, self.port, resumed, elapsed)
+        self.connect_timing = ConnectTiming(
+            self._dns_seconds,
+            self._connect_seconds,
+            max(0.0, elapsed - self._dns_seconds - self._connect_seconds),
+        )
+        self.request_count = 0
+        self.warmed = False
+        self.last_active = time.monotonic()
+        self._store_session()
+
+    def _new_conn(self) -> socket.socket:
+        # urllib3's _new_conn, with name resolution and TCP connect timed.
+        try:
+            sock, self._dns_seconds, self._connect_seconds = create_connection(
+                (self._dns_host, self.port),
+                self.timeout,
+                source_address=self.source_address,
+                socket_options=self.socket_options,
+                resolver=self.resolver,
+            )
+        except socket.gaierror as e:
+            raise NameResolutionError(self.host, self, e) from e
+        except socket.timeout as e:
+            raise ConnectTimeoutError(
+                self,
+                f"Connection to {self.host} timed out. (connect timeout={self.timeout})",
+            ) from e
+        except OSError as e:
+            raise NewConnectionError(
+                self, f"Failed to establish a new connection: {e}"
+            ) from e
+
+        sys.audit("http.client.connect", self, self.host, self.port)
+        return sock
+
+    def _store_session(self) -> None:
+        sock = self.sock
+        session = getattr(sock, "session", None)
+        if session is None:
+            return
+        # TLS 1.3 tickets arrive after the handshake, with the first response;
+        # a session captured before that cannot be resumed.
+        if not session.has_ticket and sock.version() == "TLSv1.3":
+            return
+        self.session_cache.store(self.host, self.port, session, self.ssl_context)
+
+
+class ResumingHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = ResumingHTTPSConnection
+
+    def warm(self, count: int, max_idle: Optional[float] = None) -> Tuple[int, int]:
+        # Leaves `count` open connections in the pool. Ones the server closed
+        # are replaced, as are ones idle for more than max_idle seconds, which
+        # the server may be about to close. Returns (opened, kept).
+        if self.pool is None or count > self.pool.maxsize:
+            size = self.pool.maxsize if self.pool is not None else 0
+            raise ValueError(f"Cannot keep {count} connections in a pool of {size}")
+        conns = []
+        opened = kept = 0
+        try:
+            for _ in range(count):
+                # _get_conn() already closes connections the server dropped.
+                conn = self._get_conn()
+                conns.append(conn)
+                if conn.is_connected and (max_idle is None or conn.idle_seconds() <= max_idle):
+                    kept += 1
+                    continue
+                conn.close()
+                conn.connect()
+                conn.warmed = True
+                opened += 1
+        finally:
+            # Back in LIFO order, so the next request takes the newest one.
+            for conn in conns:
+                self._put_conn(conn)
+        return opened, kept
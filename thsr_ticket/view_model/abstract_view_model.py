@@ -1,15 +1,15 @@
 from typing import List, Any
 from bs4 import BeautifulSoup
 
-from html_parser import parse_html
+from html_parser import HTMLSource, parse_html
 
 
 class AbstractViewModel:
     def __init__(self) -> None:
         pass
 
-    def parse(self, html: bytes) -> List[Any]:
+    def parse(self, html: HTMLSource) -> List[Any]:
         raise NotImplementedError
 
-    def _parser(self, html: bytes) -> BeautifulSoup:
+    def _parser(self, html: HTMLSource) -> BeautifulSoup:
         return parse_html(html)
@@ -1,23 +1,79 @@
-from typing import List, Optional
+import codecs
+from html.parser import HTMLParser
+from typing import Dict, Iterable, List, Optional, Tuple
+from bs4 import BeautifulSoup
 from bs4.element import Tag
 
+from html_parser import HTMLSource, ParsedPage, iter_decoded
 from view_model.abstract_view_model import AbstractViewModel
 from configs.web.parse_avail_train import ParseAvailTrain
 from configs.web.param_schema import Train
 
+OUTBOUND_GROUP = "TrainQueryDataViewPanel:TrainGroup"
+RETURN_GROUP = "TrainQueryDataViewPanel2:TrainGroup"
+
+# What the streaming scan can raise on input it cannot handle: html.parser
+# asserts on malformed declarations. Anything else is a bug in the scanner
+# and is not hidden.
+STREAM_ERRORS = (AssertionError, UnicodeError)
+
 
 class AvailTrains(AbstractViewModel):
-    def __init__(self) -> None:
+    def __init__(self, streaming: bool = True) -> None:
         super().__init__()
         self.cond = ParseAvailTrain()
+        self.streaming = streaming
 
     def parse(
         self,
-        html: bytes,
-        group_name: str = "TrainQueryDataViewPanel:TrainGroup",
+        html: HTMLSource,
+        group_name: str = OUTBOUND_GROUP,
     ) -> List[Train]:
+        return self.parse_groups(html, (group_name,))[group_name]
+
+    def parse_groups(
+        self,
+        html: HTMLSource,
+        group_names: Iterable[str] = (OUTBOUND_GROUP, RETURN_GROUP),
+    ) -> Dict[str, List[Train]]:
+        group_names = tuple(group_names)
+        content = self._raw_content(html)
+        if self.streaming and content is not None:
+            encoding = html.encoding if isinstance(html, ParsedPage) else None
+            # The tree walk below is the reference implementation.
+            if _known_charset(encoding):
+                try:
+                    return self._parse_stream(content, group_names, encoding)
+                except STREAM_ERRORS as e:
+                    print(
+                        f"W: Streaming train scan failed ({type(e).__name__}: {e}); "
+                        "parsing the page instead"
+                    )
+
         page = self._parser(html)
+        return {name: self._parse_tree(page, name) for name in group_names}
+
+    def _raw_content(self, html: HTMLSource) -> Optional[bytes | str]:
+        # Searching a tree that already exists is cheaper than re-tokenizing.
+        if isinstance(html, BeautifulSoup):
+            return None
+        if isinstance(html, ParsedPage):
+            return None if html.is_parsed else html.content
+        return html
+
+    def _parse_stream(
+        self,
+        content: bytes | str,
+        group_names: Tuple[str, ...],
+        encoding: Optional[str] = None,
+    ) -> Dict[str, List[Train]]:
+        scanner = _TrainRadioScanner(self, group_names)
+        for chunk in iter_decoded(content, encoding=encoding):
+            scanner.feed(chunk)
+        scanner.close()
+        return scanner.results()
 
+    def _parse_tree(self, page: BeautifulSoup, group_name: str) -> List[Train]:
         radios = page.find_all(
             "input",
             attrs={
@@ -35,8 +91,22 @@ class AvailTrains(AbstractViewModel):
         return trains
 
     def _parse_train_input(self, r: Tag) -> Optional[Train]:
-        attrs = r.attrs
+        discount_tags: List[str] = []
+        if self._is_valid_train_input(r.attrs):
+            parent_label = r.find_parent("label")
+            if parent_label:
+                discount_tags = self._parse_discount_tags(parent_label)
+        return self._build_train(r.attrs, discount_tags)
 
+    def _is_valid_train_input(self, attrs: dict) -> bool:
+        return bool(
+            self._get_attr(attrs, "value")
+            and self._get_attr(attrs, "QueryCode")
+            and self._get_attr(attrs, "QueryDeparture")
+            and self._get_attr(attrs, "QueryArrival")
+        )
+
+    def _build_train(self, attrs: dict, discount_tags: List[str]) -> Optional[Train]:
         form_value = self._get_attr(attrs, "value")
         if not form_value:
             return None
@@ -54,12 +124,7 @@ class AvailTrains(AbstractViewModel):
         except Exception:
             return None
 
-        discount_str = ""
-        discount_tags: List[str] = []
-        parent_label = r.find_parent("label")
-        if parent_label:
-            discount_tags = self._parse_discount_tags(parent_label)
-            discount_str = ", ".join(discount_tags)
+        discount_str = ", ".join(discount_tags)
         has_early_bird = any(
             "early" in t.lower() or "\u65e9\u9ce5" in t for t in discount_tags
         )
@@ -112,3 +177,198 @@ class AvailTrains(AbstractViewModel):
                 discounts.append(txt)
 
         return discounts
+
+
+def _known_charset(encoding: Optional[str]) -> bool:
+    if not encoding:
+        return True
+    try:
+        codecs.lookup(encoding)
+    except LookupError:
+        print(f"W: Unknown page charset '{encoding}'; parsing the page instead")
+        return False
+    return True
+
+
+# Elements html.parser closes immediately, mirroring BeautifulSoup's builder.
+VOID_ELEMENTS = frozenset({
+    "area", "base", "basefont", "bgsound", "br", "col", "command", "embed",
+    "frame", "hr", "image", "img", "input", "isindex", "keygen", "link",
+    "menuitem", "meta", "nextid", "param", "source", "spacer", "track", "wbr",
+})
+
+
+# Elements whose text BeautifulSoup's get_text() leaves out.
+NON_TEXT_ELEMENTS = frozenset({"script", "style", "template", "rt", "rp"})
+
+
+class _TextCapture:
+    def __init__(self) -> None:
+        self.parts: List[str] = []
+
+    def text(self) -> str:
+        return " ".join(self.parts)
+
+
+class _LabelScope:
+    def __init__(self) -> None:
+        self.pending: List[Tuple[str, int, dict]] = []
+        self.discounts: List[_TextCapture] = []
+        self.early_bird: Optional[_TextCapture] = None
+        self.student: Optional[_TextCapture] = None
+
+    def discount_tags(self) -> List[str]:
+        tags = [txt for txt in (c.text() for c in self.discounts) if txt]
+        if tags:
+            return tags
+        for capture in (self.early_bird, self.student):
+            txt = capture.text() if capture else ""
+            if txt:
+                tags.append(txt)
+        return tags
+
+
+class _TrainRadioScanner(HTMLParser):
+    # Emits the same records as AvailTrains._parse_tree while tokenizing,
+    # keeping only the open-element stack instead of a document tree.
+
+    def __init__(self, view_model: AvailTrains, group_names: Tuple[str, ...]) -> None:
+        super().__init__(convert_charrefs=True)
+        self.view_model = view_model
+        self.trains: Dict[str, List[Optional[Train]]] = {name: [] for name in group_names}
+        self.stack: List[Tuple[str, Optional[_LabelScope], Optional[_TextCapture], bool]] = []
+        self.labels: List[_LabelScope] = []
+        self.captures: List[_TextCapture] = []
+        self.discount_depth = 0
+        self.non_text_depth = 0
+        self.text_parts: List[str] = []
+
+        cond = view_model.cond
+        self.early_bird_match = self._tag_match(cond.early_bird_discount)
+        self.student_match = self._tag_match(cond.college_student_discount)
+
+    def results(self) -> Dict[str, List[Train]]:
+        return {
+            name: [t for t in trains if t is not None]
+            for name, trains in self.trains.items()
+        }
+
+    def handle_starttag(self, tag: str, attrs: List[Tuple[str, Optional[str]]]) -> None:
+        self._flush_text()
+        attr_map = {k: ("" if v is None else v) for k, v in attrs}
+
+        if tag == "input":
+            self._handle_input(attr_map)
+        if tag in VOID_ELEMENTS:
+            return
+
+        classes = attr_map.get("class", "").split()
+        label = _LabelScope() if tag == "label" else None
+        capture = self._start_capture(tag, classes)
+        is_discount = "discount" in classes
+
+        if label is not None:
+            self.labels.append(label)
+        if capture is not None:
+            self.captures.append(capture)
+        if is_discount:
+            self.discount_depth += 1
+        if tag in NON_TEXT_ELEMENTS:
+            self.non_text_depth += 1
+        self.stack.append((tag, label, capture, is_discount))
+
+    def handle_endtag(self, tag: str) -> None:
+        self._flush_text()
+        if tag in VOID_ELEMENTS:
+            return
+        for index in range(len(self.stack) - 1, -1, -1):
+            if self.stack[index][0] == tag:
+                break
+        else:
+            return
+        while len(self.stack) > index:
+            self._pop()
+
+    def handle_data(self, data: str) -> None:
+        if self.captures and not self.non_text_depth:
+            self.text_parts.append(data)
+
+    def handle_comment(self, data: str) -> None:
+        self._flush_text()
+
+    def handle_decl(self, decl: str) -> None:
+        self._flush_text()
+
+    def handle_pi(self, data: str) -> None:
+        self._flush_text()
+
+    def close(self) -> None:
+        super().close()
+        self._flush_text()
+        while self.stack:
+            self._pop()
+
+    def _handle_input(self, attrs: dict) -> None:
+        group_name = attrs.get("name")
+        if group_name not in self.trains or attrs.get("type") != "radio":
+            return
+
+        slots = self.trains[group_name]
+        if not self.labels or not self.view_model._is_valid_train_input(attrs):
+            slots.append(self.view_model._build_train(attrs, []))
+            return
+
+        slots.append(None)
+        self.labels[-1].pending.append((group_name, len(slots) - 1, attrs))
+
+    def _start_capture(self, tag: str, classes: List[str]) -> Optional[_TextCapture]:
+        if not self.labels:
+            return None
+
+        capture = _TextCapture()
+        used = False
+        for label in self.labels:
+            if self.discount_depth and tag == "p" and "type" in classes:
+                label.discounts.append(capture)
+                used = True
+            if label.early_bird is None and self._matches(tag, classes, self.early_bird_match):
+                label.early_bird = capture
+                used = True
+            if label.student is None and self._matches(tag, classes, self.student_match):
+                label.student = capture
+                used = True
+        return capture if used else None
+
+    def _tag_match(self, cond: dict) -> Tuple[str, str]:
+        return cond["name"], cond["attrs"]["class"]
+
+    def _matches(self, tag: str, classes: List[str], match: Tuple[str, str]) -> bool:
+        return tag == match[0] and match[1] in classes
+
+    def _flush_text(self) -> None:
+        if not self.text_parts:
+            return
+        txt = "".join(self.text_parts).strip()
+        self.text_parts = []
+        if txt:
+            for capture in self.captures:
+                capture.parts.append(txt)
+
+    def _pop(self) -> None:
+        tag, label, capture, is_discount = self.stack.pop()
+        if is_discount:
+            self.discount_depth -= 1
+        if tag in NON_TEXT_ELEMENTS:
+            self.non_text_depth -= 1
+        if capture is not None:
+            self.captures.remove(capture)
+        if label is not None:
+            self.labels.remove(label)
+            self._emit(label)
+
+    def _emit(self, label: _LabelScope) -> None:
+        discount_tags = label.discount_tags()
+        for group_name, slot, attrs in label.pending:
+            self.trains[group_name][slot] = self.view_model._build_train(
+                attrs, list(discount_tags)
+            )
@@ -1,6 +1,8 @@
-from typing import List
+from typing import Any, Dict, List, Mapping
 from collections import namedtuple
 from bs4 import BeautifulSoup
+from bs4.element import NavigableString, PageElement, Tag
+from html_parser import HTMLSource
 from view_model.abstract_view_model import AbstractViewModel
 from configs.web.parse_html_element import BOOKING_RESULT
 
@@ -22,48 +24,119 @@ Ticket = namedtuple(
     ],
 )
 
+# Ticket field -> (BOOKING_RESULT anchor, how the value is read from it).
+TICKET_FIELDS = {
+    "id": ("ticket_id", "span_text"),
+    "price": ("total_price", "own_text"),
+    "start_station": ("depart_station", "next_text"),
+    "dest_station": ("arrival_station", "next_text"),
+    "train_id": ("train_id", "own_text"),
+    "depart_time": ("depart_time", "own_text"),
+    "arrival_time": ("arrival_time", "own_text"),
+    "date": ("date", "next_text"),
+    "seat": ("seat_num", "next_text"),
+    "seat_class": ("seat_class", "next_text"),
+    "payment_deadline": ("payment_deadline", "deadline_text"),
+    "ticket_num_info": ("ticket_num", "ticket_num_text"),
+}
+DEADLINE_LABEL = "（付款期限："
+
 
 class BookingResult(AbstractViewModel):
     def __init__(self) -> None:
         super(BookingResult, self).__init__()
         self.ticket: Ticket = None
+        self.missing: List[str] = []
+        self.anchors = {
+            anchor: _AnchorSpec(BOOKING_RESULT[anchor])
+            for anchor, _ in TICKET_FIELDS.values()
+        }
 
-    def parse(self, html: bytes) -> List[Ticket]:
+    def parse(self, html: HTMLSource) -> List[Ticket]:
         page = self._parser(html)
+        anchors = self.find_anchors(page)
 
-        try:
-            booking_id = page.find(**BOOKING_RESULT["ticket_id"]).find("span").text
-            deadline = (page.find(**BOOKING_RESULT["payment_deadline"]).find_next(text="（付款期限：").find_next().text)
-            total_price = page.find(**BOOKING_RESULT["total_price"]).text
-            train_id = page.find(**BOOKING_RESULT["train_id"]).text
-            depart_time = page.find(**BOOKING_RESULT["depart_time"]).text
-            arrival_time = page.find(**BOOKING_RESULT["arrival_time"]).text
-            seat_num = page.find(**BOOKING_RESULT["seat_num"]).find_next().text
-            seat_class = page.find(**BOOKING_RESULT["seat_class"]).find_next().text
-            depart_station = (page.find(**BOOKING_RESULT["depart_station"]).find_next().text)
-            arrival_station = (page.find(**BOOKING_RESULT["arrival_station"]).find_next().text)
-            ticket_num_info = (page.find(**BOOKING_RESULT["ticket_num"]).find_next().text.strip().replace("\xa0", " "))
-            date = page.find(**BOOKING_RESULT["date"]).find_next().text
-        except AttributeError as e:
-            raise ValueError(f"BookingResult parse failed due to missing HTML element: {e}")
-
-        self.ticket = Ticket(
-            id=booking_id,
-            price=total_price,
-            start_station=depart_station,
-            dest_station=arrival_station,
-            train_id=train_id,
-            depart_time=depart_time,
-            arrival_time=arrival_time,
-            date=date,
-            seat=seat_num,
-            seat_class=seat_class,
-            payment_deadline=deadline,
-            ticket_num_info=ticket_num_info,
-        )
+        values: Dict[str, str] = {}
+        self.missing = []
+        for field in Ticket._fields:
+            anchor, reader = TICKET_FIELDS[field]
+            try:
+                values[field] = getattr(self, f"_read_{reader}")(anchors.get(anchor))
+            except AttributeError:
+                self.missing.append(field)
 
+        if self.missing:
+            raise ValueError(
+                "BookingResult parse failed due to missing HTML elements: "
+                + ", ".join(self.missing)
+            )
+
+        self.ticket = Ticket(**values)
         return [self.ticket]
 
+    def find_anchors(self, page: BeautifulSoup) -> Dict[str, PageElement]:
+        # One walk over the document finds the first match of every anchor;
+        # values are then read a few nodes away from each anchor.
+        pending = dict(self.anchors)
+        found: Dict[str, PageElement] = {}
+        for element in page.descendants:
+            for anchor, spec in list(pending.items()):
+                if spec.match(element):
+                    found[anchor] = element
+                    del pending[anchor]
+            if not pending:
+                break
+        return found
+
     def parse_ticket_num(self, page: BeautifulSoup) -> str:
         tags = page.find(**BOOKING_RESULT["ticket_num"]).find_next_siblings()
         return "|".join([t.text for t in tags])
+
+    def _read_own_text(self, anchor: Tag) -> str:
+        return anchor.text
+
+    def _read_span_text(self, anchor: Tag) -> str:
+        return anchor.find("span").text
+
+    def _read_next_text(self, anchor: PageElement) -> str:
+        return anchor.find_next().text
+
+    def _read_deadline_text(self, anchor: Tag) -> str:
+        return anchor.find_next(string=DEADLINE_LABEL).find_next().text
+
+    def _read_ticket_num_text(self, anchor: Tag) -> str:
+        return anchor.find_next().text.strip().replace("\xa0", " ")
+
+
+class _AnchorSpec:
+    # Matches a find() keyword spec (name, attrs, id, text) against one node,
+    # so every anchor can be tested during a single document walk.
+
+    def __init__(self, spec: Mapping[str, Any]) -> None:
+        self.name = spec.get("name")
+        self.attrs = dict(spec.get("attrs", {}))
+        self.attrs.update(
+            {k: v for k, v in spec.items() if k not in {"name", "attrs", "text"}}
+        )
+        self.text = spec.get("text")
+        self.string_only = self.name is None and not self.attrs
+
+    def match(self, element: PageElement) -> bool:
+        if not isinstance(element, Tag):
+            return (
+                self.string_only
+                and isinstance(element, NavigableString)
+                and element == self.text
+            )
+        if self.string_only:
+            return False
+        if self.name is not None and element.name != self.name:
+            return False
+        for key, value in self.attrs.items():
+            actual = element.get(key)
+            if key == "class" and isinstance(actual, list):
+                if value not in actual:
+                    return False
+            elif actual != value:
+                return False
+        return self.text is None or element.string == self.text
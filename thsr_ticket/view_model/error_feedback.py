@@ -1,19 +1,29 @@
-from typing import List
+from typing import List, Optional
 from collections import namedtuple
 
+from bs4 import BeautifulSoup
+
+from html_parser import HTMLSource, ParsedPage
 from view_model.abstract_view_model import AbstractViewModel
 from configs.web.parse_html_element import ERROR_FEEDBACK
 
 Error = namedtuple("Error", ["msg"])
 
+ERROR_CONTENT_CLASS = "error-content"
+# Class names that must appear verbatim in the markup for any error to exist.
+ERROR_MARKERS = (ERROR_FEEDBACK["attrs"]["class"], ERROR_CONTENT_CLASS)
+
 
 class ErrorFeedback(AbstractViewModel):
     def __init__(self) -> None:
         super(ErrorFeedback, self).__init__()
         self.errors: List[Error] = []
 
-    def parse(self, html: bytes) -> List[Error]:
+    def parse(self, html: HTMLSource) -> List[Error]:
         self.errors = []
+        if not self.may_have_errors(html):
+            return self.errors
+
         page = self._parser(html)
         items = page.find_all(**ERROR_FEEDBACK)
         for it in items:
@@ -21,9 +31,26 @@ class ErrorFeedback(AbstractViewModel):
             if msg:
                 self.errors.append(Error(msg))
 
-        for it in page.select(".error-content"):
+        for it in page.select(f".{ERROR_CONTENT_CLASS}"):
             msg = it.get_text(" ", strip=True)
             if msg:
                 self.errors.append(Error(msg))
 
         return self.errors
+
+    def may_have_errors(self, html: HTMLSource) -> bool:
+        # Most pages carry no error markup, so a substring scan of the raw
+        # response decides whether building a tree is needed at all.
+        content = self._raw_content(html)
+        if content is None:
+            return True
+        if isinstance(content, bytes):
+            return any(marker.encode("ascii") in content for marker in ERROR_MARKERS)
+        return any(marker in content for marker in ERROR_MARKERS)
+
+    def _raw_content(self, html: HTMLSource) -> Optional[bytes | str]:
+        if isinstance(html, BeautifulSoup):
+            return None
+        if isinstance(html, ParsedPage):
+            return html.content
+        return html